@@ -0,0 +1,523 @@
+"""
+Module for benchmarking the hot paths of the simulation.
+
+This module times the functions that dominate a run (building the community, one tick of the movement and infection
+loop, social distancing, graph queries and the statistics analyses) over a ladder of population sizes, and records
+the timings and peak memory of every run in a JSON history file so that two runs can be compared for regressions.
+
+Usage:
+    python benchmark.py run [--sizes 75 1000] [--cases tick] [--label "before refactor"]
+    python benchmark.py compare [BASE] [HEAD] [--threshold 0.1]
+    python benchmark.py importtime [--budget-ms 400]
+    python benchmark.py list
+
+Functions:
+    benchmark: Register a benchmark case under a name.
+    measure_import_time: Measure the import time of the core modules with python -X importtime.
+    time_case: Time one benchmark case at one population size and measure its peak memory.
+    run_suite: Run every selected benchmark case over the population ladder.
+    load_history: Read all previous runs from the history file.
+    save_run: Append a run to the history file.
+    compare_runs: Compare two runs and flag the cases that regressed.
+    main: Command line entry point.
+
+Constants:
+    POPULATION_SIZES: Default ladder of population sizes.
+    HISTORY_FILE: Default file the runs are recorded in.
+    MAX_PAIRS: Cases that touch every pair of people are skipped above this many pairs.
+    CORE_MODULES: Modules the interactive simulation, a headless run or a worker process imports.
+    HEAVY_MODULES: Packages the core modules must not import at import time.
+    IMPORT_BUDGET_MS: Default budget for importing all of CORE_MODULES.
+"""
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+import compartments
+import engine
+import graph_model
+import kernels
+import logic
+import mobility
+import policies
+import preventions
+import sharded
+import statistics
+import tracing
+
+POPULATION_SIZES = (75, 1000, 10000, 100000)
+HISTORY_FILE = 'benchmark_history.json'
+MAX_PAIRS = 5_000_000
+CORE_MODULES = ('graph_model', 'logic', 'preventions', 'statistics', 'getting_data', 'engine', 'kernels', 'mobility',
+                'policies', 'interventions', 'tracing', 'traits', 'compartments', 'sharded', 'instrumentation',
+                'cache', 'ensemble', 'calibration', 'export', 'service')
+HEAVY_MODULES = ('python_ta', 'plotly', 'pygame', 'pandas')
+IMPORT_BUDGET_MS = 400
+
+# name -> (factory, quadratic, sized, self_timed); a factory takes a population size and returns the callable to time
+_CASES: dict[str, tuple[Callable[[int], Callable[[], Any]], bool, bool, bool]] = {}
+
+
+def benchmark(name: str, quadratic: bool = False, sized: bool = True, self_timed: bool = False) -> Callable:
+    """
+    Register a benchmark case.
+    The decorated function receives a population size, does any setup that should not be timed, and returns a
+    zero argument callable that performs the operation once.
+    :param name: Name of the case in the history file
+    :param quadratic: True if the case touches every pair of people and must respect MAX_PAIRS
+    :param sized: False if the case does not depend on the population size, it is then run once with size 0
+    :param self_timed: True if the callable returns the seconds it measured itself, for cases whose wall time
+                       includes work that must not be timed, like starting an interpreter
+    :return: decorator
+    """
+    def decorator(factory: Callable[[int], Callable[[], Any]]) -> Callable[[int], Callable[[], Any]]:
+        _CASES[name] = (factory, quadratic, sized, self_timed)
+        return factory
+
+    return decorator
+
+
+def _synthetic_series(length: int) -> tuple[list[int], list[int]]:
+    """
+    Build a smooth infected and recovered series of the given length for the statistics cases.
+    """
+    t = np.linspace(0, 1, max(length, 2))
+    infected = (length * np.exp(-((t - 0.3) / 0.1) ** 2)).astype(int)
+    recovered = (length * t).astype(int)
+    return infected.tolist(), recovered.tolist()
+
+
+@benchmark('logic.community', quadratic=True)
+def _community(num_persons: int) -> Callable[[], Any]:
+    return lambda: logic.community(num_persons)
+
+
+@benchmark('tick', quadratic=True)
+def _tick(num_persons: int) -> Callable[[], Any]:
+    import pygame
+
+    g = logic.community(num_persons)
+    screen = pygame.Surface((800, 600))
+
+    def tick() -> None:
+        for person in g.nodes.values():
+            person.move(800, 600)
+            person.draw(screen)
+        for person1, person2 in g.edges:
+            logic.draw_edge_and_infect(person1, person2, (10, 100), screen)
+
+    return tick
+
+
+@benchmark('preventions.social_distance', quadratic=True)
+def _social_distance(num_persons: int) -> Callable[[], Any]:
+    g = logic.community(num_persons)
+    return lambda: preventions.social_distance(g, 25, 800, 600)
+
+
+@benchmark('graph_model.Graph.neighbors', quadratic=True)
+def _neighbors(num_persons: int) -> Callable[[], Any]:
+    g = logic.community(num_persons)
+    person = g.nodes[0]
+    return lambda: g.neighbors(person)
+
+
+@benchmark('graph_model.Graph.remove_node', quadratic=True)
+def _remove_node(num_persons: int) -> Callable[[], Any]:
+    g = logic.community(num_persons)
+    remaining = list(g.nodes)
+    return lambda: g.remove_node(remaining.pop()) if remaining else None
+
+
+@benchmark('graph_model.Graph.add_node')
+def _add_node(num_persons: int) -> Callable[[], Any]:
+    def build() -> graph_model.Graph:
+        g = graph_model.Graph()
+        for num in range(num_persons):
+            g.add_node(num, None)
+        return g
+
+    return build
+
+
+@benchmark('engine.step')
+def _engine_step(num_persons: int) -> Callable[[], Any]:
+    population = engine.create_population(num_persons, np.random.default_rng(0), infection_probability=0.03)
+    ticks = iter(range(10 ** 9))
+    return lambda: engine.step(population, next(ticks), 10, 0)
+
+
+def _contact_pairs_case(backend: str) -> Callable[[int], Callable[[], Any]]:
+    def factory(num_persons: int) -> Callable[[], Any]:
+        population = engine.create_population(num_persons, np.random.default_rng(0), infection_probability=0.03)
+        kernel = kernels.get_kernels(backend)
+        kernel.contact_pairs(population.x[:10], population.y[:10], 10)  # compile before timing
+        return lambda: kernel.contact_pairs(population.x, population.y, 10)
+
+    return factory
+
+
+for _backend in ('numpy', 'numba'):
+    if _backend in kernels.available_backends():
+        benchmark(f'kernels.{_backend}.contact_pairs')(_contact_pairs_case(_backend))
+
+
+def _scaled_world(num_persons: int) -> tuple[int, int]:
+    """World size that keeps the density of 1000 people in 800x600 at any population size."""
+    scale = max(1.0, (num_persons / 1000) ** 0.5)
+    return int(800 * scale), int(600 * scale)
+
+
+@benchmark('engine.simulate.20_ticks')
+def _engine_simulate(num_persons: int) -> Callable[[], Any]:
+    width, height = _scaled_world(num_persons)
+    return lambda: engine.simulate(num_persons, 10, ticks=20, width=width, height=height, infection_probability=0.03)
+
+
+@benchmark('mobility.Mobility.move.commuting')
+def _mobility_move(num_persons: int) -> Callable[[], Any]:
+    width, height = _scaled_world(num_persons)
+    population = engine.create_population(num_persons, np.random.default_rng(0), width, height, 0.03)
+    movement = mobility.Mobility(mobility.World(width, height, 'periodic'), 'commuting')
+    movement.setup(population)
+    ticks = iter(range(10 ** 9))
+    return lambda: movement.move(population, next(ticks))
+
+
+@benchmark('sharded.simulate_sharded.20_ticks')
+def _sharded_simulate(num_persons: int) -> Callable[[], Any]:
+    width, height = _scaled_world(num_persons)
+    return lambda: sharded.simulate_sharded(num_persons, 10, ticks=20, width=width, height=height,
+                                            infection_probability=0.03)
+
+
+@benchmark('policies.apply_policies')
+def _apply_policies(num_persons: int) -> Callable[[], Any]:
+    population = engine.create_population(num_persons, np.random.default_rng(0), infection_probability=0.03)
+    names = policies.policy_names()
+    return lambda: policies.apply_policies(population, names, [0.5] * len(names), np.random.default_rng(0))
+
+
+@benchmark('compartments.simulate_agents.SEIRD.20_ticks')
+def _simulate_agents(num_persons: int) -> Callable[[], Any]:
+    width, height = _scaled_world(num_persons)
+    return lambda: compartments.simulate_agents('SEIRD', num_persons, 10, ticks=20, width=width, height=height,
+                                                infection_probability=0.03, recovery_time=compartments.Duration(
+                                                    'gamma', 100, 4), mortality=0.04)
+
+
+# The ladder value is the number of parameter sets solved at once
+@benchmark('compartments.solve.SEIRD.batch')
+def _solve(batch: int) -> Callable[[], Any]:
+    transmission = np.linspace(0.01, 0.3, batch)
+    return lambda: compartments.solve('SEIRD', transmission, 100, 10 ** 6, ticks=300, mortality=0.04)
+
+
+@benchmark('tracing.ContactTracer.tick')
+def _contact_tracing(num_persons: int) -> Callable[[], Any]:
+    width, height = _scaled_world(num_persons)
+    population = engine.create_population(num_persons, np.random.default_rng(0), width, height, 0.03)
+    a, b = kernels.get_kernels('numpy').contact_pairs(population.x, population.y, 10)
+    tracer = tracing.ContactTracer(num_persons, rng=np.random.default_rng(0))
+    cases = np.arange(0, num_persons, 100)
+    ticks = iter(range(10 ** 9))
+
+    def tick() -> None:
+        current = next(ticks)
+        tracer.update(current)
+        tracer.record(current, a, b)
+        tracer.infected(current, cases)
+
+    return tick
+
+
+# The statistics cases treat the ladder value as the number of recorded ticks
+@benchmark('statistics.sir_statistics')
+def _sir_statistics(num_ticks: int) -> Callable[[], Any]:
+    infected, recovered = _synthetic_series(num_ticks)
+    return lambda: statistics.sir_statistics(infected, recovered, num_ticks)
+
+
+@benchmark('statistics.fft_statistics')
+def _fft_statistics(num_ticks: int) -> Callable[[], Any]:
+    infected, _ = _synthetic_series(num_ticks)
+    return lambda: statistics.fft_statistics(infected)
+
+
+@benchmark('statistics.calculate_infection_rate')
+def _infection_rate(num_ticks: int) -> Callable[[], Any]:
+    infected, _ = _synthetic_series(num_ticks)
+    return lambda: statistics.calculate_infection_rate(infected)
+
+
+def _import_times(modules: tuple[str, ...]) -> tuple[dict[str, float], set[str]]:
+    """
+    Import the modules with one import statement in a fresh interpreter with python -X importtime.
+    :return: the cumulative milliseconds of every module the statement imported first, so nested modules imported by
+             an earlier one are left out, and the names of every module imported, the startup ones included
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                               capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    cumulative = {}
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        if name.strip() in modules and not name.startswith('  ', 1):
+            cumulative[name.strip()] = int(cumulative_us) / 1000
+    return cumulative, imported
+
+
+def measure_import_time(modules: tuple[str, ...] = CORE_MODULES) -> dict:
+    """
+    Import every module on its own in a fresh interpreter, so modules imported by another one are timed too, then all
+    of them together. Only the imports are timed, not the startup of the interpreter.
+    :param modules: Modules to import, in order
+    :return: dict with the cumulative milliseconds of each module imported on its own, the total of importing all of
+             them at once, and the heavy packages that were imported along the way
+    """
+    alone = {}
+    imported = set()
+    for module in modules:
+        cumulative, names = _import_times((module,))
+        alone[module] = cumulative[module]
+        imported |= names
+    together, names = _import_times(modules)
+    imported |= names
+    return {
+        'modules_ms': alone,
+        'total_ms': sum(together.values()),
+        'heavy': sorted(name for name in imported if name.split('.')[0] in HEAVY_MODULES)
+    }
+
+
+@benchmark('import.core', sized=False, self_timed=True)
+def _import_core(_: int) -> Callable[[], Any]:
+    return lambda: sum(_import_times(CORE_MODULES)[0].values()) / 1000
+
+
+def time_case(factory: Callable[[int], Callable[[], Any]], size: int,
+              min_time: float = 0.2, min_repeats: int = 3, max_repeats: int = 50, self_timed: bool = False) -> dict:
+    """
+    Time one case at one size, repeating until min_time has elapsed, then measure the peak memory of one more call.
+    :param factory: The registered factory of the case
+    :param size: Population size to run the case at
+    :param self_timed: Record the seconds the callable returns instead of its wall time, see benchmark
+    :return: dict of timings in seconds, number of repeats and peak traced memory in bytes
+    """
+    func = factory(size)
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_repeats and (len(timings) < min_repeats or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        measured = func()
+        timings.append(measured if self_timed else time.perf_counter() - t0)
+
+    # Memory is measured separately so that tracing does not distort the timings
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'min_s': min(timings),
+        'median_s': float(np.median(timings)),
+        'mean_s': float(np.mean(timings)),
+        'repeats': len(timings),
+        'peak_bytes': int(peak)
+    }
+
+
+def run_suite(sizes: tuple[int, ...] = POPULATION_SIZES, patterns: Optional[list[str]] = None,
+              max_pairs: int = MAX_PAIRS, verbose: bool = True) -> dict:
+    """
+    Run every registered case whose name matches one of the glob patterns over the population ladder.
+    :param sizes: Population sizes to run
+    :param patterns: Glob patterns selecting cases, or None for all of them
+    :param max_pairs: Quadratic cases are skipped when a size has more pairs of people than this
+    :return: dict of case name -> size -> result
+    """
+    results = {}
+    for name, (factory, quadratic, sized, self_timed) in _CASES.items():
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = {}
+        for size in sizes if sized else (0,):
+            if quadratic and size * (size - 1) // 2 > max_pairs:
+                result = {'skipped': f'{size * (size - 1) // 2} pairs exceeds max_pairs={max_pairs}'}
+            else:
+                np.random.seed(0)
+                result = time_case(factory, size, self_timed=self_timed)
+            results[name][str(size)] = result
+            if verbose:
+                if 'skipped' in result:
+                    print(f'{name:<40} {size:>8}  skipped')
+                else:
+                    print(f"{name:<40} {size:>8}  {result['median_s'] * 1000:>12.3f} ms"
+                          f"  {result['peak_bytes'] / 1024:>12.1f} KiB")
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    """Return the current git commit of the working tree, if there is one."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str = HISTORY_FILE) -> list[dict]:
+    """
+    Read all previous runs from the history file.
+    :param path: History file
+    :return: list of runs, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_run(results: dict, path: str = HISTORY_FILE, label: str = '') -> dict:
+    """
+    Append a run to the history file.
+    :param results: Output of run_suite
+    :param path: History file
+    :param label: Free text describing the run
+    :return: the recorded run
+    """
+    history = load_history(path)
+    run = {
+        'id': len(history),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': label,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    history.append(run)
+    with open(path, 'w') as file:
+        json.dump(history, file, indent=1)
+    return run
+
+
+def compare_runs(base: dict, head: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    Compare the median time and peak memory of every case and size the two runs have in common.
+    :param base: Earlier run
+    :param head: Later run
+    :param threshold: Relative increase above which a case is flagged as a regression
+    :return: list of rows with the ratios head / base and whether they regressed
+    """
+    rows = []
+    for name, sizes in head['results'].items():
+        for size, result in sizes.items():
+            old = base['results'].get(name, {}).get(size)
+            if old is None or 'skipped' in old or 'skipped' in result:
+                continue
+            time_ratio = result['median_s'] / old['median_s'] if old['median_s'] else float('inf')
+            memory_ratio = result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else 1.0
+            rows.append({
+                'case': name,
+                'size': int(size),
+                'time_ratio': time_ratio,
+                'memory_ratio': memory_ratio,
+                'regressed': time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+            })
+    return rows
+
+
+def _find_run(history: list[dict], key: str) -> dict:
+    """Find a run by its id, or by a negative index counted from the newest run."""
+    index = int(key)
+    if index < 0:
+        return history[index]
+    for run in history:
+        if run['id'] == index:
+            return run
+    raise KeyError(f'No run with id {key}')
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """
+    Command line entry point, returns the process exit code.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths.')
+    parser.add_argument('--history', default=HISTORY_FILE, help='JSON file the runs are recorded in')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark suite and record it')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(POPULATION_SIZES))
+    run_parser.add_argument('--cases', nargs='+', help='glob patterns selecting the cases to run')
+    run_parser.add_argument('--max-pairs', type=int, default=MAX_PAIRS)
+    run_parser.add_argument('--label', default='')
+    run_parser.add_argument('--no-save', action='store_true', help='do not record the run')
+
+    compare_parser = commands.add_parser('compare', help='compare two recorded runs')
+    compare_parser.add_argument('base', nargs='?', default='-2', help='run id, or negative index (default -2)')
+    compare_parser.add_argument('head', nargs='?', default='-1', help='run id, or negative index (default -1)')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    import_parser = commands.add_parser('importtime', help='check the import time of the core modules')
+    import_parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+
+    commands.add_parser('list', help='list the recorded runs and the available cases')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_suite(tuple(args.sizes), args.cases, args.max_pairs)
+        if not args.no_save:
+            run = save_run(results, args.history, args.label)
+            print(f"Recorded run {run['id']} in {args.history}")
+        return 0
+
+    if args.command == 'importtime':
+        report = measure_import_time()
+        for name, milliseconds in report['modules_ms'].items():
+            print(f'{name:<20} {milliseconds:>8.1f} ms')
+        print(f"{'total':<20} {report['total_ms']:>8.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if report['heavy']:
+            print('Heavy modules imported by the core:', ', '.join(report['heavy']))
+        return 1 if report['heavy'] or report['total_ms'] > args.budget_ms else 0
+
+    history = load_history(args.history)
+    if args.command == 'list':
+        for run in history:
+            print(f"{run['id']:>4}  {run['timestamp']}  {run['commit'] or '-':>8}  {run['label']}")
+        print('Cases:', ', '.join(_CASES))
+        return 0
+
+    if len(history) < 2:
+        print('Need at least two recorded runs to compare.')
+        return 1
+    base, head = _find_run(history, args.base), _find_run(history, args.head)
+    rows = compare_runs(base, head, args.threshold)
+    print(f"Comparing run {base['id']} -> run {head['id']} (threshold {args.threshold:.0%})")
+    for row in rows:
+        flag = 'REGRESSION' if row['regressed'] else ''
+        print(f"{row['case']:<40} {row['size']:>8}  time x{row['time_ratio']:.2f}"
+              f"  memory x{row['memory_ratio']:.2f}  {flag}")
+    return 1 if any(row['regressed'] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Module for caching simulation results on disk, so an identical scenario is only simulated once.
+
+A scenario is the dict of arguments of the simulation function. Its key is the SHA-256 hash of the canonical JSON of
+the arguments together with the hash of the source of the simulation modules and of the data file, so changing the
+code or the data never returns a stale result. The defaults of the function named by the 'function' of a scenario are
+filled in first, so a run written with its defaults and with the same values given explicitly share an entry. Each
+entry is one .npz file named after its key, holding the count series and the summary statistics of the run.
+
+Several processes can share a cache directory: entries are written to a temporary file and renamed into place, which
+readers see either completely or not at all, a hit refreshes the modification time of the entry, and the cache is
+trimmed to its size limit by deleting the least recently used entries under a lock file, along with the temporary
+files of writers that crashed.
+
+Classes:
+    ResultCache: A size bounded cache of simulation results in a directory.
+
+Functions:
+    canonical: Convert a scenario into plain JSON values with a fixed order.
+    normalized: A scenario with the defaults of its function filled in.
+    code_version: Hash of the source of the simulation modules and of the data file.
+    summary_statistics: The summary statistics stored with the series of a run.
+    cached_simulate: engine.simulate through a ResultCache.
+
+Constants:
+    CACHE_DIR: Default cache directory.
+    MAX_BYTES: Default size limit of a cache.
+    VERSIONED_FILES: Files whose content is part of every key.
+"""
+import contextlib
+import functools
+import hashlib
+import importlib
+import inspect
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+import engine
+import statistics
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(_HERE, '.simulation_cache')
+MAX_BYTES = 256 * 1024 ** 2
+VERSIONED_FILES = ('engine.py', 'kernels.py', 'policies.py', 'interventions.py', 'tracing.py', 'traits.py',
+                   'compartments.py', 'sharded.py', 'getting_data.py', 'statistics.py', 'calibration.py',
+                   'mobility.py', 'cache.py', 'worldometer_data.csv')
+
+# Functions whose defaults are filled into the scenarios naming them
+_FUNCTIONS = ('engine.simulate', 'calibration.fit_countries')
+# Seconds after which a temporary file is taken to be left behind by a crashed writer
+_STALE_SECONDS = 10 * 60
+
+
+def canonical(value: Any) -> Any:
+    """
+    Convert a scenario into plain JSON values: tuples and numpy arrays become lists, numpy scalars numbers, and other
+    objects (traits.Heterogeneity, interventions.Intervention, ...) a dict of their class name and public attributes,
+    the private ones only hold state derived from them.
+    """
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if callable(value):
+        raise TypeError(f'Can not cache a scenario with the function {value!r}')
+    return {'__class__': type(value).__name__,
+            **canonical({name: item for name, item in vars(value).items() if not name.startswith('_')})}
+
+
+def normalized(scenario: dict) -> dict:
+    """
+    Return a scenario whose 'function' is one of the functions known to the cache with every argument it does not
+    give set to its default, other scenarios unchanged.
+    :raise TypeError: if the scenario has arguments its function does not take
+    """
+    if scenario.get('function') not in _FUNCTIONS:
+        return scenario
+    module, name = scenario['function'].rsplit('.', 1)
+    function = getattr(importlib.import_module(module), name)
+    bound = inspect.signature(function).bind(**{key: value for key, value in scenario.items() if key != 'function'})
+    bound.apply_defaults()
+    return {'function': scenario['function'], **bound.arguments}
+
+
+@functools.lru_cache(maxsize=None)
+def code_version() -> str:
+    """Hash of the source of the simulation modules and of the data file, computed once per process."""
+    digest = hashlib.sha256()
+    for name in VERSIONED_FILES:
+        digest.update(name.encode())
+        path = os.path.join(_HERE, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A size bounded cache of simulation results in a directory, shared safely between processes.
+
+    Instance attributes:
+    - directory: str, where the entries are stored
+    - max_bytes: int, the least recently used entries are deleted when the entries take more than this
+    - hits: int, number of get calls of this object that found an entry
+    - misses: int, number of get calls of this object that did not
+
+    Representation Invariants:
+    - self.max_bytes >= 0
+    """
+    directory: str
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, scenario: dict) -> str:
+        """Return the key of a scenario: the hash of the canonical JSON of it normalized and of the code version."""
+        text = json.dumps({'scenario': canonical(normalized(scenario)), 'code': code_version()}, sort_keys=True,
+                          separators=(',', ':'))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, scenario: dict) -> Optional[tuple[dict[str, np.ndarray], dict]]:
+        """
+        Return the series and summary stored for a scenario, or None if it is not cached.
+        """
+        path = self._path(self.key(scenario))
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(path)  # mark as recently used
+        self.hits += 1
+        with np.load(io.BytesIO(data)) as entry:
+            summary = json.loads(str(entry['__summary__']))
+            series = {name: entry[name] for name in entry.files if name != '__summary__'}
+        return series, summary
+
+    def put(self, scenario: dict, series: dict[str, np.ndarray], summary: dict) -> str:
+        """
+        Store the series and summary of a scenario, then trim the cache to max_bytes.
+        :return: the key of the entry
+        """
+        key = self.key(scenario)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, __summary__=np.array(json.dumps(canonical(summary))),
+                            **{name: np.asarray(values) for name, values in series.items()})
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                file.write(buffer.getvalue())
+            os.replace(temporary, self._path(key))  # atomic, readers never see half an entry
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+        self.trim()
+        return key
+
+    def get_or_run(self, scenario: dict, run: Callable[[], dict[str, np.ndarray]],
+                   summarize: Optional[Callable[[dict[str, np.ndarray]], dict]] = None
+                   ) -> tuple[dict[str, np.ndarray], dict]:
+        """
+        Return the cached series and summary of a scenario, running and caching it on a miss.
+        :param run: Runs the scenario and returns its series
+        :param summarize: Computes the summary of the series, summary_statistics if None
+        """
+        cached = self.get(scenario)
+        if cached is not None:
+            return cached
+        series = run()
+        summary = (summarize or summary_statistics)(series)
+        self.put(scenario, series, summary)
+        return series, summary
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold the lock file of the directory, on platforms without fcntl only the atomic renames protect it."""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """Return the (last use, size, path) of every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                with contextlib.suppress(FileNotFoundError):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def trim(self) -> int:
+        """
+        Delete the least recently used entries until the entries take at most max_bytes, and the temporary files
+        older than _STALE_SECONDS, which no writer is still writing.
+        :return: the number of deleted entries
+        """
+        with self._lock():
+            stale = time.time() - _STALE_SECONDS
+            for name in os.listdir(self.directory):
+                if name.endswith('.tmp'):
+                    path = os.path.join(self.directory, name)
+                    with contextlib.suppress(FileNotFoundError):
+                        if os.stat(path).st_mtime < stale:
+                            os.remove(path)
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            deleted = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                    deleted += 1
+                total -= size
+        return deleted
+
+    def clear(self) -> None:
+        """Delete every entry."""
+        with self._lock():
+            for _, _, path in self.entries():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+
+def summary_statistics(series: dict[str, np.ndarray]) -> dict:
+    """
+    The summary stored with a run: statistics.sir_statistics and statistics.compartment_statistics, empty for a run
+    without ticks as there is nothing to compute them on.
+    """
+    if not series or not all(len(values) for values in series.values()):
+        return {}
+    population = int(sum(int(values[0]) for values in series.values()))
+    summary = {'compartments': statistics.compartment_statistics(series, population)}
+    if 'infected' in series and 'recovered' in series:
+        summary['sir'] = statistics.sir_statistics(series['infected'], series['recovered'], population)
+    return summary
+
+
+def cached_simulate(cache: Optional[ResultCache] = None, **scenario: Any) -> tuple[dict[str, np.ndarray], dict]:
+    """
+    Run engine.simulate with the keyword arguments of scenario, unless the same scenario is already cached.
+    :param cache: The cache to use, one in CACHE_DIR if None
+    :return: the counts returned by engine.simulate and their summary statistics
+    """
+    cache = cache if cache is not None else ResultCache()
+    return cache.get_or_run({'function': 'engine.simulate', **scenario}, lambda: engine.simulate(**scenario))
@@ -0,0 +1,291 @@
+"""
+Module for fitting the transmission and recovery parameters of every country to the data file.
+
+The data file holds one snapshot per country, the TotalCases, TotalRecovered and TotalDeaths on the day it was taken,
+not a time series. A country is fitted with the SIRD model of the compartments module, in days, so that after
+OBSERVATION_DAYS days from one case the cumulative cases (everyone no longer susceptible), the recovered and the dead
+match the snapshot. The fraction of the closed cases that died is the mortality of the model, so it is read directly
+from the data and only the transmission and the recovery time are searched.
+
+The inner loop is compartments.solve on a batch of every country times every candidate parameter set, so one call
+scores thousands of parameter sets. Two searches use it:
+- 'cem', the cross-entropy method: candidates are drawn around the current estimate of every country in log space,
+  and the estimate moves to the best of them. Several starts with different seeds can run on several cores, the best
+  fit of every country is kept.
+- 'abc', rejection approximate Bayesian computation: parameter sets are drawn from the prior, the closest fraction is
+  accepted and summarised by its mean and spread. The draws are split over several cores.
+
+Fits are stored in a cache.ResultCache, keyed by the settings, the data file and the source of the solver, so later
+runs and agent simulations get them without fitting again (see fitted_parameters, agent_parameters and
+compartment_parameters).
+
+Functions:
+    observations: The cumulative cases, recovered and deaths of every country.
+    loss: Squared log error of solved compartments against observations.
+    fit_countries: Fit the parameters of countries of the data file.
+    fitted_parameters: The cached fit of countries, fitting them on a miss.
+    agent_parameters: Arguments for engine.simulate from the fit of a country.
+    compartment_parameters: Arguments for compartments.simulate_agents from the fit of a country.
+
+Constants:
+    OBSERVATION_DAYS: Assumed days between the first case of a country and the snapshot.
+    PRIOR: Range of every searched parameter, sampled uniformly in log space.
+    TICKS_PER_DAY: Default ticks of the agent simulations per day.
+"""
+import concurrent.futures
+import functools
+from typing import Any, Optional
+
+import numpy as np
+
+import cache
+import compartments
+import mobility
+
+OBSERVATION_DAYS = 200  # January to the end of July 2020, when the snapshot was taken
+PRIOR = {'transmission': (0.02, 2.0), 'recovery_days': (2.0, 60.0)}
+TICKS_PER_DAY = 10  # The default recovery time of 100 ticks is then 10 days
+
+_PARAMETERS = tuple(PRIOR)
+_LOW = np.log([PRIOR[name][0] for name in _PARAMETERS])
+_HIGH = np.log([PRIOR[name][1] for name in _PARAMETERS])
+
+
+def observations(countries: Optional[list[str]] = None) -> dict[str, np.ndarray]:
+    """
+    Return the population, cases, recovered and deaths of countries of the data file, all of them that have a
+    population and cases if None, as nothing can be fitted without them.
+    Missing recovered or deaths are NaN and flagged in 'observed', the (countries, 3) mask of the cases, recovered and
+    deaths that are known. The mortality is the deaths among the closed cases, or getting_data.global_mortality where
+    either is missing.
+    :raise ValueError: if a country is not in the data file or has no population or cases
+    """
+    import getting_data
+
+    df = getting_data.df
+    fittable = df['Population'].notna() & df['TotalCases'].notna()
+    if countries is None:
+        df = df[fittable]
+    else:
+        unknown = set(countries) - set(df['Country/Region'])
+        if unknown:
+            raise ValueError(f'Unknown countries {sorted(unknown)}')
+        missing = set(countries) & set(df.loc[~fittable, 'Country/Region'])
+        if missing:
+            raise ValueError(f'Countries without a population or cases in the data file {sorted(missing)}')
+        df = df.set_index('Country/Region').loc[list(countries)].reset_index()
+    deaths = df['TotalDeaths'].to_numpy(dtype=np.float64)
+    recovered = df['TotalRecovered'].to_numpy(dtype=np.float64)
+    cases = df['TotalCases'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mortality = deaths / (deaths + recovered)
+    mortality = np.where(np.isfinite(mortality), mortality, float(getting_data.global_mortality))
+    return {'country': df['Country/Region'].to_numpy(dtype=object),
+            'population': df['Population'].to_numpy(dtype=np.float64),
+            'cases': cases, 'recovered': recovered, 'deaths': deaths, 'mortality': mortality,
+            'observed': ~np.isnan(np.stack((cases, recovered, deaths), axis=1))}
+
+
+def loss(observed: dict[str, np.ndarray], transmission: np.ndarray, recovery_days: np.ndarray,
+         days: int = OBSERVATION_DAYS) -> np.ndarray:
+    """
+    Solve SIRD for a batch of parameter sets and return the squared log error of every set against the observations,
+    summed over the cases, recovered and deaths flagged as observed.
+    :param observed: The observations of countries, see observations
+    :param transmission: Infections per day caused by one infected person, shaped (countries, candidates)
+    :param recovery_days: Mean days spent infected, shaped like transmission
+    :return: the loss of every parameter set, shaped like transmission
+    """
+    column = (slice(None), None)
+    final = compartments.solve('SIRD', transmission, recovery_days, observed['population'][column], ticks=days,
+                               mortality=observed['mortality'][column], steps_per_tick=2, keep_series=False)
+    solved = {'cases': observed['population'][column] - final['susceptible'],
+              'recovered': final['recovered'], 'deaths': final['dead']}
+    total = np.zeros(np.shape(transmission))
+    for i, (name, values) in enumerate(solved.items()):
+        known = observed['observed'][:, i]
+        error = np.log1p(np.maximum(values[known], 0)) - np.log1p(observed[name][known, None])
+        total[known] += error ** 2
+    return total
+
+
+def _cross_entropy(observed: dict[str, np.ndarray], seed: int, candidates: int, iterations: int,
+                   elite: float, days: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    One start of the cross-entropy method for every country at once.
+    :return: the best log parameters of every country, shaped (countries, parameters), and their loss
+    """
+    rng = np.random.default_rng(seed)
+    count = len(observed['cases'])
+    mean = rng.uniform(_LOW, _HIGH, (count, len(_PARAMETERS)))
+    std = np.broadcast_to((_HIGH - _LOW) / 4, mean.shape).copy()
+    best, best_loss = mean.copy(), np.full(count, np.inf)
+    num_elite = max(int(candidates * elite), 2)
+    for _ in range(iterations):
+        samples = np.clip(mean[:, None] + std[:, None] * rng.standard_normal((count, candidates, len(_PARAMETERS))),
+                          _LOW, _HIGH)
+        losses = loss(observed, np.exp(samples[..., 0]), np.exp(samples[..., 1]), days)
+        order = np.argsort(losses, axis=1)[:, :num_elite]
+        elites = np.take_along_axis(samples, order[..., None], axis=1)
+        mean, std = elites.mean(axis=1), elites.std(axis=1) + 1e-3
+        improved = losses[np.arange(count), order[:, 0]] < best_loss
+        best[improved] = elites[improved, 0]
+        best_loss[improved] = losses[improved, order[improved, 0]]
+    return best, best_loss
+
+
+def _rejection(observed: dict[str, np.ndarray], seed: int, samples: int, chunk: int,
+               days: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draw samples parameter sets per country from the prior and score them, chunk sets at a time to bound memory.
+    :return: the log parameters, shaped (countries, samples, parameters), and their loss
+    """
+    rng = np.random.default_rng(seed)
+    count = len(observed['cases'])
+    drawn = rng.uniform(_LOW, _HIGH, (count, samples, len(_PARAMETERS)))
+    losses = np.empty((count, samples))
+    for start in range(0, samples, chunk):
+        part = drawn[:, start:start + chunk]
+        losses[:, start:start + chunk] = loss(observed, np.exp(part[..., 0]), np.exp(part[..., 1]), days)
+    return drawn, losses
+
+
+def _result(observed: dict[str, np.ndarray], log_parameters: np.ndarray, losses: np.ndarray,
+            spread: Optional[np.ndarray] = None) -> dict[str, np.ndarray]:
+    """Turn log parameters of every country into the fit returned by fit_countries."""
+    result = {name: np.exp(log_parameters[:, i]) for i, name in enumerate(_PARAMETERS)}
+    if spread is not None:
+        result.update({f'{name}_spread': spread[:, i] for i, name in enumerate(_PARAMETERS)})
+    result['mortality'] = observed['mortality']
+    result['r0'] = result['transmission'] * result['recovery_days']
+    result['loss'] = losses
+    result['observed'] = observed['observed'].sum(axis=1)
+    return result
+
+
+def fit_countries(countries: Optional[list[str]] = None, method: str = 'cem', starts: int = 4,
+                  workers: int = 1, seed: int = 0, candidates: int = 64, iterations: int = 30, elite: float = 0.1,
+                  samples: int = 20000, accept: float = 0.01, days: int = OBSERVATION_DAYS) -> dict[str, Any]:
+    """
+    Fit the transmission and recovery time of countries of the data file.
+    :param countries: Names of the countries, all of them if None
+    :param method: 'cem' for the multi-start cross-entropy method or 'abc' for rejection ABC
+    :param starts: Number of cross-entropy starts, the best of them is kept for every country
+    :param workers: Number of processes the starts or the ABC draws are spread over, no processes if 1
+    :param seed: Seed of the first start, start k uses seed + k
+    :param candidates: Parameter sets tried per country in every cross-entropy iteration
+    :param iterations: Cross-entropy iterations per start
+    :param elite: Fraction of the candidates the next cross-entropy estimate is made of
+    :param samples: Parameter sets drawn per country by ABC
+    :param accept: Fraction of the ABC draws closest to the data that is accepted
+    :param days: Days between one case and the snapshot
+    :return: dict with the 'countries' and, per country, the 'transmission' per day, 'recovery_days', 'mortality',
+             basic reproduction number 'r0', 'loss' and the number of the cases, recovered and deaths it was 'observed'
+             on. ABC also gives the standard deviation of the log of every parameter in the accepted draws as
+             'transmission_spread' and 'recovery_days_spread'.
+    """
+    if method not in ('cem', 'abc'):
+        raise ValueError(f'Unknown method {method!r}, choose from cem and abc')
+    observed = observations(countries)
+    count = len(observed['cases'])
+
+    if method == 'cem':
+        run = functools.partial(_cross_entropy, observed, candidates=candidates, iterations=iterations, elite=elite,
+                                days=days)
+        seeds = [seed + start for start in range(starts)]
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                runs = list(pool.map(run, seeds))
+        else:
+            runs = [run(start_seed) for start_seed in seeds]
+        parameters = np.stack([parameters for parameters, _ in runs])
+        losses = np.stack([losses for _, losses in runs])
+        best = losses.argmin(axis=0)
+        result = _result(observed, parameters[best, np.arange(count)], losses[best, np.arange(count)])
+    else:
+        # Every worker draws its share of the samples with its own seed
+        shares = np.full(max(workers, 1), samples // max(workers, 1))
+        shares[:samples % len(shares)] += 1
+        run = functools.partial(_rejection, observed, chunk=max(candidates * 8, 1), days=days)
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                runs = list(pool.map(run, [seed + k for k in range(len(shares))], shares.tolist()))
+        else:
+            runs = [run(seed, samples)]
+        drawn = np.concatenate([drawn for drawn, _ in runs], axis=1)
+        losses = np.concatenate([losses for _, losses in runs], axis=1)
+        kept = max(int(samples * accept), 1)
+        closest = np.argsort(losses, axis=1)[:, :kept]
+        accepted = np.take_along_axis(drawn, closest[..., None], axis=1)
+        result = _result(observed, accepted.mean(axis=1), np.take_along_axis(losses, closest, axis=1).mean(axis=1),
+                         accepted.std(axis=1))
+    result['countries'] = observed['country'].tolist()
+    return result
+
+
+def fitted_parameters(countries: Optional[list[str]] = None, refit: bool = False,
+                      result_cache: Optional[cache.ResultCache] = None, **settings: Any) -> dict[str, dict]:
+    """
+    Return the fit of countries from the cache, fitting all the countries of the data file with fit_countries on a
+    miss, so one fit serves every later call with the same settings.
+    :param countries: Names of the countries, all the ones observations can fit if None
+    :param refit: Fit again even if the fit is cached
+    :param result_cache: The cache to use, one in cache.CACHE_DIR if None
+    :param settings: Arguments of fit_countries other than countries
+    :return: dict from country name to dict of its fitted parameters
+    """
+    result_cache = result_cache if result_cache is not None else cache.ResultCache()
+    scenario = {'function': 'calibration.fit_countries', **settings}
+    cached = None if refit else result_cache.get(scenario)
+    if cached is None:
+        fit = fit_countries(**settings)
+        names = fit.pop('countries')
+        result_cache.put(scenario, fit, {'countries': names})
+    else:
+        fit, summary = cached
+        names = summary['countries']
+    by_country = {name: {parameter: float(values[i]) for parameter, values in fit.items()}
+                  for i, name in enumerate(names)}
+    if countries is None:
+        return by_country
+    unknown = set(countries) - set(by_country)
+    if unknown:
+        observations(sorted(unknown))  # raises why they were not fitted
+    return {name: by_country[name] for name in countries}
+
+
+def _agent_arguments(fit: dict[str, float], num_persons: int, infection_radius: float, width: int, height: int,
+                     ticks_per_day: float) -> dict[str, float]:
+    """The infection_probability and recovery_time in ticks of the fit of a country, see agent_parameters."""
+    contacts = max(num_persons - 1, 1) * np.pi * infection_radius ** 2 / (width * height)
+    return {'infection_probability': float(min(fit['transmission'] / ticks_per_day / contacts, 1.0)),
+            'recovery_time': max(int(round(fit['recovery_days'] * ticks_per_day)), 1)}
+
+
+def agent_parameters(country: str, num_persons: int, infection_radius: float, width: int = mobility.WIDTH,
+                     height: int = mobility.HEIGHT, ticks_per_day: float = TICKS_PER_DAY,
+                     **settings: Any) -> dict[str, float]:
+    """
+    Turn the fit of a country into arguments of engine.simulate.
+    A person has about (num_persons - 1) * pi * infection_radius ** 2 / (width * height) contacts per tick, so the
+    infection probability per contact is the fitted transmission per tick divided by that, at most 1. Contacts last
+    several ticks in the agent simulations, so this is a first estimate rather than an exact match.
+    :param ticks_per_day: Ticks of the simulation in one day
+    :param settings: Arguments of fitted_parameters
+    :return: dict with the infection_probability and recovery_time in ticks
+    """
+    fit = fitted_parameters([country], **settings)[country]
+    return _agent_arguments(fit, num_persons, infection_radius, width, height, ticks_per_day)
+
+
+def compartment_parameters(country: str, num_persons: int, infection_radius: float, width: int = mobility.WIDTH,
+                           height: int = mobility.HEIGHT, ticks_per_day: float = TICKS_PER_DAY,
+                           **settings: Any) -> dict[str, float]:
+    """
+    Turn the fit of a country into arguments of compartments.simulate_agents: the ones of agent_parameters and the
+    fitted mortality, for the models with D.
+    :return: dict with the infection_probability, recovery_time in ticks and mortality
+    """
+    fit = fitted_parameters([country], **settings)[country]
+    return {**_agent_arguments(fit, num_persons, infection_radius, width, height, ticks_per_day),
+            'mortality': fit['mortality']}
@@ -0,0 +1,326 @@
+"""
+Module for simulating epidemic models with more compartments than susceptible, infected and recovered.
+
+A Model is a compartment graph named by its letters:
+- S: susceptible, infected by contact with an infectious person
+- E: exposed, infected but not infectious yet, optional
+- I: infected and infectious
+- R: recovered and immune
+- D: dead, an infected person dies instead of recovering with the mortality probability, optional
+- a trailing S: immunity wanes and recovered people become susceptible again, optional
+so 'SIR', 'SEIR', 'SIRS', 'SIRD', 'SEIRD' and 'SEIRDS' are all models.
+
+Two engines simulate a Model:
+- simulate_agents, the array engine of the engine module with the state of every person stored as a one byte
+  compartment code. When people enter a compartment their time in it is drawn for all of them at once from a Duration,
+  and they are put in the bucket of the tick they leave it, so a tick only touches the people changing compartment.
+- solve, the deterministic compartmental model as differential equations, integrated for a whole batch of parameter
+  sets at once.
+
+Classes:
+    Duration: Distribution of the number of ticks spent in a compartment.
+    Model: A compartment graph.
+
+Functions:
+    simulate_agents: Simulate a Model with the array engine.
+    solve: Integrate the differential equations of a Model for a batch of parameters.
+
+Constants:
+    SUSCEPTIBLE, EXPOSED, INFECTED, RECOVERED, DEAD: The compartment codes.
+    NAMES: Name of the compartment of every code.
+"""
+import re
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+import engine
+import kernels
+import mobility
+import traits
+
+SUSCEPTIBLE, EXPOSED, INFECTED, RECOVERED, DEAD = range(5)
+NAMES = ('susceptible', 'exposed', 'infected', 'recovered', 'dead')
+
+
+class Duration:
+    """
+    Distribution of the number of ticks spent in a compartment, every draw is at least one tick.
+
+    Instance attributes:
+    - kind: str, 'fixed', 'exponential', 'gamma' or 'uniform'
+    - mean: float, mean number of ticks
+    - spread: float, shape of the gamma distribution, or half the width of the uniform one
+
+    Representation Invariants:
+    - self.kind in ('fixed', 'exponential', 'gamma', 'uniform')
+    - self.mean >= 1
+    """
+    kind: str
+    mean: float
+    spread: float
+
+    def __init__(self, kind: str = 'fixed', mean: float = 100, spread: float = 0.0) -> None:
+        if kind not in ('fixed', 'exponential', 'gamma', 'uniform'):
+            raise ValueError(f'Unknown duration {kind!r}')
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+
+    def draw(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Draw size durations in ticks at once, a fixed duration uses no random numbers."""
+        if self.kind == 'fixed':
+            ticks = np.full(size, self.mean)
+        elif self.kind == 'exponential':
+            ticks = rng.exponential(self.mean, size)
+        elif self.kind == 'gamma':
+            ticks = rng.gamma(self.spread, self.mean / self.spread, size)
+        else:
+            ticks = rng.uniform(self.mean - self.spread, self.mean + self.spread, size)
+        return np.maximum(np.rint(ticks), 1).astype(np.int64)
+
+    def __repr__(self) -> str:
+        return f'Duration({self.kind!r}, {self.mean}, {self.spread})'
+
+
+def _duration(value: Union[Duration, float]) -> Duration:
+    """A Duration, numbers are fixed durations."""
+    return value if isinstance(value, Duration) else Duration('fixed', value)
+
+
+class Model:
+    """
+    A compartment graph, see the module docstring for the names.
+
+    Instance attributes:
+    - name: str, e.g. 'SEIRD'
+    - latent: bool, if infected people are exposed before they are infectious
+    - deadly: bool, if infected people can die
+    - waning: bool, if recovered people become susceptible again
+    - codes: tuple, codes of the compartments of the model, in order
+
+    Representation Invariants:
+    - SUSCEPTIBLE in self.codes and INFECTED in self.codes and RECOVERED in self.codes
+    """
+    name: str
+    latent: bool
+    deadly: bool
+    waning: bool
+    codes: tuple[int, ...]
+
+    def __init__(self, name: str) -> None:
+        match = re.fullmatch(r'S(E?)IR(D?)(S?)', name.upper())
+        if match is None:
+            raise ValueError(f'Unknown model {name!r}, e.g. SIR, SEIR, SIRS, SIRD or SEIRDS')
+        self.name = name.upper()
+        self.latent, self.deadly, self.waning = (bool(group) for group in match.groups())
+        self.codes = tuple(code for code, present in ((SUSCEPTIBLE, True), (EXPOSED, self.latent), (INFECTED, True),
+                                                      (RECOVERED, True), (DEAD, self.deadly)) if present)
+
+    def names(self) -> list[str]:
+        """Return the names of the compartments of the model."""
+        return [NAMES[code] for code in self.codes]
+
+    def __repr__(self) -> str:
+        return f'Model({self.name!r})'
+
+
+def _mortality(mortality: Optional[float]) -> float:
+    """The chance for an infected person to die, getting_data.global_mortality if None."""
+    if mortality is None:
+        import getting_data
+
+        return float(getting_data.global_mortality)
+    return mortality
+
+
+def _fast_forward(rest: np.ndarray, start: int, last: np.ndarray, leaving: dict[int, list[np.ndarray]],
+                  model: Model) -> None:
+    """
+    Fill the counts of the ticks from start on once nobody is exposed or infected. The only people still changing
+    compartment are the recovered losing their immunity at the ticks they are scheduled to.
+    :param rest: The counts of the ticks from start on, filled in place
+    :param last: The counts of the tick before start
+    """
+    rest[:] = last
+    waned = np.zeros(len(rest), dtype=np.int64)
+    for tick, groups in leaving.items():
+        if start <= tick < start + len(rest):
+            waned[tick - start] += sum(len(group) for group in groups)
+    waned = np.cumsum(waned)
+    rest[:, model.codes.index(RECOVERED)] -= waned
+    rest[:, model.codes.index(SUSCEPTIBLE)] += waned
+
+
+def simulate_agents(model: Union[Model, str], num_persons: int, infection_radius: float, ticks: int = 3000,
+                    seed: int = 0, width: int = mobility.WIDTH, height: int = mobility.HEIGHT,
+                    infection_probability: Optional[float] = None, backend: str = 'numpy',
+                    latent_time: Union[Duration, float] = 50, recovery_time: Union[Duration, float] = 100,
+                    immunity_time: Union[Duration, float] = 1000, mortality: Optional[float] = None,
+                    heterogeneity: Optional[traits.Heterogeneity] = None,
+                    movement: Optional[mobility.Mobility] = None,
+                    callback: Optional[Callable[[int, Any, np.ndarray], Any]] = None,
+                    fast_forward: bool = True) -> dict[str, np.ndarray]:
+    """
+    Simulate a Model with the array engine: people move and meet like in engine.simulate, and the state of every
+    person is a compartment code. For 'SIR' with a fixed recovery_time and no heterogeneity this gives the same counts
+    as engine.simulate.
+    :param model: Model or its name
+    :param latent_time: Ticks spent exposed, for models with E
+    :param recovery_time: Ticks spent infected
+    :param immunity_time: Ticks spent recovered, for models with waning immunity
+    :param mortality: Chance for an infected person to die instead of recovering, for models with D,
+                      getting_data.global_mortality if None
+    :param heterogeneity: How to sample the traits of every person, see engine.create_population. The time a person
+                          spends infected is drawn from recovery_time and multiplied by their recovery factor.
+    :param movement: How people move, see the mobility module. Its world replaces width and height.
+    :param callback: Called with the tick, the population and the compartment codes after every tick, the infected
+                     and recovered columns of the population are not kept up to date
+    :param fast_forward: Stop simulating once nobody is exposed or infected, as nobody can be infected again, and
+                         fill the remaining ticks from the scheduled ends of immunity. callback is not called for them.
+    :return: dict with the count of every compartment of the model after every tick
+    """
+    model = model if isinstance(model, Model) else Model(model)
+    latent_time, recovery_time, immunity_time = (_duration(value) for value in
+                                                 (latent_time, recovery_time, immunity_time))
+    mortality = _mortality(mortality) if model.deadly else 0.0
+    rng = np.random.default_rng(seed)
+    kernel = kernels.get_kernels(backend)
+
+    if movement is not None:
+        width, height = movement.world.width, movement.world.height
+    population = engine.create_population(num_persons, rng, width, height, infection_probability,
+                                          recovery_time=recovery_time.mean, heterogeneity=heterogeneity)
+    # The recovery_time column holds the mean times the recovery factor of every person
+    recovery_factor = population.recovery_time / np.float32(recovery_time.mean) if heterogeneity is not None else None
+    if movement is not None:
+        movement.setup(population)
+    state = np.full(num_persons, SUSCEPTIBLE, dtype=np.uint8)
+    counts = np.zeros(len(NAMES), dtype=np.int64)
+    counts[SUSCEPTIBLE] = num_persons
+    durations = {EXPOSED: latent_time, INFECTED: recovery_time, RECOVERED: immunity_time if model.waning else None}
+    leaving: dict[int, list[np.ndarray]] = {}
+
+    def enter(people: np.ndarray, code: int, tick: int) -> None:
+        """Move people into a compartment at tick and schedule when they leave it."""
+        counts[code] += len(people)
+        state[people] = code
+        duration = durations.get(code)
+        if duration is None or not len(people):
+            return
+        spent = duration.draw(rng, len(people))
+        if code == INFECTED and recovery_factor is not None:
+            spent = np.maximum(np.rint(spent * recovery_factor[people]), 1).astype(np.int64)
+        until = tick + spent
+        order = np.argsort(until, kind='stable')
+        until, people = until[order], people[order]
+        bounds = np.flatnonzero(np.diff(until)) + 1
+        for group_tick, group in zip(until[np.concatenate(([0], bounds))].tolist(), np.split(people, bounds)):
+            leaving.setdefault(group_tick, []).append(group)
+
+    first_cases = np.flatnonzero(population.infected)
+    counts[SUSCEPTIBLE] -= len(first_cases)
+    enter(first_cases, INFECTED, -1)
+
+    series = np.zeros((ticks, len(model.codes)), dtype=np.int64)
+    for tick in range(ticks):
+        if movement is None:
+            engine.move(population, width, height)
+            a, b = kernel.contact_pairs(population.x, population.y, infection_radius)
+        else:
+            movement.move(population, tick)
+            a, b = movement.world.contact_pairs(kernel, population.x, population.y, infection_radius)
+        newly_infected = kernel.spread(state == INFECTED, state != SUSCEPTIBLE, population.infection_probability,
+                                       population.infectiousness, population.susceptibility, a, b,
+                                       engine.pair_uniforms(seed, tick, a, b))
+
+        # People whose time in their compartment is over leave it before the new infections, like in engine.advance
+        due = leaving.pop(tick, None)
+        if due is not None:
+            due = np.concatenate(due)
+            codes = state[due]
+            for code in (EXPOSED, INFECTED, RECOVERED):
+                people = due[codes == code]
+                if not len(people):
+                    continue
+                counts[code] -= len(people)
+                if code == EXPOSED:
+                    enter(people, INFECTED, tick)
+                elif code == RECOVERED:
+                    enter(people, SUSCEPTIBLE, tick)
+                else:
+                    dies = rng.random(len(people)) < mortality if mortality else np.zeros(len(people), dtype=bool)
+                    enter(people[~dies], RECOVERED, tick)
+                    enter(people[dies], DEAD, tick)
+                    population.speed_x[people[dies]] = 0
+                    population.speed_y[people[dies]] = 0
+
+        counts[SUSCEPTIBLE] -= len(newly_infected)
+        enter(newly_infected, EXPOSED if model.latent else INFECTED, tick)
+        series[tick] = counts[list(model.codes)]
+        if callback is not None:
+            callback(tick, population, state)
+        if fast_forward and not counts[EXPOSED] and not counts[INFECTED] and tick + 1 < ticks:
+            _fast_forward(series[tick + 1:], tick + 1, series[tick], leaving, model)
+            break
+
+    return {NAMES[code]: series[:, i] for i, code in enumerate(model.codes)}
+
+
+def solve(model: Union[Model, str], transmission: Any, recovery_time: Any, population: float,
+          initial_infected: float = 1, ticks: int = 3000, latent_time: Any = 50, immunity_time: Any = 1000,
+          mortality: Any = None, steps_per_tick: int = 1, keep_series: bool = True) -> dict[str, np.ndarray]:
+    """
+    Integrate the differential equations of a Model with the Runge-Kutta method, for every parameter set of a batch at
+    once. The parameters are numbers or arrays broadcast against each other, every element is one parameter set.
+    :param transmission: New infections per tick caused by one infected person in a fully susceptible population
+    :param recovery_time: Mean ticks spent infected
+    :param population: Size of the population, can also differ between parameter sets
+    :param initial_infected: Number of people infected at the start, can also differ between parameter sets
+    :param latent_time: Mean ticks spent exposed, for models with E
+    :param immunity_time: Mean ticks spent recovered, for models with waning immunity
+    :param mortality: Fraction of the infected people that die, for models with D, getting_data.global_mortality if None
+    :param steps_per_tick: Integration steps per tick
+    :param keep_series: If False only the counts after the last tick are returned, shaped like the batch
+    :return: dict with the count of every compartment of the model after every tick, shaped (ticks,) + batch shape
+    """
+    model = model if isinstance(model, Model) else Model(model)
+    beta, gamma, sigma, omega, fatal, population, initial_infected = np.broadcast_arrays(
+        np.asarray(transmission, dtype=np.float64), 1 / np.asarray(recovery_time, dtype=np.float64),
+        1 / np.asarray(latent_time, dtype=np.float64) if model.latent else np.float64(0.0),
+        1 / np.asarray(immunity_time, dtype=np.float64) if model.waning else np.float64(0.0),
+        np.asarray(_mortality(mortality) if model.deadly else 0.0, dtype=np.float64),
+        np.asarray(population, dtype=np.float64), np.asarray(initial_infected, dtype=np.float64))
+    y = np.zeros((len(NAMES),) + beta.shape)
+    y[SUSCEPTIBLE] = population - initial_infected
+    y[INFECTED] = initial_infected
+
+    def derivative(y: np.ndarray) -> np.ndarray:
+        infections = beta * y[SUSCEPTIBLE] * y[INFECTED] / population
+        exits = gamma * y[INFECTED]
+        dy = np.empty_like(y)
+        if model.latent:
+            dy[EXPOSED] = infections - sigma * y[EXPOSED]
+            dy[INFECTED] = sigma * y[EXPOSED] - exits
+        else:
+            dy[EXPOSED] = 0
+            dy[INFECTED] = infections - exits
+        dy[SUSCEPTIBLE] = omega * y[RECOVERED] - infections
+        dy[RECOVERED] = (1 - fatal) * exits - omega * y[RECOVERED]
+        dy[DEAD] = fatal * exits
+        return dy
+
+    h = 1 / steps_per_tick
+    series = np.empty((ticks if keep_series else 1, len(NAMES)) + beta.shape)
+    for tick in range(ticks):
+        for _ in range(steps_per_tick):
+            k1 = derivative(y)
+            k2 = derivative(y + h / 2 * k1)
+            k3 = derivative(y + h / 2 * k2)
+            k4 = derivative(y + h * k3)
+            y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        if keep_series:
+            series[tick] = y
+    if not keep_series:
+        return {NAMES[code]: y[code] for code in model.codes}
+    return {NAMES[code]: series[:, code] for code in model.codes}
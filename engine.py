@@ -0,0 +1,353 @@
+"""
+Module for running the simulation headless on arrays.
+
+Instead of one Person object per person, the population is stored as one numpy array per attribute, and people in
+contact are found with a uniform grid instead of by checking every pair, so a tick costs time proportional to the
+number of people and contacts rather than to the number of pairs.
+
+The loops over pairs of people are done by the kernels module, whose backend ('numpy', 'numba', 'python' or 'auto')
+is chosen with the backend argument.
+
+The rules follow logic.Person, logic.draw_edge_and_infect, preventions.social_distance and the loop in main.py with
+three differences that make the result independent of the order in which contacts are processed:
+- infections and social distancing pushes in a tick are decided on the state at the start of the tick,
+- every infected contact of a susceptible person gets its own random draw, which only depends on the seed, the tick
+  and the two people (see pair_uniforms), so the same run gives the same result however the work is split up,
+- the infection timer counts ticks spent infected, and a recovered person cannot be infected again.
+
+Classes:
+    Population: The state of every person in the simulation, stored column-wise.
+
+Functions:
+    create_population: Create a population placed at random in the world with one infected person.
+    move: Move people by their speed and keep them inside the world.
+    social_distance: Push people closer than a threshold apart.
+    pair_uniforms: Deterministic uniform random numbers for pairs of people.
+    advance: Advance the infection timers, recover people and add new infections.
+    step: Simulate one tick.
+    simulate: Run a whole simulation and return the susceptible, infected and recovered counts of every tick.
+
+Constants:
+    SOCIAL_DISTANCE: Distance kept by a scheduled social distancing without a distance_threshold, as in main.py.
+"""
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+import interventions
+import kernels
+import mobility
+import policies
+import tracing
+import traits
+
+SOCIAL_DISTANCE = 25
+
+
+class Population:
+    """
+    The state of every person in a simulation, one numpy array per attribute.
+    Person number i is described by the i-th element of every array.
+
+    Instance attributes:
+    - x: the x position of each person
+    - y: the y position of each person
+    - speed_x: how fast each person moves in the x direction
+    - speed_y: how fast each person moves in the y direction
+    - infected: if each person is infected
+    - recovered: if each person recovered from infection
+    - infection_probability: the chance for each person to infect a contact, changed by preventions
+    - infectiousness: the factor on the chance for each person to infect a contact, their own trait
+    - infection_timer: the number of ticks each person has been infected for
+    - age_group: the index in traits.AGE_GROUPS of the age group of each person
+    - susceptibility: the factor on the chance for each person to be infected by a contact
+    - recovery_time: the number of ticks each person stays infected
+    - mobility: the factor each person's speed was drawn with
+
+    Representation Invariants:
+    - all arrays have the same length
+    - not (infected & recovered).any()
+    """
+    # name -> dtype of every column, in the order they are stored
+    FIELDS = {
+        'x': np.float64,
+        'y': np.float64,
+        'speed_x': np.float64,
+        'speed_y': np.float64,
+        'infected': np.bool_,
+        'recovered': np.bool_,
+        'infection_probability': np.float64,
+        'infectiousness': np.float32,
+        'infection_timer': np.int32,
+        'age_group': np.uint8,
+        'susceptibility': np.float32,
+        'recovery_time': np.float32,
+        'mobility': np.float32,
+    }
+    x: np.ndarray
+    y: np.ndarray
+    speed_x: np.ndarray
+    speed_y: np.ndarray
+    infected: np.ndarray
+    recovered: np.ndarray
+    infection_probability: np.ndarray
+    infectiousness: np.ndarray
+    infection_timer: np.ndarray
+    age_group: np.ndarray
+    susceptibility: np.ndarray
+    recovery_time: np.ndarray
+    mobility: np.ndarray
+
+    def __init__(self, **columns: np.ndarray) -> None:
+        for name in self.FIELDS:
+            setattr(self, name, columns[name])
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Return every column by name."""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def counts(self) -> tuple[int, int, int]:
+        """Count the susceptible, infected and recovered people by scanning the arrays."""
+        num_infected = int(np.count_nonzero(self.infected))
+        num_recovered = int(np.count_nonzero(self.recovered))
+        return len(self) - num_infected - num_recovered, num_infected, num_recovered
+
+
+def create_population(num_persons: int, rng: np.random.Generator, width: int = mobility.WIDTH,
+                      height: int = mobility.HEIGHT, infection_probability: Optional[float] = None,
+                      initial_infected: int = 1, recovery_time: float = 100,
+                      heterogeneity: Optional[traits.Heterogeneity] = None) -> Population:
+    """
+    Create a population placed at random in the world like logic.community, without the graph.
+    :param num_persons: Number of people
+    :param rng: Random generator used for every random choice
+    :param infection_probability: Chance for an infected person to infect a contact, getting_data.global_infect * 10
+                                  like logic.Person if None
+    :param initial_infected: Number of people infected at the start
+    :param recovery_time: Ticks a person stays infected
+    :param heterogeneity: How to sample the traits of every person, everyone gets the same infection_probability and
+                          recovery_time and an infectiousness, susceptibility and mobility of 1 if None
+    :return: Population
+    """
+    if infection_probability is None:
+        import getting_data
+
+        infection_probability = getting_data.global_infect * 10
+
+    infected = np.zeros(num_persons, dtype=bool)
+    infected[rng.choice(num_persons, size=min(initial_infected, num_persons), replace=False)] = True
+    population = Population(
+        x=rng.integers(0, width, num_persons).astype(np.float64),
+        y=rng.integers(0, height, num_persons).astype(np.float64),
+        speed_x=rng.uniform(-1.5, 1.5, num_persons),
+        speed_y=rng.uniform(-1.5, 1.5, num_persons),
+        infected=infected,
+        recovered=np.zeros(num_persons, dtype=bool),
+        infection_probability=np.full(num_persons, infection_probability),
+        infectiousness=np.ones(num_persons, dtype=np.float32),
+        infection_timer=np.zeros(num_persons, dtype=np.int32),
+        age_group=np.zeros(num_persons, dtype=np.uint8),
+        susceptibility=np.ones(num_persons, dtype=np.float32),
+        recovery_time=np.full(num_persons, recovery_time, dtype=np.float32),
+        mobility=np.ones(num_persons, dtype=np.float32),
+    )
+    if heterogeneity is not None:
+        for name, column in heterogeneity.sample(num_persons, rng, recovery_time).items():
+            setattr(population, name, column)
+        population.speed_x *= population.mobility
+        population.speed_y *= population.mobility
+    return population
+
+
+def move(population: Population, width: int, height: int, idx: Optional[np.ndarray] = None,
+         boundary: str = 'reflecting') -> None:
+    """
+    Move people by their speed and apply the boundary at the edges of the world, like logic.Person.move.
+    :param idx: Indices of the people to move, everyone if None
+    :param boundary: One of mobility.BOUNDARIES
+    """
+    if idx is None:
+        idx = slice(None)
+    population.x[idx], population.speed_x[idx] = mobility.constrain(population.x[idx] + population.speed_x[idx],
+                                                                    population.speed_x[idx], width, boundary)
+    population.y[idx], population.speed_y[idx] = mobility.constrain(population.y[idx] + population.speed_y[idx],
+                                                                    population.speed_y[idx], height, boundary)
+
+
+def _mix(z: np.ndarray) -> np.ndarray:
+    """The splitmix64 finaliser, scrambles the bits of unsigned 64 bit integers."""
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def pair_uniforms(seed: int, tick: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Uniform random numbers in [0, 1) for pairs of people, determined by the seed, the tick and the two people only.
+    This is what makes a run independent of the order in which pairs are found.
+    :param a, b: Indices of the two people of each pair, in any order
+    :return: one number per pair
+    """
+    key = _mix(np.array([seed, tick], dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15))
+    lo = np.minimum(a, b).astype(np.uint64)
+    hi = np.maximum(a, b).astype(np.uint64)
+    z = _mix((_mix(lo ^ key[0]) + hi) ^ key[1])
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def advance(population: Population, newly_infected: np.ndarray,
+            idx: Optional[np.ndarray] = None) -> tuple[int, int]:
+    """
+    Advance the infection timer of the infected people, recover the ones that reached their recovery_time and then
+    infect newly_infected.
+    :param idx: Indices of the people to advance, everyone if None
+    :return: the number of new infections and of recoveries
+    """
+    infected = np.flatnonzero(population.infected) if idx is None else idx[population.infected[idx]]
+    population.infection_timer[infected] += 1
+    recovering = infected[population.infection_timer[infected] >= population.recovery_time[infected]]
+    population.infected[recovering] = False
+    population.recovered[recovering] = True
+    population.infection_timer[recovering] = 0
+
+    population.infected[newly_infected] = True
+    population.infection_timer[newly_infected] = 0
+    return len(newly_infected), len(recovering)
+
+
+def social_distance(population: Population, distance_threshold: float, width: int, height: int,
+                    backend: str = 'numpy') -> None:
+    """
+    Push every pair of people closer than distance_threshold apart, like preventions.social_distance.
+    """
+    kernel = kernels.get_kernels(backend)
+    a, b = kernel.contact_pairs(population.x, population.y, distance_threshold)
+    shift_x, shift_y = kernel.repel(population.x, population.y, a, b, distance_threshold, width, height)
+    population.x += shift_x
+    population.y += shift_y
+
+
+def step(population: Population, tick: int, infection_radius: float, seed: int, width: int = mobility.WIDTH,
+         height: int = mobility.HEIGHT, backend: str = 'numpy', distance_threshold: Optional[float] = None,
+         tracer: Optional[tracing.ContactTracer] = None,
+         movement: Optional[mobility.Mobility] = None) -> tuple[int, int]:
+    """
+    Simulate one tick: keep social distance if distance_threshold is given, move everyone, find the contacts, spread
+    the infection and advance the timers.
+    :param backend: Kernel backend, see the kernels module
+    :param tracer: Contact tracer whose quarantined people make no contacts, fed with the contacts and infections
+    :param movement: How people move and where their contacts are found, straight ahead in a reflecting width by
+                     height world if None
+    :return: the number of new infections and of recoveries
+    """
+    kernel = kernels.get_kernels(backend)
+    if distance_threshold:
+        social_distance(population, distance_threshold, width, height, backend)
+    if movement is None:
+        move(population, width, height)
+        a, b = kernel.contact_pairs(population.x, population.y, infection_radius)
+    else:
+        movement.move(population, tick)
+        a, b = movement.world.contact_pairs(kernel, population.x, population.y, infection_radius)
+    if tracer is not None:
+        tracer.update(tick)
+        a, b = tracer.record(tick, a, b)
+    newly_infected = kernel.spread(population.infected, population.recovered, population.infection_probability,
+                                   population.infectiousness, population.susceptibility, a, b,
+                                   pair_uniforms(seed, tick, a, b))
+    if tracer is not None:
+        tracer.infected(tick, newly_infected)
+    return advance(population, newly_infected)
+
+
+def simulate(num_persons: int, infection_radius: float, recovery_time: int = 100, ticks: int = 3000,
+             seed: int = 0, width: int = mobility.WIDTH, height: int = mobility.HEIGHT,
+             infection_probability: Optional[float] = None,
+             backend: str = 'numpy', distance_threshold: Optional[float] = None,
+             preventions: tuple[tuple[str, float], ...] = (),
+             schedule: tuple[Union[interventions.Intervention, tuple], ...] = (),
+             tracing_params: Optional[dict] = None,
+             heterogeneity: Optional[traits.Heterogeneity] = None,
+             movement: Optional[mobility.Mobility] = None,
+             callback: Optional[Callable[[int, Population], Any]] = None,
+             progress: Optional[Callable[[int, np.ndarray], Any]] = None,
+             progress_every: int = 100, fast_forward: bool = True) -> dict[str, np.ndarray]:
+    """
+    Run a whole simulation headless.
+    The counts are updated from the infections and recoveries of each tick instead of scanning the population.
+    :param num_persons: Number of people
+    :param infection_radius: Contact distance
+    :param recovery_time: Ticks a person stays infected
+    :param ticks: Number of ticks to simulate, main.py runs about 3000 in its 10 seconds
+    :param seed: Seed of every random choice, the same seed gives the same result with every backend
+    :param infection_probability: See create_population
+    :param backend: Kernel backend, see the kernels module
+    :param distance_threshold: Social distance people keep, main.py uses 25, no social distancing if None
+    :param preventions: (name, severity) of the policies applied before the first tick, see the policies module
+    :param schedule: Interventions switched on and off during the run, see interventions.schedule. A scheduled
+                     social distancing keeps distance_threshold, or SOCIAL_DISTANCE if it is None.
+    :param tracing_params: Arguments of the tracing.ContactTracer used while infection tracing is scheduled and
+                           active, or during the whole run if it is not scheduled. No tracing if None and infection
+                           tracing is not scheduled.
+    :param heterogeneity: How to sample the traits of every person, see create_population
+    :param movement: How people move, see the mobility module. Its world replaces width and height.
+    :param callback: Called with the tick and the population after every tick
+    :param progress: Called every progress_every ticks and after the last one with the tick and the
+                     (ticks so far, 3) susceptible, infected and recovered counts, a view that must not be kept
+    :param progress_every: Ticks between calls of progress
+    :param fast_forward: Stop simulating once nobody is infected, as nobody can be infected again, and give the
+                         remaining ticks the last counts. callback is not called for them.
+    :return: dict with the susceptible, infected and recovered count after every tick
+    """
+    rng = np.random.default_rng(seed)
+    if movement is not None:
+        width, height = movement.world.width, movement.world.height
+    population = create_population(num_persons, rng, width, height, infection_probability,
+                                   recovery_time=recovery_time, heterogeneity=heterogeneity)
+    if movement is not None:
+        movement.setup(population)
+    if preventions:
+        policies.apply_policies(population, [name for name, _ in preventions],
+                                [severity for _, severity in preventions], rng)
+    scheduler = interventions.schedule(list(schedule), num_persons, rng) if schedule else None
+    scheduled = [intervention.name for intervention in scheduler.interventions] if scheduler is not None else []
+    tracer = None
+    if tracing_params is not None or 'infection tracing' in scheduled:
+        tracer = tracing.ContactTracer(num_persons, **{'rng': rng, **(tracing_params or {})})
+        tracer.infected(-1, np.flatnonzero(population.infected))  # the first cases can be detected too
+
+    counts = np.zeros((ticks, 3), dtype=np.int64)
+    num_susceptible, num_infected, num_recovered = population.counts()
+    if scheduler is not None and scheduler.update(0, {'susceptible': num_susceptible, 'infected': num_infected,
+                                                       'recovered': num_recovered}):
+        scheduler.apply(population)
+    for tick in range(ticks):
+        threshold = distance_threshold
+        if 'social distancing' in scheduled:
+            threshold = (distance_threshold or SOCIAL_DISTANCE) if scheduler.is_active('social distancing') else None
+        if 'infection tracing' in scheduled:
+            tracer.enabled = scheduler.is_active('infection tracing')
+        infections, recoveries = step(population, tick, infection_radius, seed, width, height, backend, threshold,
+                                      tracer, movement)
+        num_infected += infections - recoveries
+        num_recovered += recoveries
+        num_susceptible = num_persons - num_infected - num_recovered
+        counts[tick] = num_susceptible, num_infected, num_recovered
+        if scheduler is not None and scheduler.update(tick + 1, {'susceptible': num_susceptible,
+                                                                 'infected': num_infected,
+                                                                 'recovered': num_recovered}):
+            scheduler.apply(population)
+        if callback is not None:
+            callback(tick, population)
+        if progress is not None and ((tick + 1) % progress_every == 0 or tick + 1 == ticks):
+            progress(tick, counts[:tick + 1])
+        if fast_forward and num_infected == 0 and tick + 1 < ticks:
+            counts[tick + 1:] = counts[tick]
+            if progress is not None:
+                progress(ticks - 1, counts)
+            break
+
+    return {'susceptible': counts[:, 0], 'infected': counts[:, 1], 'recovered': counts[:, 2]}
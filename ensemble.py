@@ -0,0 +1,93 @@
+"""
+Module for running many replicates of a scenario, as many as the estimates need.
+
+Replicates differ only in their seed. Each is reduced to a few metrics as soon as it finishes: the peak number of
+infected people, the tick of the peak and the final size, the number of people ever infected, so an ensemble keeps a
+handful of numbers per replicate instead of its series. With a tolerance, replicates are run in batches until the
+quantiles of the metrics stop moving: the ensemble ends once the quantiles changed by at most the tolerance times the
+population size for patience batches in a row, or at max_replicates.
+
+Functions:
+    replicate_metrics: Run one replicate and reduce it to its metrics.
+    run_ensemble: Run replicates of a scenario until the quantiles of their metrics converge.
+
+Constants:
+    METRICS: Names of the metrics of a replicate.
+    QUANTILES: Default quantiles an ensemble reports.
+"""
+import concurrent.futures
+import functools
+from typing import Any, Optional
+
+import numpy as np
+
+import engine
+
+METRICS = ('peak', 'time_to_peak', 'final_size')
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def replicate_metrics(seed: int, scenario: dict) -> tuple[int, int, int]:
+    """
+    Run engine.simulate with the arguments of scenario and the given seed.
+    :return: the peak number of infected people, the tick it was reached and the number of people ever infected
+    """
+    counts = engine.simulate(**scenario, seed=seed)
+    infected = counts['infected']
+    return int(infected.max()), int(infected.argmax()), int(scenario['num_persons'] - counts['susceptible'][-1])
+
+
+def run_ensemble(scenario: dict, replicates: int = 100, tolerance: Optional[float] = None,
+                 quantiles: tuple[float, ...] = QUANTILES, converge_on: tuple[str, ...] = ('peak', 'final_size'),
+                 batch: int = 10, patience: int = 2, max_replicates: int = 1000, seed: int = 0,
+                 workers: int = 1) -> dict[str, Any]:
+    """
+    Run replicates of a scenario with the seeds seed, seed + 1, ...
+    :param scenario: Arguments of engine.simulate other than seed
+    :param replicates: Number of replicates if tolerance is None, the minimum number otherwise
+    :param tolerance: Largest change of the quantiles, as a fraction of the population, between two batches for
+                      the ensemble to count as converged. A fixed number of replicates if None.
+    :param quantiles: Quantiles of every metric that are reported and checked for convergence
+    :param converge_on: Metrics whose quantiles have to converge
+    :param batch: Replicates run between two convergence checks
+    :param patience: Checks in a row that have to pass
+    :param max_replicates: Replicates after which the ensemble ends even if it did not converge
+    :param workers: Number of processes the replicates of a batch are spread over, no processes if 1
+    :return: dict with the metrics of every replicate, their 'quantiles' as dict from metric to list in the order of
+             quantiles, the number of 'replicates' and if the ensemble 'converged'
+    """
+    unknown = [name for name in converge_on if name not in METRICS]
+    if unknown:
+        raise ValueError(f'Unknown metrics {unknown}, choose from {METRICS}')
+    run = functools.partial(replicate_metrics, scenario=scenario)
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    results: list[tuple[int, int, int]] = []
+    previous: Optional[np.ndarray] = None
+    passed = 0
+    converged = False
+    try:
+        while True:
+            target = replicates if tolerance is None or len(results) < replicates else len(results) + batch
+            seeds = range(seed + len(results), seed + min(target, max_replicates))
+            results.extend(pool.map(run, seeds) if pool is not None else map(run, seeds))
+            if tolerance is None or len(results) >= max_replicates:
+                break
+            metrics = np.array(results, dtype=np.float64)[:, [METRICS.index(name) for name in converge_on]]
+            current = np.quantile(metrics, quantiles, axis=0)
+            if previous is not None:
+                change = np.abs(current - previous).max() / scenario['num_persons']
+                passed = passed + 1 if change <= tolerance else 0
+            previous = current
+            if passed >= patience:
+                converged = True
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    values = np.array(results, dtype=np.int64).reshape(-1, len(METRICS))
+    ensemble = {name: values[:, i] for i, name in enumerate(METRICS)}
+    ensemble['quantiles'] = {name: np.quantile(values[:, i], quantiles).tolist() for i, name in enumerate(METRICS)}
+    ensemble['replicates'] = len(values)
+    ensemble['converged'] = converged or tolerance is None
+    return ensemble
@@ -0,0 +1,238 @@
+"""
+Module for exporting the results of runs to columnar files, with an index table over all the runs of a directory.
+
+Every run is stored as its count series, one column per compartment, in one of the FORMATS:
+- 'arrow': an Arrow IPC file, read back memory mapped without copying, needs pyarrow
+- 'parquet': a compressed Parquet file, smaller but read into memory, needs pyarrow
+- 'hdf5': an HDF5 file with one contiguous dataset per column, read back memory mapped, needs h5py
+- 'npy': one .npy file per column, read back memory mapped, needs only numpy
+'auto' picks 'arrow' when pyarrow is installed and 'npy' otherwise.
+
+Next to the series, every run adds one row to the index of the directory: its id, the arguments it was run with and
+its summary metrics (see run_metrics). The index is a JSON lines file that runs append to, so many processes can write
+to one directory, and it is read into a pandas DataFrame, so tens of thousands of runs can be filtered and aggregated
+without opening a single series.
+
+Classes:
+    ResultStore: A directory of exported runs and their index.
+
+Functions:
+    available_formats: The formats that can be used here.
+    run_metrics: The summary metrics of the series of a run.
+
+Constants:
+    FORMATS: Names of the formats.
+    EXPORT_DIR: Default directory of main.py exports.
+    NUM_FREQUENCIES: Default number of dominant frequencies in the metrics.
+"""
+import importlib.util
+import json
+import os
+import uuid
+from typing import Any, Optional
+
+import numpy as np
+
+import cache
+import statistics
+
+FORMATS = ('arrow', 'parquet', 'hdf5', 'npy')
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+NUM_FREQUENCIES = 3
+
+_EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet', 'hdf5': '.h5', 'npy': ''}
+_REQUIRES = {'arrow': 'pyarrow', 'parquet': 'pyarrow', 'hdf5': 'h5py', 'npy': 'numpy'}
+_INDEX = 'index.jsonl'
+
+
+def available_formats() -> list[str]:
+    """Return the formats whose package is installed."""
+    return [name for name in FORMATS if importlib.util.find_spec(_REQUIRES[name]) is not None]
+
+
+def run_metrics(series: dict[str, Any], population: Optional[int] = None, sampling_rate: float = 300,
+                num_frequencies: int = NUM_FREQUENCIES) -> dict[str, float]:
+    """
+    Compute the summary metrics of a run as plain numbers.
+    :param series: Count of every compartment after every tick, like the result of engine.simulate
+    :param population: Total population size, the sum of the first counts if None
+    :param sampling_rate: Ticks per day, like statistics.fft_statistics
+    :param num_frequencies: Number of dominant frequencies of the infection curve to report
+    :return: dict with the ticks, peak_infected, time_to_peak, final_size (everyone no longer susceptible),
+             attack_rate, infection_rate and recovery_rate, the final count of every compartment as final_<name> and
+             the strongest frequencies of the infection curve other than its mean as frequency_<k> and amplitude_<k>
+    """
+    columns = {name: np.asarray(values) for name, values in series.items()}
+    infected = columns['infected']
+    if population is None:
+        population = int(sum(int(values[0]) for values in columns.values())) if len(infected) else 0
+    metrics: dict[str, float] = {'ticks': len(infected)}
+    if len(infected):
+        final_size = population - int(columns['susceptible'][-1])
+        metrics.update({'peak_infected': int(infected.max()), 'time_to_peak': int(infected.argmax()),
+                        'final_size': final_size, 'attack_rate': final_size / population if population else 0.0,
+                        'infection_rate': 0.0, 'recovery_rate': 0.0})
+        if len(infected) > 1 and population:  # the rates need at least two ticks and people
+            sir = statistics.sir_statistics(infected, columns.get('recovered', np.zeros(len(infected))), population)
+            metrics.update({'infection_rate': float(sir['infection_rate']),
+                            'recovery_rate': float(sir['recovery_rate'])})
+        metrics.update({f'final_{name}': int(values[-1]) for name, values in columns.items()})
+
+    # The mean is removed so the zero frequency does not always dominate, the spectrum of a real curve is symmetric
+    amplitudes, frequencies = np.zeros(0), np.zeros(0)
+    if len(infected):
+        amplitudes = np.abs(np.fft.rfft(infected - infected.mean()))
+        frequencies = np.fft.rfftfreq(len(infected), d=1 / sampling_rate)
+    strongest = np.argsort(amplitudes[1:])[::-1][:num_frequencies] + 1
+    for k in range(num_frequencies):
+        found = k < len(strongest) and amplitudes[strongest[k]] > 0
+        metrics[f'frequency_{k + 1}'] = float(frequencies[strongest[k]]) if found else float('nan')
+        metrics[f'amplitude_{k + 1}'] = float(amplitudes[strongest[k]]) if found else float('nan')
+    return metrics
+
+
+class ResultStore:
+    """
+    A directory of exported runs and their index. The series of run <id> are in series/<id> plus the extension of the
+    format, the index in index.jsonl.
+
+    Instance attributes:
+    - directory: str, where the runs are stored
+    - file_format: str, format new runs are written in, one of FORMATS
+
+    Representation Invariants:
+    - self.file_format in FORMATS
+    """
+    directory: str
+    file_format: str
+
+    def __init__(self, directory: str = EXPORT_DIR, file_format: str = 'auto') -> None:
+        if file_format == 'auto':
+            file_format = 'arrow' if 'arrow' in available_formats() else 'npy'
+        if file_format not in FORMATS:
+            raise ValueError(f'Unknown format {file_format!r}, choose from {FORMATS} or auto')
+        if file_format not in available_formats():
+            raise ValueError(f'The {file_format} format needs {_REQUIRES[file_format]}, which is not installed')
+        self.directory = directory
+        self.file_format = file_format
+        os.makedirs(os.path.join(directory, 'series'), exist_ok=True)
+
+    def _path(self, run_id: str, file_format: str) -> str:
+        return os.path.join(self.directory, 'series', run_id + _EXTENSIONS[file_format])
+
+    def write(self, config: dict, series: dict[str, Any], metrics: Optional[dict] = None,
+              population: Optional[int] = None) -> str:
+        """
+        Export a run and add it to the index.
+        :param config: The arguments the run was made with, scalar ones become index columns of their own and the
+                       others JSON text
+        :param series: Count of every compartment after every tick
+        :param metrics: Summary metrics of the run, run_metrics if None
+        :param population: Total population size for run_metrics, config['num_persons'] or the first counts if None
+        :return: the id of the run
+        """
+        run_id = uuid.uuid4().hex
+        columns = {name: np.ascontiguousarray(values) for name, values in series.items()}
+        if metrics is None:
+            metrics = run_metrics(columns, population if population is not None else config.get('num_persons'))
+        writer = {'arrow': self._write_arrow, 'parquet': self._write_parquet, 'hdf5': self._write_hdf5,
+                  'npy': self._write_npy}[self.file_format]
+        writer(self._path(run_id, self.file_format), columns)
+
+        row = {'run_id': run_id, 'format': self.file_format}
+        for name, value in cache.canonical(config).items():
+            row[name] = value if value is None or isinstance(value, (bool, int, float, str)) else json.dumps(value)
+        row.update(cache.canonical(metrics))
+        # One short line per write, appended whole, so processes exporting to the same directory do not interleave
+        with open(os.path.join(self.directory, _INDEX), 'a') as file:
+            file.write(json.dumps(row) + '\n')
+        return run_id
+
+    def index(self) -> Any:
+        """Return the index of every run as a pandas DataFrame, one row per run."""
+        import pandas as pd
+
+        path = os.path.join(self.directory, _INDEX)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return pd.DataFrame(columns=['run_id', 'format'])
+        return pd.read_json(path, lines=True, dtype=False)
+
+    def load(self, run_id: str, file_format: Optional[str] = None) -> dict[str, np.ndarray]:
+        """
+        Read the series of a run, memory mapped without copying for the arrow, hdf5 and npy formats.
+        :param file_format: Format of the run, looked up in the index if None
+        """
+        if file_format is None:
+            rows = self.index()
+            rows = rows[rows['run_id'] == run_id]
+            if rows.empty:
+                raise KeyError(f'No run {run_id}')
+            file_format = rows['format'].iloc[0]
+        reader = {'arrow': self._read_arrow, 'parquet': self._read_parquet, 'hdf5': self._read_hdf5,
+                  'npy': self._read_npy}[file_format]
+        return reader(self._path(run_id, file_format))
+
+    @staticmethod
+    def _write_arrow(path: str, columns: dict[str, np.ndarray]) -> None:
+        import pyarrow as pa
+
+        table = pa.table(columns)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    @staticmethod
+    def _read_arrow(path: str) -> dict[str, np.ndarray]:
+        import pyarrow as pa
+
+        # The arrays keep the memory map open. A file of one record batch, as written by _write_arrow, is read without
+        # copying, the batches of other files are joined into one array per column
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return {name: table.column(name).combine_chunks().to_numpy(zero_copy_only=True) for name in table.column_names}
+
+    @staticmethod
+    def _write_parquet(path: str, columns: dict[str, np.ndarray]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(columns), path)
+
+    @staticmethod
+    def _read_parquet(path: str) -> dict[str, np.ndarray]:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, memory_map=True)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    @staticmethod
+    def _write_hdf5(path: str, columns: dict[str, np.ndarray]) -> None:
+        import h5py
+
+        with h5py.File(path, 'w', track_order=True) as file:  # the columns are read back in the order written
+            for name, values in columns.items():
+                file.create_dataset(name, data=values)  # contiguous, so it can be memory mapped
+
+    @staticmethod
+    def _read_hdf5(path: str) -> dict[str, np.ndarray]:
+        import h5py
+
+        columns = {}
+        with h5py.File(path, 'r') as file:
+            for name, dataset in file.items():
+                offset = dataset.id.get_offset()
+                columns[name] = dataset[()] if offset is None else \
+                    np.memmap(path, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+        return columns
+
+    @staticmethod
+    def _write_npy(path: str, columns: dict[str, np.ndarray]) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(path, f'{name}.npy'), values)
+        with open(os.path.join(path, 'columns.json'), 'w') as file:
+            json.dump(list(columns), file)
+
+    @staticmethod
+    def _read_npy(path: str) -> dict[str, np.ndarray]:
+        with open(os.path.join(path, 'columns.json')) as file:
+            names = json.load(file)
+        return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
@@ -4,15 +4,25 @@ This module provides functions to read data from a CSV file and calculate global
 from the data. It also includes functionality to calculate infection rate, mortality rate, and recovery rate for each country
 present in the dataset.
 
+The module level values global_infect, global_mortality, global_recovery and df are computed the first time they are
+accessed, so importing this module does not import pandas or read the data file.
+
 Functions:
     calculate_global_rates: Calculate global infection rate, mortality rate, and recovery rate from the provided CSV file.
+    country_rates: Read the data file and add the infection, mortality and recovery rate of each country.
 """
-import pandas as pd
+import functools
+import os
+from typing import Any
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worldometer_data.csv')
 
 
 def calculate_global_rates(csv_file) -> tuple[float, float, float]:
     """Made a function to read from all the data in the file and give the global infection, mortality and recovery rate
        of all countries in dataset"""
+    import pandas as pd
+
     reader = pd.read_csv(csv_file)
     global_total_cases = reader['TotalCases'].sum()
     global_population = reader['Population'].sum()
@@ -25,14 +35,40 @@ def calculate_global_rates(csv_file) -> tuple[float, float, float]:
     return global_infection_rate, global_mortality_rate, global_recovery_rate
 
 
-global_infect, global_mortality, global_recovery = calculate_global_rates('worldometer_data.csv')
-print("Global Infection Rate:", global_infect)
-print("Global Recovery Rate:", global_recovery)
-print("Global Mortality Rate:", global_mortality)
-# Country wise Data
-df = pd.read_csv('worldometer_data.csv')
-df['Infection Rate'] = df['TotalCases'] / df['Population']
-df['Mortality Rate'] = df['TotalDeaths'] / df['TotalCases']
-df['Recovery Rate'] = df['TotalRecovered'] / df['TotalCases']
-# print(df[['Country/Region', 'Infection Rate', 'Mortality Rate', 'Recovery Rate']])
-# uncomment above line to get country wise stats.'''
+def country_rates(csv_file=DATA_FILE) -> Any:
+    """Country wise Data, returns a pandas DataFrame with an Infection, Mortality and Recovery Rate column"""
+    import pandas as pd
+
+    df = pd.read_csv(csv_file)
+    df['Infection Rate'] = df['TotalCases'] / df['Population']
+    df['Mortality Rate'] = df['TotalDeaths'] / df['TotalCases']
+    df['Recovery Rate'] = df['TotalRecovered'] / df['TotalCases']
+    return df
+
+
+@functools.lru_cache(maxsize=None)
+def _global_rates() -> tuple[float, float, float]:
+    return calculate_global_rates(DATA_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def _country_rates() -> Any:
+    return country_rates(DATA_FILE)
+
+
+def __getattr__(name: str) -> Any:
+    """Compute global_infect, global_mortality, global_recovery and df on first access."""
+    if name in ('global_infect', 'global_mortality', 'global_recovery'):
+        return _global_rates()[('global_infect', 'global_mortality', 'global_recovery').index(name)]
+    if name == 'df':
+        return _country_rates()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    global_infect, global_mortality, global_recovery = _global_rates()
+    print("Global Infection Rate:", global_infect)
+    print("Global Recovery Rate:", global_recovery)
+    print("Global Mortality Rate:", global_mortality)
+    # print(_country_rates()[['Country/Region', 'Infection Rate', 'Mortality Rate', 'Recovery Rate']])
+    # uncomment above line to get country wise stats.
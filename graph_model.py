@@ -23,8 +23,6 @@ Example:
 """
 from typing import Any, Iterator
 
-import python_ta
-
 
 class Graph:
     """A class for representing an undirected graph."""
@@ -189,6 +187,8 @@ class Graph:
 
 
 if __name__ == "__main__":
+    import python_ta
+
     python_ta.check_all(config={
         'max-line-length': 170,
         'disable': ['E1136', 'W0221'],
@@ -0,0 +1,292 @@
+"""
+Module for instrumenting the simulation loop.
+
+This module provides named phase timers, per-tick counters and profiler toggles for the main loop. Every finished tick
+is stored as one record in an in-memory ring buffer that can be exported to CSV or JSON, periodically or on demand,
+and summarised in an overlay on the pygame window.
+
+Instrumentation is switched off by using NullInstrumentation, which has the same interface but does nothing, so the
+loop does not need to check whether it is enabled.
+
+Classes:
+    Instrumentation: Records phase timings and counters of each tick in a ring buffer.
+    NullInstrumentation: Drop-in replacement that records nothing.
+    SamplingProfiler: Periodically samples the stack of a thread and counts the functions found on top.
+
+Functions:
+    create_instrumentation: Create an Instrumentation or a NullInstrumentation.
+"""
+import cProfile
+import collections
+import csv
+import itertools
+import json
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+
+class _Phase:
+    """Context manager adding the time spent inside it to one phase of the current tick."""
+    name: str
+    totals: dict[str, float]
+    start: float
+
+    def __init__(self, name: str, totals: dict[str, float]) -> None:
+        self.name = name
+        self.totals = totals
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.totals[self.name] = self.totals.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class _NullPhase:
+    """Context manager that does nothing."""
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples the stack of one thread from a background thread.
+
+    Instance attributes:
+    - interval: float, seconds between two samples
+    - samples: collections.Counter, how many times each (file, line, function) was found on top of the stack
+    """
+    interval: float
+    samples: collections.Counter
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start sampling the thread that called this method."""
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                code = frame.f_code
+                self.samples[(code.co_filename, frame.f_lineno, code.co_name)] += 1
+
+    def report(self, limit: int = 15) -> str:
+        """Return the most frequently sampled locations as text."""
+        total = sum(self.samples.values()) or 1
+        lines = [f'{count / total:7.1%}  {name} ({filename}:{line})'
+                 for (filename, line, name), count in self.samples.most_common(limit)]
+        return '\n'.join(lines)
+
+
+class Instrumentation:
+    """
+    Records the time spent in each named phase and the counters of every tick.
+
+    Instance attributes:
+    - enabled: bool, always True, lets callers skip work that only feeds the instrumentation
+    - records: collections.deque, ring buffer of finished tick records, the oldest are dropped first
+    - export_path: str, file the buffer is exported to, CSV or JSON depending on its extension
+    - export_every: int, export the buffer every this many ticks, 0 to only export on demand
+    - tick: int, the number of ticks finished so far
+
+    Representation Invariants:
+    - export_every >= 0
+    """
+    enabled: bool
+    records: collections.deque
+    export_path: Optional[str]
+    export_every: int
+    tick: int
+
+    def __init__(self, capacity: int = 3000, export_path: Optional[str] = None, export_every: int = 0) -> None:
+        self.enabled = True
+        self.records = collections.deque(maxlen=capacity)
+        self.export_path = export_path
+        self.export_every = export_every
+        self.tick = 0
+        self._times = {}
+        self._counters = {}
+        self._phases = {}
+        self._tick_start = time.perf_counter()
+        self._profiler = None
+
+    def phase(self, name: str) -> _Phase:
+        """
+        Return a context manager timing the named phase, use: 'with instrumentation.phase("move"):'
+        A phase entered several times in one tick is summed.
+        """
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(name, self._times)
+        return phase
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add amount to the named counter of the current tick."""
+        self._counters[name] = self._counters.get(name, 0) + amount
+
+    def end_tick(self) -> dict:
+        """
+        Finish the current tick, store its record in the ring buffer and export the buffer if it is due.
+        :return: the record of the finished tick
+        """
+        now = time.perf_counter()
+        record = {'tick': self.tick, 'frame_s': now - self._tick_start}
+        record.update({f'{name}_s': seconds for name, seconds in self._times.items()})
+        record.update(self._counters)
+        self.records.append(record)
+
+        self._times.clear()
+        self._counters.clear()
+        self._tick_start = now
+        self.tick += 1
+        if self.export_every and self.export_path and self.tick % self.export_every == 0:
+            self.export(self.export_path)
+        return record
+
+    def summary(self, last: int = 60) -> dict[str, float]:
+        """Return the mean of every recorded column over the last ticks."""
+        # Walk back from the newest record instead of copying the whole ring buffer, this runs every frame
+        recent = list(itertools.islice(reversed(self.records), last))
+        totals = collections.defaultdict(float)
+        for record in recent:
+            for key, value in record.items():
+                if key != 'tick':
+                    totals[key] += value
+        return {key: value / len(recent) for key, value in totals.items()}
+
+    def export(self, path: str) -> None:
+        """Write the ring buffer to a .json file, or a .csv file for any other extension."""
+        if path.endswith('.json'):
+            self.export_json(path)
+        else:
+            self.export_csv(path)
+
+    def export_csv(self, path: str) -> None:
+        """Write the ring buffer to a CSV file, one row per tick."""
+        columns = ['tick']
+        for record in self.records:
+            columns.extend(key for key in record if key not in columns)
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def export_json(self, path: str) -> None:
+        """Write the ring buffer to a JSON file as a list of records."""
+        with open(path, 'w') as file:
+            json.dump(list(self.records), file)
+
+    def toggle_profiler(self, kind: str = 'cprofile', output: Optional[str] = None) -> bool:
+        """
+        Start a profiler if none is running, otherwise stop it and print its report.
+        :param kind: 'cprofile' for a deterministic profile or 'sampling' for the low overhead sampling profiler
+        :param output: file the cProfile stats are dumped to when it is stopped
+        :return: True if a profiler is running after the call
+        """
+        if self._profiler is None:
+            self._profiler = cProfile.Profile() if kind == 'cprofile' else SamplingProfiler()
+            if isinstance(self._profiler, cProfile.Profile):
+                self._profiler.enable()
+            else:
+                self._profiler.start()
+            return True
+
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            if output:
+                self._profiler.dump_stats(output)
+            pstats.Stats(self._profiler).sort_stats('cumulative').print_stats(15)
+        else:
+            self._profiler.stop()
+            print(self._profiler.report())
+        self._profiler = None
+        return False
+
+    def close(self, path: Optional[str] = None) -> None:
+        """Stop any running profiler and export the ring buffer to path, or to export_path if path is None."""
+        if self._profiler is not None:
+            self.toggle_profiler()
+        path = path or self.export_path
+        if path:
+            self.export(path)
+
+    def draw_overlay(self, screen: Any, font: Any, position: tuple[int, int] = (10, 130)) -> None:
+        """
+        Draw the mean phase timings and counters of the last ticks on a pygame surface.
+        :param screen: pygame.Surface to draw on
+        :param font: pygame.font.Font used to render the text
+        """
+        x, y = position
+        summary = self.summary()
+        frame = summary.get('frame_s', 0.0)
+        lines = [f'frame {frame * 1000:.2f} ms ({1 / frame if frame else 0:.0f} fps)']
+        lines += [f'{key[:-2]} {value * 1000:.2f} ms' for key, value in summary.items()
+                  if key.endswith('_s') and key != 'frame_s']
+        lines += [f'{key} {value:.1f}' for key, value in summary.items() if not key.endswith('_s')]
+        if self._profiler is not None:
+            lines.append('profiling...')
+        for line in lines:
+            screen.blit(font.render(line, True, (255, 255, 0)), (x, y))
+            y += 16
+
+
+class NullInstrumentation:
+    """Instrumentation that records nothing, used when instrumentation is disabled."""
+    enabled: bool = False
+
+    def phase(self, name: str) -> _NullPhase:
+        """Return a context manager that does nothing."""
+        return _NULL_PHASE
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Do nothing."""
+
+    def end_tick(self) -> None:
+        """Do nothing."""
+
+    def export(self, path: str) -> None:
+        """Do nothing."""
+
+    def close(self, path: Optional[str] = None) -> None:
+        """Do nothing."""
+
+    def draw_overlay(self, screen: Any, font: Any, position: tuple[int, int] = (10, 130)) -> None:
+        """Do nothing."""
+
+
+def create_instrumentation(enabled: bool, **kwargs: Any) -> Any:
+    """
+    Create the instrumentation for a run.
+    :param enabled: Whether anything should be recorded
+    :param kwargs: Passed on to Instrumentation
+    :return: Instrumentation or NullInstrumentation
+    """
+    return Instrumentation(**kwargs) if enabled else NullInstrumentation()
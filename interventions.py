@@ -0,0 +1,261 @@
+"""
+Module for switching preventions on and off while a simulation runs.
+
+An Intervention is a prevention with an optional start and stop Condition, like "lockdown when more than 10% are
+infected and lift it below 2%" or "masks from tick 500 to tick 1500". A Scheduler checks the conditions of every
+intervention against the counters the simulation already keeps, which costs the same whatever the population size.
+Only when an intervention is activated or released does it touch the population, in one batched update of the speed
+and infection probability columns (see the policies module).
+
+Social distancing and infection tracing act on every tick, the scheduler only tells whether they are active.
+
+Classes:
+    Condition: A comparison of a counter of the simulation with a threshold.
+    Intervention: A prevention with the conditions that activate and release it.
+    Scheduler: Activate and release interventions and apply their effects.
+
+Functions:
+    parse_intervention: Create an Intervention from a name, a severity and condition strings.
+    schedule: Create a Scheduler from Intervention objects or tuples.
+
+Constants:
+    COUNTERS: Names a Condition can compare.
+    PER_TICK: Preventions that act on every tick instead of being a policy.
+"""
+import operator
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+import policies
+
+COUNTERS = ('tick', 'susceptible', 'infected', 'recovered')
+PER_TICK = ('social distancing', 'infection tracing')
+
+_OPERATORS: dict[str, Callable[[float, float], bool]] = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+
+class Condition:
+    """
+    A comparison of a counter with a threshold, e.g. Condition('infected', '>', 0.1).
+    The compartment counters are compared as a fraction of the population, the tick as a number.
+
+    Instance attributes:
+    - counter: str, name of the compared counter
+    - comparison: str, one of '>', '>=', '<' and '<='
+    - value: float, threshold
+
+    Representation Invariants:
+    - self.counter in COUNTERS
+    - self.comparison in _OPERATORS
+    """
+    counter: str
+    comparison: str
+    value: float
+
+    def __init__(self, counter: str, comparison: str, value: float) -> None:
+        if counter not in COUNTERS:
+            raise ValueError(f'Unknown counter {counter!r}, choose from {COUNTERS}')
+        if comparison not in _OPERATORS:
+            raise ValueError(f'Unknown comparison {comparison!r}, choose from {tuple(_OPERATORS)}')
+        self.counter = counter
+        self.comparison = comparison
+        self.value = value
+
+    @classmethod
+    def parse(cls, text: str) -> 'Condition':
+        """
+        Create a Condition from text like 'infected > 0.1', 'infected > 10%' or 'tick >= 500'.
+        """
+        for comparison in _OPERATORS:  # two character comparisons are tried first
+            counter, found, value = text.partition(comparison)
+            if found:
+                value = value.strip()
+                number = float(value[:-1]) / 100 if value.endswith('%') else float(value)
+                return cls(counter.strip().lower(), comparison, number)
+        raise ValueError(f'No comparison in condition {text!r}')
+
+    def __repr__(self) -> str:
+        return f'{self.counter} {self.comparison} {self.value:g}'
+
+
+class Intervention:
+    """
+    A prevention with the conditions that activate and release it.
+
+    Instance attributes:
+    - name: str, a policy name (see policies.policy_names) or one of PER_TICK
+    - severity: float, severity of the policy, like in main.get_prevention_severity
+    - start: Condition activating the intervention, active from the start if None
+    - stop: Condition releasing the intervention, never released if None
+
+    Representation Invariants:
+    - self.name in policies.policy_names() or self.name in PER_TICK
+    """
+    name: str
+    severity: float
+    start: Optional[Condition]
+    stop: Optional[Condition]
+
+    def __init__(self, name: str, severity: float = 1.0, start: Optional[Condition] = None,
+                 stop: Optional[Condition] = None) -> None:
+        if name not in policies.policy_names() and name not in PER_TICK:
+            raise ValueError(f'Unknown prevention {name!r}, choose from {policies.policy_names() + list(PER_TICK)}')
+        self.name = name
+        self.severity = severity
+        self.start = start
+        self.stop = stop
+
+    def __repr__(self) -> str:
+        return f'Intervention({self.name!r}, {self.severity}, start={self.start}, stop={self.stop})'
+
+
+def parse_intervention(name: str, severity: float = 1.0, start: str = '', stop: str = '') -> Intervention:
+    """
+    Create an Intervention, the conditions are given as text (see Condition.parse) and empty text means no condition.
+    """
+    return Intervention(name, severity, Condition.parse(start) if start.strip() else None,
+                        Condition.parse(stop) if stop.strip() else None)
+
+
+class Scheduler:
+    """
+    Activate and release interventions as a simulation runs.
+
+    The effect of every policy is composed once, so the same people stay vaccinated or masked every time it is
+    active. The speed and infection probability of every person are kept the first time the scheduler is applied,
+    and whenever the active interventions change they are set to these base values times the factors of the active
+    policies, so releasing a policy restores the people exactly. Only the size of the speed is kept, people go on in
+    the direction they are heading at the time, which mobility models that turn people change.
+
+    Instance attributes:
+    - interventions: list of the scheduled Intervention
+    - active: list, True for every intervention that is active
+    - num_persons: int, size of the population
+
+    Representation Invariants:
+    - len(self.active) == len(self.interventions)
+    """
+    interventions: list[Intervention]
+    active: list[bool]
+    num_persons: int
+    _thresholds: list[tuple[Optional[Callable], Optional[Callable]]]
+    _effects: list[Optional[policies.Effect]]
+    _base: Optional[dict[str, np.ndarray]]
+
+    def __init__(self, interventions: list[Intervention], num_persons: int,
+                 rng: Optional[np.random.Generator] = None) -> None:
+        rng = rng if rng is not None else np.random.default_rng()
+        self.interventions = list(interventions)
+        self.active = [False] * len(self.interventions)
+        self.num_persons = num_persons
+        self._thresholds = [(self._check(intervention.start), self._check(intervention.stop))
+                            for intervention in self.interventions]
+        self._effects = [None if intervention.name in PER_TICK
+                         else policies.compose(num_persons, [intervention.name], [intervention.severity], rng)
+                         for intervention in self.interventions]
+        self._base = None
+
+    def _check(self, condition: Optional[Condition]) -> Optional[Callable[[int, dict[str, int]], bool]]:
+        """Turn a condition into a function of the tick and the counters, with the threshold as a count."""
+        if condition is None:
+            return None
+        compare = _OPERATORS[condition.comparison]
+        if condition.counter == 'tick':
+            return lambda tick, counts: compare(tick, condition.value)
+        threshold = condition.value * self.num_persons
+        return lambda tick, counts: compare(counts[condition.counter], threshold)
+
+    def update(self, tick: int, counts: dict[str, int]) -> bool:
+        """
+        Activate and release interventions for the coming tick. An active intervention is released when its
+        stop condition holds, an inactive one is activated when its start condition holds and its stop condition does
+        not, so a finished time window does not open again.
+        :param tick: The tick about to be simulated, 0 before the first one
+        :param counts: Number of susceptible, infected and recovered people
+        :return: if an intervention was activated or released
+        """
+        changed = False
+        for i, (start, stop) in enumerate(self._thresholds):
+            stopped = stop is not None and stop(tick, counts)
+            if self.active[i] and stopped:
+                self.active[i] = False
+                changed = True
+            elif not self.active[i] and not stopped and (start is None or start(tick, counts)):
+                self.active[i] = True
+                changed = True
+        return changed
+
+    def is_active(self, name: str) -> bool:
+        """Return if an intervention with the given name is active."""
+        return any(active and intervention.name == name
+                   for intervention, active in zip(self.interventions, self.active))
+
+    def active_names(self) -> list[str]:
+        """Return the names of the active interventions."""
+        return [intervention.name for intervention, active in zip(self.interventions, self.active) if active]
+
+    def factors(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the speed and infection probability factor of every person for the active policies."""
+        speed = np.ones(self.num_persons)
+        probability = np.ones(self.num_persons)
+        for effect, active in zip(self._effects, self.active):
+            if active and effect is not None:
+                speed *= effect.speed
+                probability *= effect.probability
+        return speed, probability
+
+    def _rescale(self, columns: dict[str, np.ndarray]) -> None:
+        """Set the speed and probability columns in place to the base values times the active factors."""
+        if self._base is None:
+            self._base = {'speed': np.hypot(columns['speed_x'], columns['speed_y']),
+                          'heading_x': np.ones(len(columns['speed_x'])),
+                          'heading_y': np.zeros(len(columns['speed_y'])),
+                          'infection_probability': columns['infection_probability'].copy()}
+        base = self._base
+        # People keep the heading they turned or bounced into, a stopped person keeps the one it had
+        current = np.hypot(columns['speed_x'], columns['speed_y'])
+        moving = current > 0
+        base['heading_x'][moving] = columns['speed_x'][moving] / current[moving]
+        base['heading_y'][moving] = columns['speed_y'][moving] / current[moving]
+        speed, probability = self.factors()
+        columns['speed_x'][:] = base['heading_x'] * base['speed'] * speed
+        columns['speed_y'][:] = base['heading_y'] * base['speed'] * speed
+        columns['infection_probability'][:] = base['infection_probability'] * probability
+
+    def apply(self, population: Any) -> None:
+        """
+        Set the columns of an engine.Population for the active policies. The first call also records the base values.
+        """
+        self._rescale({'speed_x': population.speed_x, 'speed_y': population.speed_y,
+                       'infection_probability': population.infection_probability})
+
+    def apply_to_graph(self, people: Any) -> None:
+        """
+        Set the Person objects of a graph_model.Graph built by logic.community for the active policies.
+        The first call also records the base values.
+        """
+        persons = list(people.nodes.values())
+        columns = {name: np.array([getattr(person, name) for person in persons], dtype=np.float64)
+                   for name in ('speed_x', 'speed_y', 'infection_probability')}
+        self._rescale(columns)
+        for person, speed_x, speed_y, probability in zip(persons, columns['speed_x'].tolist(),
+                                                         columns['speed_y'].tolist(),
+                                                         columns['infection_probability'].tolist()):
+            person.speed_x = speed_x
+            person.speed_y = speed_y
+            person.infection_probability = probability
+
+
+def schedule(interventions: list[Union[Intervention, tuple]], num_persons: int,
+             rng: Optional[np.random.Generator] = None) -> Scheduler:
+    """
+    Create a Scheduler from Intervention objects or (name, severity[, start[, stop]]) tuples with text conditions.
+    """
+    return Scheduler([intervention if isinstance(intervention, Intervention) else parse_intervention(*intervention)
+                      for intervention in interventions], num_persons, rng)
@@ -0,0 +1,311 @@
+"""
+Module for the kernels of the hot loops of the array engine.
+
+The loops that are hard to express as numpy broadcasting (pairs of people in neighbouring grid cells, spreading the
+infection over the contacts, pushing people apart for social distancing) are implemented by interchangeable
+backends, selected at run time by name:
+- 'numpy': vectorised with numpy, materialises every candidate pair of neighbouring cells before filtering them
+- 'numba': the same grid walked with explicit loops compiled by Numba, only the pairs in contact are stored,
+  available when numba is installed
+- 'python': plain Python loops over every pair of people, slow, kept as the reference the others are verified against
+- 'auto': 'numba' when it is available, 'numpy' otherwise
+
+Every backend gets its random numbers from the caller and accumulates in the same order, so all of them give
+identical results for the same seed.
+
+Classes:
+    NumpyKernels: Vectorised numpy backend.
+    NumbaKernels: Backend compiled with Numba.
+    PythonKernels: Reference backend in pure Python.
+
+Functions:
+    register_backend: Register a kernel backend under a name.
+    available_backends: Return the names of the backends that can be used here.
+    get_kernels: Return the kernels of a backend.
+"""
+import importlib.util
+from typing import Any, Callable
+
+import numpy as np
+
+# Offsets of the neighbouring grid cells searched for contacts, half of the 3x3 neighbourhood so that every pair of
+# neighbouring cells is visited once; (0, 0) pairs each person with the people after it in the same cell
+_STENCIL = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+_BACKENDS: dict[str, Callable[[], Any]] = {}
+_INSTANCES: dict[str, Any] = {}
+
+
+def register_backend(name: str) -> Callable:
+    """
+    Register a class of kernels under a name, it is instantiated the first time the backend is used.
+    :param name: Name of the backend
+    :return: decorator
+    """
+    def decorator(cls: Callable[[], Any]) -> Callable[[], Any]:
+        _BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+def available_backends() -> list[str]:
+    """Return the names of the backends that can be used in this environment."""
+    return [name for name, cls in _BACKENDS.items() if getattr(cls, 'available', lambda: True)()]
+
+
+def get_kernels(backend: str = 'numpy') -> Any:
+    """
+    Return the kernels of a backend.
+    :param backend: Name of a registered backend, or 'auto'
+    :return: object with contact_pairs, spread and repel methods
+    """
+    if backend == 'auto':
+        backend = 'numba' if 'numba' in available_backends() else 'numpy'
+    if backend not in _INSTANCES:
+        if backend not in _BACKENDS:
+            raise ValueError(f'Unknown kernel backend {backend!r}, choose from {sorted(_BACKENDS)} or auto')
+        _INSTANCES[backend] = _BACKENDS[backend]()
+    return _INSTANCES[backend]
+
+
+def _cell_ranges(x: np.ndarray, y: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort people into square cells of side radius.
+    :return: the order that sorts people by cell, and for every offset of _STENCIL and every person in that order the
+             range [lo, hi) of sorted positions of the people to compare it with
+    """
+    cx = np.floor((x - x.min()) / radius).astype(np.int64)
+    cy = np.floor((y - y.min()) / radius).astype(np.int64)
+    num_cx = int(cx.max()) + 1
+    cell = cy * num_cx + cx
+    order = np.argsort(cell, kind='stable')
+    cell, cx = cell[order], cx[order]
+
+    lo = np.empty((len(_STENCIL), len(x)), dtype=np.int64)
+    hi = np.empty_like(lo)
+    lo[0] = np.arange(1, len(x) + 1)
+    hi[0] = np.searchsorted(cell, cell, side='right')
+    for k, (dx, dy) in enumerate(_STENCIL[1:], 1):
+        neighbour = cell + dy * num_cx + dx
+        lo[k] = np.searchsorted(cell, neighbour, side='left')
+        hi[k] = np.searchsorted(cell, neighbour, side='right')
+        outside = (cx + dx < 0) | (cx + dx >= num_cx)
+        hi[k, outside] = lo[k, outside]
+    return order, lo, hi
+
+
+def _canonical(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sort pairs by their first and then their second person."""
+    order = np.lexsort((b, a))
+    return a[order], b[order]
+
+
+def _grid_pairs_loop(xs: np.ndarray, ys: np.ndarray, lo: np.ndarray, hi: np.ndarray, radius_sq: float,
+                     out_a: np.ndarray, out_b: np.ndarray) -> int:
+    """
+    Write the pairs in contact into out_a and out_b as far as they fit.
+    :return: the number of pairs in contact, which may be larger than the output arrays
+    """
+    count = 0
+    capacity = len(out_a)
+    for k in range(lo.shape[0]):
+        for p in range(len(xs)):
+            for q in range(lo[k, p], hi[k, p]):
+                dx = xs[p] - xs[q]
+                dy = ys[p] - ys[q]
+                if dx * dx + dy * dy < radius_sq:
+                    if count < capacity:
+                        out_a[count] = p
+                        out_b[count] = q
+                    count += 1
+    return count
+
+
+def _spread_loop(infected: np.ndarray, recovered: np.ndarray, infection_probability: np.ndarray,
+                 infectiousness: np.ndarray, susceptibility: np.ndarray, a: np.ndarray, b: np.ndarray,
+                 draws: np.ndarray, hit: np.ndarray) -> None:
+    """Mark in hit every susceptible person infected by one of the pairs."""
+    for k in range(len(a)):
+        i, j = a[k], b[k]
+        if infected[i] and not (infected[j] or recovered[j]) \
+                and draws[k] < infection_probability[i] * infectiousness[i] * susceptibility[j]:
+            hit[j] = True
+        elif infected[j] and not (infected[i] or recovered[i]) \
+                and draws[k] < infection_probability[j] * infectiousness[j] * susceptibility[i]:
+            hit[i] = True
+
+
+def _repel_loop(x: np.ndarray, y: np.ndarray, a: np.ndarray, b: np.ndarray, threshold: float,
+                width: float, height: float, shift_x: np.ndarray, shift_y: np.ndarray) -> None:
+    """Accumulate the social distancing pushes of the pairs, first on the first people, then on the second."""
+    for first in (True, False):
+        for k in range(len(a)):
+            i, j = a[k], b[k]
+            dx = x[j] - x[i]
+            dy = y[j] - y[i]
+            distance = np.sqrt(dx * dx + dy * dy)
+            if distance == 0:
+                move_x, move_y = threshold / 2, 0.0
+            else:
+                move_x = (threshold - distance) * (dx / distance) / 2
+                move_y = (threshold - distance) * (dy / distance) / 2
+            if 0 <= x[i] - move_x <= width and 0 <= x[j] + move_x <= width:
+                if first:
+                    shift_x[i] -= move_x
+                else:
+                    shift_x[j] += move_x
+            if 0 <= y[i] - move_y <= height and 0 <= y[j] + move_y <= height:
+                if first:
+                    shift_y[i] -= move_y
+                else:
+                    shift_y[j] += move_y
+
+
+@register_backend('numpy')
+class NumpyKernels:
+    """Kernels vectorised with numpy."""
+
+    def contact_pairs(self, x: np.ndarray, y: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find every pair of people closer than radius, the vectorised equivalent of checking every edge of the
+        community. Only people in the same or neighbouring cells of a grid are compared.
+        :param x: x positions
+        :param y: y positions
+        :param radius: Contact distance, pairs at exactly this distance are not in contact
+        :return: two index arrays a, b with a[k] < b[k] for every pair in contact, in no particular order
+        """
+        if len(x) < 2 or radius <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        order, lo, hi = _cell_ranges(x, y, radius)
+        counts = (hi - lo).ravel()
+        first = np.repeat(np.tile(np.arange(len(x)), len(_STENCIL)), counts)
+        second = np.repeat(lo.ravel() - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+        xs, ys = x[order], y[order]
+        close = (xs[first] - xs[second]) ** 2 + (ys[first] - ys[second]) ** 2 < radius ** 2
+        a, b = order[first[close]], order[second[close]]
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def spread(self, infected: np.ndarray, recovered: np.ndarray, infection_probability: np.ndarray,
+               infectiousness: np.ndarray, susceptibility: np.ndarray, a: np.ndarray, b: np.ndarray,
+               draws: np.ndarray) -> np.ndarray:
+        """
+        Decide which susceptible people are infected by the pairs in contact, on the state at the start of the tick.
+        An infected person i infects a susceptible contact j with probability infection_probability[i] *
+        infectiousness[i] * susceptibility[j].
+        The arrays may be the full population columns or a gathered subset of them, as long as a and b index into them.
+        :param a, b: People in contact
+        :param draws: Uniform random number of each pair
+        :return: sorted indices of the newly infected people, without duplicates
+        """
+        susceptible = ~(infected | recovered)
+        a_infects_b = infected[a] & susceptible[b] & (draws < infection_probability[a] * infectiousness[a]
+                                                      * susceptibility[b])
+        b_infects_a = infected[b] & susceptible[a] & (draws < infection_probability[b] * infectiousness[b]
+                                                      * susceptibility[a])
+        return np.unique(np.concatenate((b[a_infects_b], a[b_infects_a])))
+
+    def repel(self, x: np.ndarray, y: np.ndarray, a: np.ndarray, b: np.ndarray, threshold: float,
+              width: float, height: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Push every pair closer than threshold apart like preventions.social_distance, on the positions at the start
+        of the tick: each pair is moved half the missing distance each way along the line between them, on each axis
+        only if both stay inside the world.
+        :param a, b: Pairs closer than threshold
+        :return: the total x and y shift of every person
+        """
+        a, b = _canonical(a, b)
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        distance = np.sqrt(dx * dx + dy * dy)
+        apart = distance > 0
+        safe = np.where(apart, distance, 1.0)
+        move_x = np.where(apart, (threshold - distance) * (dx / safe) / 2, threshold / 2)
+        move_y = np.where(apart, (threshold - distance) * (dy / safe) / 2, 0.0)
+
+        shifts = []
+        for position, move, limit in ((x, move_x, width), (y, move_y, height)):
+            inside = ((0 <= position[a] - move) & (position[a] - move <= limit)
+                      & (0 <= position[b] + move) & (position[b] + move <= limit))
+            shifts.append(np.bincount(np.concatenate((a[inside], b[inside])),
+                                      np.concatenate((-move[inside], move[inside])), minlength=len(x)))
+        return shifts[0], shifts[1]
+
+
+@register_backend('numba')
+class NumbaKernels:
+    """Kernels compiled with Numba, the loops are the same functions the python backend runs interpreted."""
+
+    @staticmethod
+    def available() -> bool:
+        """Return whether numba is installed."""
+        return importlib.util.find_spec('numba') is not None
+
+    def __init__(self) -> None:
+        import numba
+
+        self._grid_pairs = numba.njit(cache=True)(_grid_pairs_loop)
+        self._spread = numba.njit(cache=True)(_spread_loop)
+        self._repel = numba.njit(cache=True)(_repel_loop)
+
+    def contact_pairs(self, x: np.ndarray, y: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """See NumpyKernels.contact_pairs."""
+        if len(x) < 2 or radius <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        order, lo, hi = _cell_ranges(x, y, radius)
+        xs, ys = np.ascontiguousarray(x[order]), np.ascontiguousarray(y[order])
+        out_a = np.empty(4 * len(x), dtype=np.int64)
+        out_b = np.empty_like(out_a)
+        count = self._grid_pairs(xs, ys, lo, hi, radius ** 2, out_a, out_b)
+        if count > len(out_a):
+            out_a = np.empty(count, dtype=np.int64)
+            out_b = np.empty_like(out_a)
+            self._grid_pairs(xs, ys, lo, hi, radius ** 2, out_a, out_b)
+        a, b = order[out_a[:count]], order[out_b[:count]]
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def spread(self, infected: np.ndarray, recovered: np.ndarray, infection_probability: np.ndarray,
+               infectiousness: np.ndarray, susceptibility: np.ndarray, a: np.ndarray, b: np.ndarray,
+               draws: np.ndarray) -> np.ndarray:
+        """See NumpyKernels.spread."""
+        hit = np.zeros(len(infected), dtype=np.bool_)
+        self._spread(infected, recovered, infection_probability, infectiousness, susceptibility, a, b, draws, hit)
+        return np.flatnonzero(hit)
+
+    def repel(self, x: np.ndarray, y: np.ndarray, a: np.ndarray, b: np.ndarray, threshold: float,
+              width: float, height: float) -> tuple[np.ndarray, np.ndarray]:
+        """See NumpyKernels.repel."""
+        a, b = _canonical(a, b)
+        shift_x, shift_y = np.zeros(len(x)), np.zeros(len(x))
+        self._repel(x, y, a, b, float(threshold), float(width), float(height), shift_x, shift_y)
+        return shift_x, shift_y
+
+
+@register_backend('python')
+class PythonKernels:
+    """Reference kernels in plain Python, every pair of people is checked like in logic.community."""
+
+    def contact_pairs(self, x: np.ndarray, y: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """See NumpyKernels.contact_pairs."""
+        xs, ys = x.tolist(), y.tolist()
+        pairs = [(i, j) for i in range(len(xs)) for j in range(i + 1, len(xs))
+                 if (xs[i] - xs[j]) ** 2 + (ys[i] - ys[j]) ** 2 < radius ** 2]
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def spread(self, infected: np.ndarray, recovered: np.ndarray, infection_probability: np.ndarray,
+               infectiousness: np.ndarray, susceptibility: np.ndarray, a: np.ndarray, b: np.ndarray,
+               draws: np.ndarray) -> np.ndarray:
+        """See NumpyKernels.spread."""
+        hit = np.zeros(len(infected), dtype=np.bool_)
+        _spread_loop(infected, recovered, infection_probability, infectiousness, susceptibility, a, b, draws, hit)
+        return np.flatnonzero(hit)
+
+    def repel(self, x: np.ndarray, y: np.ndarray, a: np.ndarray, b: np.ndarray, threshold: float,
+              width: float, height: float) -> tuple[np.ndarray, np.ndarray]:
+        """See NumpyKernels.repel."""
+        a, b = _canonical(a, b)
+        shift_x, shift_y = np.zeros(len(x)), np.zeros(len(x))
+        _repel_loop(x, y, a, b, threshold, width, height, shift_x, shift_y)
+        return shift_x, shift_y
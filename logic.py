@@ -5,8 +5,9 @@ Classes:
 - Person: Represents an individual in the simulation.
 
 Functions:
-- community(num_persons): Creates a community of people based on a graph.
+- community(num_persons, width, height): Creates a community of people based on a graph.
 - calculate_distance(p1, p2): Calculates the Euclidean distance between two points.
+- advance_infection(person, recovery_time): Advances the infection timer of a person and recovers them.
 - draw_edge_and_infect(vertex1, vertex2, threshold, infection_probability, recovery_time, screen):
     Draws an edge between two people and infects them based on proximity and infection probability.
 - simulate_one_time_step(G, infection_radius, infection_probability, recovery_time, screen):
@@ -18,13 +19,30 @@ Dependencies:
 - pygame: Library for creating video games and multimedia applications.
 - numpy: Library for numerical computations.
 
-Note: This file relies on the 'graph_model' module for graph-related functionality.
+Note: This file relies on the 'graph_model' module for graph-related functionality. pygame is only imported when
+something is drawn, so headless runs do not pay for it.
 """
-import pygame
+from typing import TYPE_CHECKING
+
 import numpy as np
-import python_ta
 import graph_model
 import getting_data
+import mobility
+
+if TYPE_CHECKING:
+    import pygame
+
+
+def _reflect(position: float, speed: float, size: float) -> tuple[float, float]:
+    """
+    The 'reflecting' boundary of mobility.constrain for one number, in plain arithmetic as it runs for every person
+    every frame
+    """
+    if position < 0:
+        position, speed = min(-position, size), -speed
+    elif position > size:
+        position, speed = max(2 * size - position, 0), -speed
+    return float(position), float(speed)
 
 
 class Person:
@@ -53,9 +71,9 @@ class Person:
     infection_probability: float
     infection_timer: int
 
-    def __init__(self) -> None:
-        self.x = np.random.randint(0, 800)
-        self.y = np.random.randint(0, 600)
+    def __init__(self, width: int = mobility.WIDTH, height: int = mobility.HEIGHT) -> None:
+        self.x = np.random.randint(0, width)
+        self.y = np.random.randint(0, height)
         self.speed_x = np.random.uniform(-1.5, 1.5)
         self.speed_y = np.random.uniform(-1.5, 1.5)
         self.infected = False
@@ -65,22 +83,18 @@ class Person:
 
     def move(self, width: int, height: int) -> None:
         """
-        moves the vertex in a direction
+        moves the vertex in a direction, reflecting it off the edges so it never leaves the width by height box
         """
-        self.x += self.speed_x
-        self.y += self.speed_y
-
-        # Bounce off edges
-        if self.x <= 0 or self.x >= width:
-            self.speed_x *= -1
-        if self.y <= 0 or self.y >= height:
-            self.speed_y *= -1
+        self.x, self.speed_x = _reflect(self.x + self.speed_x, self.speed_x, width)
+        self.y, self.speed_y = _reflect(self.y + self.speed_y, self.speed_y, height)
 
     # Modify the draw method of the Person class to change the color of infected particles
-    def draw(self, screen: pygame.Surface) -> None:
+    def draw(self, screen: 'pygame.Surface') -> None:
         """
         draws the vertexes with its correspomding color in pyagame window
         """
+        import pygame
+
         if self.infected:
             color = (255, 0, 0)  # red
         elif self.recovered:
@@ -91,13 +105,14 @@ class Person:
 
 
 # Create people
-def community(num_persons: int) -> graph_model.Graph():
+def community(num_persons: int, width: int = mobility.WIDTH, height: int = mobility.HEIGHT) -> graph_model.Graph():
     """
     creates a community of people based on a graph
     :param num_persons:
+    :param width, height: Size of the world the people are placed in
     :return: graph_model.Graph()
     """
-    people = [Person() for _ in range(num_persons)]
+    people = [Person(width, height) for _ in range(num_persons)]
 
     infected_particle = people[np.random.choice(len(people))]
     infected_particle.infected = True
@@ -127,16 +142,36 @@ def calculate_distance(p1: Person, p2: Person) -> float:
     return np.sqrt((p2.x - p1.x) ** 2 + (p2.y - p1.y) ** 2)
 
 
+def advance_infection(person: Person, recovery_time: int) -> int:
+    """
+    Advance the infection timer of an infected person by one tick and recover them once it reaches recovery_time
+    :return: 1 if the person recovered, 0 otherwise
+    """
+    if not person.infected:
+        return 0
+    person.infection_timer += 1
+    if person.infection_timer >= recovery_time:
+        person.infected = False
+        person.recovered = True
+        person.infection_timer = 0
+        return 1
+    return 0
+
+
 def draw_edge_and_infect(vertex1: Person, vertex2: Person, model_params: tuple[int, int],
-                         screen: pygame.Surface) -> None:
+                         screen: 'pygame.Surface') -> tuple[bool, int, int]:
     """
     draws the edge between two people under a certain distance
     :param vertex1:
     :param vertex2:
+    :return: whether the two people were in contact, and how many infections and recoveries it caused
     """
     threshold, recovery_time = model_params
     distance = calculate_distance(vertex1, vertex2)
+    infections = recoveries = 0
     if distance < threshold:  # Adjust the threshold distance as needed
+        import pygame
+
         pygame.draw.line(screen, (255, 255, 255), (int(vertex1.x), int(vertex1.y)),
                          (int(vertex2.x), int(vertex2.y)))
         # Check if one is infected and the other is not, then infect based on the infection probability
@@ -144,29 +179,25 @@ def draw_edge_and_infect(vertex1: Person, vertex2: Person, model_params: tuple[i
         if vertex1.infected and not vertex2.infected:
             if infect < vertex1.infection_probability:
                 vertex2.infected = True
+                infections += 1
         elif vertex2.infected and not vertex1.infected:
             if infect < vertex2.infection_probability:
                 vertex1.infected = True
+                infections += 1
 
-        if vertex1.infected:
-            vertex1.infection_timer += 1
-            if vertex1.infection_timer >= recovery_time:
-                vertex1.infected = False
-                vertex1.recovered = True
-                vertex1.infection_timer = 0
-
-        if vertex2.infected:
-            vertex2.infection_timer += 1
-            if vertex2.infection_timer >= recovery_time:
-                vertex2.infected = False
-                vertex2.recovered = True
-                vertex2.infection_timer = 0
+        recoveries += advance_infection(vertex1, recovery_time)
+        recoveries += advance_infection(vertex2, recovery_time)
+        return True, infections, recoveries
+    return False, infections, recoveries
 
 
 if __name__ == "__main__":
+    import python_ta
+
     python_ta.check_all(config={
         'max-line-length': 170,
         'disable': ['E1136', 'W0221'],
-        'extra-imports': ['random', 'graph_model', 'statistics', 'logic', 'pygame', 'numpy', 'getting_data'],
+        'extra-imports': ['random', 'graph_model', 'statistics', 'logic', 'pygame', 'numpy', 'getting_data',
+                           'mobility'],
         'allowed-io': ['preventions', 'create_graph', 'preventions', 'pygame'],
     })
@@ -8,20 +8,35 @@ Functions:
     get_preventions: Prompt the user to select up to three preventions and their severity levels.
     get_prevention_severity: Get the severity level for a specific prevention.
     get_user_prevention_level: Prompt the user to input the severity level for a prevention.
-    run_preventions: Apply the selected preventions to the graph model.
+    get_prevention_schedule: Prompt the user for when a prevention starts and stops.
+    run_preventions: Schedule the selected preventions and apply the ones active at the start to the graph model.
+    infect_and_trace: Draw the edges and infect people, feeding the contacts and infections to a contact tracer.
     main: Run the simulation and display statistics and visualizations.
 
 Constants:
     recovery_time: Default time for recovery from infection.
+    INSTRUMENTATION_FILE: File the per-tick instrumentation records are exported to.
+    PROFILE_FILE: File the cProfile stats are dumped to.
+
+Keys:
+    Space: pause, I: toggle instrumentation and its overlay, P: toggle cProfile, S: toggle the sampling profiler.
 """
-from typing import Union
+from typing import Optional, Union
 
+import numpy as np
 import statistics
-import python_ta
 import pygame
 import graph_model
+import export
+import instrumentation
+import interventions
 import logic
+import mobility
 import preventions
+import tracing
+
+INSTRUMENTATION_FILE = 'instrumentation.csv'
+PROFILE_FILE = 'simulation.prof'
 
 
 def get_user_input() -> tuple:
@@ -44,7 +59,7 @@ def get_user_input() -> tuple:
     return num_people, infect_radius
 
 
-def get_preventions(num_people: int) -> tuple[list[str], list[int]]:
+def get_preventions(num_people: int) -> tuple[list[str], list[int], list[tuple[str, str]]]:
     """
     Get user input for variables that users are allowed to control
     Preconditions:
@@ -53,6 +68,7 @@ def get_preventions(num_people: int) -> tuple[list[str], list[int]]:
     """
     preventions_so_far = []
     severity_so_far = []
+    schedule_so_far = []
     prevention_options = ('Preventions: \n-vaccines \n-lockdown \n-social distancing \n-masks '
                           '\n-infection tracing \n-remote work \n-staggered working hours')
     valid_answers = ['vaccines', 'lockdown', 'social distancing', 'masks',
@@ -67,12 +83,13 @@ def get_preventions(num_people: int) -> tuple[list[str], list[int]]:
         elif answer in valid_answers and answer not in preventions_so_far:
             preventions_so_far.append(answer)
             severity_so_far.append(get_prevention_severity(answer, num_people))
+            schedule_so_far.append(get_prevention_schedule())
         elif answer not in valid_answers:
             print("Invalid input. Please choose again. Type 'Done' to finish")
         else:
             print("Already Chosen. Please choose a different prevention. Type 'Done' to finish")
 
-    return preventions_so_far, severity_so_far
+    return preventions_so_far, severity_so_far, schedule_so_far
 
 
 def get_prevention_severity(prevention: str, num_people: int) -> Union[int, float]:
@@ -100,37 +117,103 @@ def get_user_prevention_level(maximum_level: int) -> float:
     return answer
 
 
+def get_prevention_schedule() -> tuple[str, str]:
+    """
+    Keep asking the user when a prevention starts and stops until both are valid conditions or empty
+    :return: the start and stop condition, see interventions.Condition.parse
+    """
+    schedule = []
+    for question in ('Start when (e.g. infected > 10% or tick >= 500, empty to start right away): ',
+                     'Stop when (e.g. infected < 2% or tick >= 1500, empty to never stop): '):
+        answer = input(question).lower().strip()
+        while answer and not _is_condition(answer):
+            print("Invalid condition. Compare tick, susceptible, infected or recovered with a number.")
+            answer = input(question).lower().strip()
+        schedule.append(answer)
+    return schedule[0], schedule[1]
+
+
+def _is_condition(text: str) -> bool:
+    """Return if text is a valid interventions.Condition."""
+    try:
+        interventions.Condition.parse(text)
+    except ValueError:
+        return False
+    return True
+
+
 def run_preventions(prevention_list: list[str], prevention_severity_list: list[Union[int, float]],
-                    p: graph_model.Graph()) -> None:
+                    p: graph_model.Graph(), schedule_list: Optional[list[tuple[str, str]]] = None) \
+        -> interventions.Scheduler:
+    """
+    Schedule the preventions based on the users input and apply the ones active at the start,
+    the ones that act every tick are run in the main loop while they are active
+    :param schedule_list: Start and stop condition of every prevention, always active if None
+    :return: the Scheduler to update with the counts every tick
+    """
+    if schedule_list is None:
+        schedule_list = [('', '')] * len(prevention_list)
+    scheduler = interventions.schedule(
+        [(prevention, severity if severity is not None else 1.0, start, stop)
+         for prevention, severity, (start, stop) in zip(prevention_list, prevention_severity_list, schedule_list)],
+        len(p.nodes))
+    num_infected = sum(1 for person in p.nodes.values() if person.infected)
+    if scheduler.update(0, {'susceptible': len(p.nodes) - num_infected, 'infected': num_infected, 'recovered': 0}):
+        scheduler.apply_to_graph(p)
+    return scheduler
+
+
+def infect_and_trace(people: graph_model.Graph(), model_params: tuple[int, int], screen: pygame.Surface,
+                     tracer: Optional[tracing.ContactTracer] = None, tick: int = 0) -> tuple[int, int, int, int]:
     """
-    Run preventions on the data based on the users input
+    Run logic.draw_edge_and_infect on every edge. With a tracer, the edges of quarantined people are skipped and the
+    contacts and new infections are recorded in the tracer. Quarantined infected people have no contacts to advance
+    their infection timer, so it advances once per tick instead and they recover too
+    :param tracer: Contact tracer indexed in the order of people.nodes
+    :param tick: The tick being simulated
+    :return: the number of pairs checked, contacts, infections and recoveries
     """
-    for v in range(len(prevention_list)):
-        if prevention_list[v] == 'vaccines':
-            preventions.vaccine_prevention(p, prevention_severity_list[v])
-        elif prevention_list[v] == 'lockdown':
-            preventions.lockdown(p, prevention_severity_list[v])
-        elif prevention_list[v] == 'masks':
-            preventions.mask_wearing(p, prevention_severity_list[v])
-        elif prevention_list[v] == 'remote work':
-            preventions.remote_work(p, prevention_severity_list[v])
-        elif prevention_list[v] == 'staggered working hours':
-            preventions.staggered_work_hours(p, prevention_severity_list[v])
+    persons = list(people.nodes.values())
+    index = {id(person): i for i, person in enumerate(persons)}
+    was_infected = [person.infected for person in persons]
+    contacts = []
+    checked = infections = recoveries = 0
+    for person1, person2 in people.edges:
+        i, j = index[id(person1)], index[id(person2)]
+        if tracer is not None and (tracer.quarantined[i] or tracer.quarantined[j]):
+            continue
+        checked += 1
+        contact, infected, recovered = logic.draw_edge_and_infect(person1, person2, model_params, screen)
+        if contact:
+            contacts.append((i, j))
+        infections += infected
+        recoveries += recovered
+
+    if tracer is not None:
+        for i in np.flatnonzero(tracer.quarantined):
+            recoveries += logic.advance_infection(persons[i], model_params[1])
+        pairs = np.array(contacts, dtype=np.int64).reshape(-1, 2)
+        tracer.record(tick, pairs[:, 0], pairs[:, 1])
+        tracer.infected(tick, np.array([i for i, person in enumerate(persons)
+                                        if person.infected and not was_infected[i]], dtype=np.int64))
+    return len(contacts), infections, recoveries
 
 
 if __name__ == "__main__":
     recovery_time = 100
+    # Screen dimensions, also the size of the world people move in
+    width, height = mobility.WIDTH, mobility.HEIGHT
 
     num_persons, infection_radius = get_user_input()
-    G = logic.community(num_persons)
+    G = logic.community(num_persons, width, height)
 
     # Lists to track infection statistics over time
     infected_counts = []
     recovered_counts = []
     susceptible_counts = []
 
-    preventions_list, severity_list = get_preventions(num_persons)
-    run_preventions(preventions_list, severity_list, G)
+    preventions_list, severity_list, schedule_list = get_preventions(num_persons)
+    scheduler = run_preventions(preventions_list, severity_list, G, schedule_list)
 
     # Display menu
     print("Select statistics functions to run:")
@@ -140,14 +223,13 @@ if __name__ == "__main__":
     print("4. Plot SIR curve")
     print("5. Plot infection curve with FFT")
     print("6. Analyze SIR simulation with FFT")
+    print("7. Export the results")
 
     # Get user choices
-    choices = input("Enter your choices (comma-separated) and choce any number after 6 to view nothing: ").split(',')
+    choices = input("Enter your choices (comma-separated) and choce any number after 7 to view nothing: ").split(',')
 
     # Now that user input is gathered and preventions are applied, initialize Pygame
     pygame.init()
-    # Screen dimensions
-    width, height = 800, 600
     screen = pygame.display.set_mode((width, height))
     pygame.display.set_caption("SIR Model Simulation")
 
@@ -158,61 +240,114 @@ if __name__ == "__main__":
     paused = False
     font = pygame.font.Font(None, 20)  # Font for rendering text
 
-    prevention_texts = [font.render(prevention, True, (255, 255, 255)) for prevention in preventions_list]
+    # Active preventions are shown in white, the ones switched off in grey
+    prevention_texts = [{active: font.render(prevention, True, (255, 255, 255) if active else (110, 110, 110))
+                         for active in (True, False)} for prevention in preventions_list]
     prevention_texts_y_positions = [j * 30 + 10 for j in range(len(prevention_texts))]
 
+    # Instrumentation is off until toggled with the I key, P and S toggle the cProfile and sampling profilers
+    instruments = instrumentation.create_instrumentation(False)
+    tick = 0
+
+    # Infection tracing detects half of the new infections, like the old infected_threshold of 0.5
+    tracer = None
+    if 'infection tracing' in preventions_list:
+        tracer = tracing.ContactTracer(num_persons, detection_probability=0.5)
+        tracer.infected(-1, np.array([i for i, person in enumerate(G.nodes.values()) if person.infected]))
+
     while running:
         screen.fill((0, 0, 0))
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:  # Example: Use space bar to toggle pause
-                    paused = not paused
+        with instruments.phase('events'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:  # Example: Use space bar to toggle pause
+                        paused = not paused
+                    elif event.key == pygame.K_i:
+                        instruments.close()
+                        instruments = instrumentation.create_instrumentation(
+                            not instruments.enabled, export_path=INSTRUMENTATION_FILE, export_every=300)
+                    elif event.key in (pygame.K_p, pygame.K_s) and instruments.enabled:
+                        instruments.toggle_profiler('cprofile' if event.key == pygame.K_p else 'sampling',
+                                                    PROFILE_FILE)
 
         if not paused:
-            if 'social distancing' in preventions_list:
-                preventions.social_distance(G, 25, width, height)
-            elif 'infection tracing' in preventions_list:
-                preventions.infection_tracing(G, 0.5)
-            # Move people
-            for person in G.nodes.values():
-                person.move(width, height)
-                person.draw(screen)
+            if scheduler.is_active('social distancing'):
+                with instruments.phase('social_distance'):
+                    preventions.social_distance(G, 25, width, height)
+            if tracer is not None:
+                with instruments.phase('infection_tracing'):
+                    # Quarantines keep ending while tracing is switched off, only new detections stop
+                    tracer.enabled = scheduler.is_active('infection tracing')
+                    preventions.infection_tracing(G, tracer, tick)
+            # Move people, quarantined people stay in the quarantine zone
+            with instruments.phase('move'):
+                for i, person in enumerate(G.nodes.values()):
+                    if tracer is None or not tracer.quarantined[i]:
+                        person.move(width, height)
+                if tracer is not None:
+                    preventions.move_quarantined(G, tracer, tick)
+            with instruments.phase('draw'):
+                for person in G.nodes.values():
+                    person.draw(screen)
 
             # Infect people
-            for person1, person2 in G.edges:
-                logic.draw_edge_and_infect(person1, person2, (infection_radius, recovery_time), screen)
+            with instruments.phase('draw_edge_and_infect'):
+                if instruments.enabled or tracer is not None:
+                    checked, contacts, infections, recoveries = infect_and_trace(
+                        G, (infection_radius, recovery_time), screen, tracer, tick)
+                    instruments.count('pairs_checked', checked)
+                    instruments.count('contacts', contacts)
+                    instruments.count('infections', infections)
+                    instruments.count('recoveries', recoveries)
+                else:
+                    for person1, person2 in G.edges:
+                        logic.draw_edge_and_infect(person1, person2, (infection_radius, recovery_time), screen)
 
             # Track infection statistics
-            num_infected = sum(1 for p in G.nodes.values() if p.infected)
-            num_recovered = sum(1 for p in G.nodes.values() if p.recovered)
-            num_susceptible = num_persons - num_infected - num_recovered
-
-            infected_counts.append(num_infected)
-            recovered_counts.append(num_recovered)
-            susceptible_counts.append(num_susceptible)
-
-            # Check if time limit exceeded
+            with instruments.phase('counters'):
+                num_infected = sum(1 for p in G.nodes.values() if p.infected)
+                num_recovered = sum(1 for p in G.nodes.values() if p.recovered)
+                num_susceptible = num_persons - num_infected - num_recovered
+
+                infected_counts.append(num_infected)
+                recovered_counts.append(num_recovered)
+                susceptible_counts.append(num_susceptible)
+
+            # Switch scheduled preventions on and off for the next tick
+            tick += 1
+            with instruments.phase('schedule'):
+                if scheduler.update(tick, {'susceptible': num_susceptible, 'infected': num_infected,
+                                           'recovered': num_recovered}):
+                    scheduler.apply_to_graph(G)
+
+            # Check if time limit exceeded, or the epidemic is over as nobody can be infected again
             current_time = pygame.time.get_ticks()
-            if current_time - start_time >= 10000:
+            if current_time - start_time >= 10000 or num_infected == 0:
                 running = False
 
-            # Render text showing counts of infected, non-infected, and recovered individuals
-            infected_text = font.render(f'Infected: {num_infected}', True, (255, 0, 0))
-            recovered_text = font.render(f'Recovered: {num_recovered}', True, (0, 255, 0))
-            susceptible_text = font.render(f'Susceptible: {num_susceptible}', True, (137, 207, 240))
-            screen.blit(infected_text, (10, 10))
-            screen.blit(recovered_text, (10, 50))
-            screen.blit(susceptible_text, (10, 90))
-            # Render text for selected preventions
-            for i, text in enumerate(prevention_texts):
-                screen.blit(text, (width - 200, prevention_texts_y_positions[i]))
-
-            clock.tick(300)
-            pygame.display.flip()  # Optional delay for smoother animation
-
+            with instruments.phase('text'):
+                # Render text showing counts of infected, non-infected, and recovered individuals
+                infected_text = font.render(f'Infected: {num_infected}', True, (255, 0, 0))
+                recovered_text = font.render(f'Recovered: {num_recovered}', True, (0, 255, 0))
+                susceptible_text = font.render(f'Susceptible: {num_susceptible}', True, (137, 207, 240))
+                screen.blit(infected_text, (10, 10))
+                screen.blit(recovered_text, (10, 50))
+                screen.blit(susceptible_text, (10, 90))
+                # Render text for selected preventions
+                for i, text in enumerate(prevention_texts):
+                    screen.blit(text[scheduler.active[i]], (width - 200, prevention_texts_y_positions[i]))
+            instruments.draw_overlay(screen, font)
+
+            with instruments.phase('clock_tick'):
+                clock.tick(300)
+            with instruments.phase('flip'):
+                pygame.display.flip()  # Optional delay for smoother animation
+            instruments.end_tick()
+
+    instruments.close()
     pygame.quit()
 
     for choice in choices:
@@ -237,7 +372,17 @@ if __name__ == "__main__":
             # Analyze SIR simulation with FFT requires infected_counts, recovered_counts, and population
             population = num_persons
             statistics.analyze_sir_simulation_with_fft(infected_counts, recovered_counts, population)
-
+        elif choice == '7':
+            # Export the series and their summary metrics to export.EXPORT_DIR
+            store = export.ResultStore()
+            run_id = store.write({'num_persons': num_persons, 'infection_radius': infection_radius,
+                                  'preventions': list(zip(preventions_list, severity_list)),
+                                  'schedule': schedule_list},
+                                 {'susceptible': susceptible_counts, 'infected': infected_counts,
+                                  'recovered': recovered_counts})
+            print(f"Exported run {run_id} to {store.directory}")
+
+    import python_ta
     python_ta.check_all(config={
         'max-line-length': 170,
         'disable': ['E1136', 'W0221'],
@@ -0,0 +1,252 @@
+"""
+Module for moving people through a world of configurable size and boundaries, for the whole population at once.
+
+A World is a width by height rectangle whose edges behave in one of the BOUNDARIES:
+- 'reflecting': a person crossing an edge is mirrored back inside and turns around
+- 'periodic': a person crossing an edge comes back in on the opposite side, contacts are also found across the edges
+- 'closed': a person crossing an edge is stopped on it and turns around
+- 'bounce': the old rule of logic.Person.move, the speed is reversed but the position is not corrected, so a person
+  pushed past an edge can stay outside. Kept to reproduce old runs.
+
+A Mobility moves the people of an engine.Population every tick with one of the MODELS:
+- 'ballistic': everyone keeps their speed, the movement of main.py
+- 'random_walk': everyone turns by a random angle every tick and keeps their speed
+- 'commuting': everyone walks between their home, where they start, and one of a few workplaces, spending the first
+  work_share of every day_length ticks at work
+- 'gathering': everyone walks at random, except that at the start of every day a share of the people walks to one of a
+  few gathering points for the first event_share of the day
+Walkers move at most their own speed per tick, so policies that slow people down slow their commute too. The random
+choices only depend on the seed, the tick and the person (see engine.pair_uniforms), like the infections, so a run
+does not depend on how the population is split up.
+
+Classes:
+    World: The size and the boundaries of the world.
+    Mobility: How people move through a World.
+
+Functions:
+    constrain: Apply a boundary to positions and speeds along one axis.
+
+Constants:
+    WIDTH, HEIGHT: Default size of the world, the size of the window of main.py.
+    BOUNDARIES: Names of the boundaries.
+    MODELS: Names of the mobility models.
+"""
+from typing import Any, Optional
+
+import numpy as np
+
+WIDTH, HEIGHT = 800, 600
+BOUNDARIES = ('reflecting', 'periodic', 'closed', 'bounce')
+MODELS = ('ballistic', 'random_walk', 'commuting', 'gathering')
+
+# Streams of random numbers of a Mobility, so the choices of one model do not repeat those of another
+_TURN, _WORKPLACE, _GATHERING_POINT, _ATTENDS = range(4)
+
+
+def constrain(position: Any, speed: Any, size: float, boundary: str = 'reflecting') -> tuple[Any, Any]:
+    """
+    Apply a boundary to positions and speeds along one axis of the world [0, size].
+    Works on numbers and arrays alike.
+    :return: the new positions and speeds
+    """
+    if boundary == 'periodic':
+        return np.mod(position, size), speed
+    if boundary == 'bounce':
+        return position, np.where((position <= 0) | (position >= size), -speed, speed)
+    outside = (position < 0) | (position > size)
+    if boundary == 'reflecting':
+        position = np.where(position < 0, -position, np.where(position > size, 2 * size - position, position))
+    # Closed walls, and reflections of a step longer than the world
+    position = np.clip(position, 0, size)
+    return position, np.where(outside, -speed, speed)
+
+
+class World:
+    """
+    The size and the boundaries of the world people move in.
+
+    Instance attributes:
+    - width: float, size of the world along x
+    - height: float, size of the world along y
+    - boundary: str, how the edges behave, one of BOUNDARIES
+
+    Representation Invariants:
+    - self.width > 0 and self.height > 0
+    - self.boundary in BOUNDARIES
+    """
+    width: float
+    height: float
+    boundary: str
+
+    def __init__(self, width: float = WIDTH, height: float = HEIGHT, boundary: str = 'reflecting') -> None:
+        if boundary not in BOUNDARIES:
+            raise ValueError(f'Unknown boundary {boundary!r}, choose from {BOUNDARIES}')
+        self.width = width
+        self.height = height
+        self.boundary = boundary
+
+    def constrain(self, x: np.ndarray, y: np.ndarray, speed_x: np.ndarray,
+                  speed_y: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Apply the boundary to moved positions and their speeds, return the new positions and speeds."""
+        x, speed_x = constrain(x, speed_x, self.width, self.boundary)
+        y, speed_y = constrain(y, speed_y, self.height, self.boundary)
+        return x, y, speed_x, speed_y
+
+    def random_positions(self, rng: Any, size: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Draw size positions uniformly inside the world.
+        :param rng: A np.random.Generator, or the np.random module for the global generator of main.py
+        """
+        return rng.uniform(0, self.width, size), rng.uniform(0, self.height, size)
+
+    def contact_pairs(self, kernel: Any, x: np.ndarray, y: np.ndarray,
+                      radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find every pair of people closer than radius with a kernel of the kernels module. In a periodic world the
+        people within radius of an edge are copied to the other side first, so the grid of the kernel also finds the
+        contacts across the edges.
+        :return: two index arrays a, b with a[k] < b[k] for every pair in contact
+        """
+        if self.boundary != 'periodic' or len(x) < 2:
+            return kernel.contact_pairs(x, y, radius)
+        xs, ys, origins = [x], [y], [np.arange(len(x))]
+        near_x = {-1: x >= self.width - radius, 0: np.ones(len(x), dtype=bool), 1: x < radius}
+        near_y = {-1: y >= self.height - radius, 0: np.ones(len(y), dtype=bool), 1: y < radius}
+        for shift_x in (-1, 0, 1):
+            for shift_y in (-1, 0, 1):
+                if shift_x or shift_y:
+                    copied = np.flatnonzero(near_x[shift_x] & near_y[shift_y])
+                    xs.append(x[copied] + shift_x * self.width)
+                    ys.append(y[copied] + shift_y * self.height)
+                    origins.append(copied)
+        origin = np.concatenate(origins)
+        a, b = kernel.contact_pairs(np.concatenate(xs), np.concatenate(ys), radius)
+        a, b = origin[a], origin[b]
+        # A pair can be found directly and through copies, a person can meet their own copy in a small world
+        keep = a != b
+        pairs = np.unique(np.stack((np.minimum(a[keep], b[keep]), np.maximum(a[keep], b[keep])), axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def __repr__(self) -> str:
+        return f'World({self.width}, {self.height}, {self.boundary!r})'
+
+
+class Mobility:
+    """
+    How the people of an engine.Population move through a World. The places of the commuting and gathering models
+    are chosen by setup, called by the simulation before the first tick.
+
+    Instance attributes:
+    - world: World people move in
+    - model: str, one of MODELS
+    - seed: int, seed of every random choice of the model
+    - turning: float, largest angle a random walker turns by per tick, as a fraction of a half turn
+    - day_length: int, ticks in a day of the commuting and gathering models
+    - work_share: float, fraction of the day commuters spend at work
+    - num_workplaces: int, number of workplaces
+    - event_share: float, fraction of the day a gathering lasts
+    - attendance: float, chance for a person to go to the gathering of a day
+    - num_gathering_points: int, number of gathering points
+
+    Representation Invariants:
+    - self.model in MODELS
+    - self.day_length > 0
+    - 0 <= self.work_share <= 1 and 0 <= self.event_share <= 1 and 0 <= self.attendance <= 1
+    """
+    world: World
+    model: str
+    seed: int
+    turning: float
+    day_length: int
+    work_share: float
+    num_workplaces: int
+    event_share: float
+    attendance: float
+    num_gathering_points: int
+    _home: Optional[np.ndarray]
+    _work: Optional[np.ndarray]
+    _gathering: Optional[np.ndarray]
+
+    def __init__(self, world: Optional[World] = None, model: str = 'ballistic', seed: int = 0, turning: float = 0.2,
+                 day_length: int = 300, work_share: float = 0.5, num_workplaces: int = 10,
+                 event_share: float = 0.3, attendance: float = 0.2, num_gathering_points: int = 3) -> None:
+        if model not in MODELS:
+            raise ValueError(f'Unknown mobility model {model!r}, choose from {MODELS}')
+        self.world = world if world is not None else World()
+        self.model = model
+        self.seed = seed
+        self.turning = turning
+        self.day_length = day_length
+        self.work_share = work_share
+        self.num_workplaces = num_workplaces
+        self.event_share = event_share
+        self.attendance = attendance
+        self.num_gathering_points = num_gathering_points
+        self._home = self._work = self._gathering = None
+
+    def _uniforms(self, stream: int, key: int, people: np.ndarray) -> np.ndarray:
+        """Uniform numbers in [0, 1) that only depend on the seed, the stream, a key like the tick and the person."""
+        import engine
+
+        return engine.pair_uniforms(self.seed * len(MODELS) + stream, key, people, people)
+
+    def _places(self, stream: int, count: int, people: np.ndarray) -> np.ndarray:
+        """Choose count places at random in the world and give every person one of them, a few steps apart."""
+        rng = np.random.default_rng([self.seed, stream])
+        places = np.stack((rng.uniform(0, self.world.width, count), rng.uniform(0, self.world.height, count)), axis=1)
+        choice = np.minimum((self._uniforms(stream, 0, people) * count).astype(np.int64), count - 1)
+        spread = np.stack((self._uniforms(stream, 1, people), self._uniforms(stream, 2, people)), axis=1) * 20 - 10
+        return np.clip(places[choice] + spread, 0, [self.world.width, self.world.height])
+
+    def setup(self, population: Any) -> None:
+        """Make the current positions of the people their homes and choose their workplace and gathering point."""
+        people = np.arange(len(population.x))
+        self._home = np.stack((population.x, population.y), axis=1)
+        self._work = self._places(_WORKPLACE, max(self.num_workplaces, 1), people) \
+            if self.model == 'commuting' else None
+        self._gathering = self._places(_GATHERING_POINT, max(self.num_gathering_points, 1), people) \
+            if self.model == 'gathering' else None
+
+    def move(self, population: Any, tick: int, idx: Optional[np.ndarray] = None) -> None:
+        """
+        Move people for one tick and apply the boundaries of the world.
+        :param idx: Indices of the people to move, everyone if None
+        """
+        people = np.arange(len(population.x)) if idx is None else np.asarray(idx)
+        speed_x, speed_y = population.speed_x[people], population.speed_y[people]
+        if self.model in ('random_walk', 'gathering'):
+            angle = (self._uniforms(_TURN, tick, people) * 2 - 1) * self.turning * np.pi
+            cos, sin = np.cos(angle), np.sin(angle)
+            speed_x, speed_y = speed_x * cos - speed_y * sin, speed_x * sin + speed_y * cos
+        step_x, step_y = speed_x, speed_y
+
+        target, walking = self._target(tick, people)
+        if target is not None:
+            # Walk straight to the target at one's own speed, without overshooting it
+            to_x, to_y = target[:, 0] - population.x[people], target[:, 1] - population.y[people]
+            distance = np.hypot(to_x, to_y)
+            ratio = np.divide(np.minimum(np.hypot(speed_x, speed_y), distance), distance,
+                              out=np.zeros_like(distance), where=distance > 0)
+            step_x = np.where(walking, to_x * ratio, speed_x)
+            step_y = np.where(walking, to_y * ratio, speed_y)
+
+        x, y, speed_x, speed_y = self.world.constrain(population.x[people] + step_x, population.y[people] + step_y,
+                                                      speed_x, speed_y)
+        population.x[people], population.y[people] = x, y
+        population.speed_x[people], population.speed_y[people] = speed_x, speed_y
+
+    def _target(self, tick: int, people: np.ndarray) -> tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Return where people walk to in this tick and who of them walks, or None if nobody does."""
+        if self._home is None and self.model in ('commuting', 'gathering'):
+            raise RuntimeError('Mobility.setup has to be called before the first move')
+        day, time = divmod(tick, self.day_length)
+        if self.model == 'commuting':
+            place = self._work if time < self.work_share * self.day_length else self._home
+            return place[people], np.ones(len(people), dtype=bool)
+        if self.model == 'gathering' and time < self.event_share * self.day_length:
+            attends = self._uniforms(_ATTENDS, day, people) < self.attendance
+            return self._gathering[people], attends
+        return None, None
+
+    def __repr__(self) -> str:
+        return f'Mobility({self.world!r}, {self.model!r}, seed={self.seed})'
@@ -0,0 +1,168 @@
+"""
+Module for applying preventions to a whole population at once.
+
+Every prevention is a policy registered by name. A policy does not touch people one at a time: it adds to an Effect,
+which holds one boolean mask per group of selected people (vaccinated, masked, ...) and one multiplicative factor per
+person for the speed and for the infection probability. Several policies compose into the same Effect, which is then
+applied to the population arrays in a single pass.
+
+The registered names are the ones main.py offers: vaccines, masks, lockdown, staggered working hours and remote work.
+Social distancing and infection tracing act on every tick and are not policies.
+
+Classes:
+    Effect: Accumulated masks and factors of one or more policies.
+
+Functions:
+    register_policy: Register a policy under a name.
+    policy_names: Return the names of the registered policies.
+    compose: Compose several policies into one Effect.
+    apply_policies: Apply several policies to the columns of an engine.Population.
+    apply_to_graph: Apply several policies to the Person objects of a community graph.
+"""
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+_POLICIES: dict[str, Callable[['Effect', float, np.random.Generator], None]] = {}
+
+
+class Effect:
+    """
+    The combined effect of policies on a population.
+
+    Instance attributes:
+    - num_persons: int, size of the population
+    - speed: np.ndarray, factor every person's speed is multiplied by
+    - probability: np.ndarray, factor every person's infection probability is multiplied by
+    - masks: dict, name -> boolean array of the people a policy selected, e.g. 'vaccinated'
+
+    Representation Invariants:
+    - len(self.speed) == len(self.probability) == self.num_persons
+    """
+    num_persons: int
+    speed: np.ndarray
+    probability: np.ndarray
+    masks: dict[str, np.ndarray]
+
+    def __init__(self, num_persons: int) -> None:
+        self.num_persons = num_persons
+        self.speed = np.ones(num_persons)
+        self.probability = np.ones(num_persons)
+        self.masks = {}
+
+    def select(self, fraction: float, rng: np.random.Generator, mask: Optional[str] = None) -> np.ndarray:
+        """
+        Pick int(fraction * num_persons) different people at random, everyone if fraction >= 1.
+        :param mask: If given, the picked people are also added to the mask of that name
+        :return: boolean array, True for the picked people
+        """
+        count = min(int(fraction * self.num_persons), self.num_persons)
+        if count >= self.num_persons:
+            picked = np.ones(self.num_persons, dtype=bool)
+        elif count <= 0:
+            picked = np.zeros(self.num_persons, dtype=bool)
+        else:
+            # The count smallest of uniform random keys, cheaper than scattering shuffled indices
+            keys = rng.random(self.num_persons)
+            picked = keys < np.partition(keys, count)[count]
+        if mask is not None:
+            self.masks[mask] = self.masks[mask] | picked if mask in self.masks else picked
+        return picked
+
+
+def register_policy(name: str) -> Callable:
+    """
+    Register a policy under a name. The decorated function receives the Effect to add to, the severity chosen by the
+    user and a random generator.
+    :param name: Name of the prevention, as typed in main.get_preventions
+    :return: decorator
+    """
+    def decorator(policy: Callable[[Effect, float, np.random.Generator], None]) -> Callable:
+        _POLICIES[name] = policy
+        return policy
+
+    return decorator
+
+
+def policy_names() -> list[str]:
+    """Return the names of the registered policies."""
+    return list(_POLICIES)
+
+
+@register_policy('vaccines')
+def vaccines(effect: Effect, people_with_vaccines: float, rng: np.random.Generator) -> None:
+    """Vaccinate a fraction of the people, reducing their infection probability."""
+    vaccinated = effect.select(people_with_vaccines, rng, 'vaccinated')
+    np.multiply(effect.probability, 0.3, out=effect.probability, where=vaccinated)  # Assuming 30% reduction in infection probability
+
+
+@register_policy('masks')
+def masks(effect: Effect, people_with_masks: float, rng: np.random.Generator) -> None:
+    """Put masks on a fraction of the people, reducing their infection probability."""
+    masked = effect.select(people_with_masks, rng, 'masked')
+    np.multiply(effect.probability, 0.4, out=effect.probability, where=masked)  # Assuming 40% reduction in infection probability from canada.gov
+
+
+@register_policy('lockdown')
+def lockdown(effect: Effect, lockdown_factor: float, rng: np.random.Generator) -> None:
+    """Reduce the movement speed of everyone."""
+    effect.speed *= abs(lockdown_factor - 1)
+
+
+@register_policy('staggered working hours')
+def staggered_work_hours(effect: Effect, staggered_factor: float, rng: np.random.Generator) -> None:
+    """Halve the movement speed of a fraction of the people."""
+    staggered = effect.select(staggered_factor, rng, 'staggered')
+    np.multiply(effect.speed, 0.5, out=effect.speed, where=staggered)
+
+
+@register_policy('remote work')
+def remote_work(effect: Effect, remote_work_factor: float, rng: np.random.Generator) -> None:
+    """Reduce the movement speed of the fraction of the people that works remotely."""
+    remote = effect.select(remote_work_factor, rng, 'remote')
+    np.multiply(effect.speed, abs(remote_work_factor - 1), out=effect.speed, where=remote)
+
+
+def compose(num_persons: int, names: list[str], severities: list[Union[int, float]],
+            rng: Optional[np.random.Generator] = None, effect: Optional[Effect] = None) -> Effect:
+    """
+    Compose the named policies into one Effect.
+    :param names: Registered policy names
+    :param severities: Severity of each policy
+    :param effect: Effect to add to, a new one if None
+    :return: the Effect
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    effect = effect if effect is not None else Effect(num_persons)
+    for name, severity in zip(names, severities):
+        if name not in _POLICIES:
+            raise ValueError(f'Unknown policy {name!r}, choose from {policy_names()}')
+        _POLICIES[name](effect, severity, rng)
+    return effect
+
+
+def apply_policies(population: Any, names: list[str], severities: list[Union[int, float]],
+                   rng: Optional[np.random.Generator] = None) -> Effect:
+    """
+    Apply the named policies to an engine.Population in one pass over its columns.
+    :return: the applied Effect, whose masks tell who was vaccinated, masked, ...
+    """
+    effect = compose(len(population), names, severities, rng)
+    population.speed_x *= effect.speed
+    population.speed_y *= effect.speed
+    population.infection_probability *= effect.probability
+    return effect
+
+
+def apply_to_graph(people: Any, names: list[str], severities: list[Union[int, float]],
+                   rng: Optional[np.random.Generator] = None) -> Effect:
+    """
+    Apply the named policies to the Person objects of a graph_model.Graph built by logic.community.
+    :return: the applied Effect, indexed like people.nodes
+    """
+    effect = compose(len(people.nodes), names, severities, rng)
+    for person, speed, probability in zip(people.nodes.values(), effect.speed.tolist(), effect.probability.tolist()):
+        person.speed_x *= speed
+        person.speed_y *= speed
+        person.infection_probability *= probability
+    return effect
@@ -12,12 +12,25 @@ Functions:
     infection_tracing: Implement infection tracing to identify and isolate individuals who have been in contact with infected individuals.
     staggered_work_hours: Implement staggered work hours to reduce the number of people present in a shared space at any given time.
     remote_work: Encourage remote work to minimize physical interactions in workplaces.
+    move_quarantined: Move the people in quarantine inside the quarantine zone.
+
+Constants:
+    QUARANTINE_AREA: Size of the square in the corner of the map quarantined people are kept in.
+    QUARANTINE_ZONE: How quarantined people move, ballistic walkers in a closed QUARANTINE_AREA square world.
+
+The preventions applied once before the simulation starts are implemented as vectorised policies in the policies
+module, the functions here apply one of them to a graph. Infection tracing is done by the tracing module.
 """
-import random
+from types import SimpleNamespace
 
 import numpy as np
-import python_ta
 import graph_model
+import mobility
+import policies
+import tracing
+
+QUARANTINE_AREA = 100
+QUARANTINE_ZONE = mobility.Mobility(mobility.World(QUARANTINE_AREA, QUARANTINE_AREA, 'closed'))
 
 
 def vaccine_prevention(people: graph_model.Graph(), people_with_vaccines: float) -> None:
@@ -26,21 +39,7 @@ def vaccine_prevention(people: graph_model.Graph(), people_with_vaccines: float)
     :param people: List of Person objects.
     :param people_with_vaccines: Effectiveness of the vaccine (0 to 1).
     """
-    # Calculate the number of vaccinated people
-    num_vaccinated = int(people_with_vaccines * len(people))
-
-    # Shuffle the keys of the dictionary
-    keys = list(people.nodes.keys())
-    random.shuffle(keys)
-
-    # Select the first num_vaccinated keys
-    vaccinated_people = keys[:num_vaccinated]
-
-    # Update infection probability for vaccinated individuals
-    for person_key in vaccinated_people:
-        person = people.nodes[person_key]
-        # Reduce the person's infection probability based on vaccine effectiveness
-        person.infection_probability *= 0.3  # Assuming 30% reduction in infection probability
+    policies.apply_to_graph(people, ['vaccines'], [people_with_vaccines])
 
 
 def lockdown(people: graph_model.Graph(), lockdown_factor: float) -> None:
@@ -49,9 +48,7 @@ def lockdown(people: graph_model.Graph(), lockdown_factor: float) -> None:
     :param people: List of Person objects.
     :param lockdown_factor: Factor to reduce movement speed (0 to 1).
     """
-    for person in people.nodes.values():
-        person.speed_x *= abs(lockdown_factor - 1)  # Reduce movement speed
-        person.speed_y *= abs(lockdown_factor - 1)
+    policies.apply_to_graph(people, ['lockdown'], [lockdown_factor])
 
 
 def social_distance(people: graph_model.Graph(), distance_threshold: float, s_width: int, s_height: int) -> None:
@@ -83,33 +80,41 @@ def mask_wearing(people: graph_model.Graph(), people_with_masks: float) -> None:
     :param people: List of Person objects.
     :param people_with_masks: Effectiveness of masks (0 to 1).
     """
-    # Calculate the number of vaccinated people
-    num_vaccinated = int(people_with_masks * len(people.nodes))
+    policies.apply_to_graph(people, ['masks'], [people_with_masks])
 
-    # Shuffle the keys of the dictionary
-    keys = list(people.nodes.values())
-    random.shuffle(keys)
 
-    # Select the first num_vaccinated keys
-    vaccinated_people = keys[:num_vaccinated]
-
-    # Update infection probability for vaccinated individuals
-    for person in vaccinated_people:
-        person.infection_probability *= 0.4  # Assuming 40% reduction in infection probability from canada.gov
+def infection_tracing(people: graph_model.Graph(), tracer: tracing.ContactTracer, tick: int) -> None:
+    """
+    Contact tracing to identify and isolate individuals who have been in contact with infected individuals.
+    Releases the quarantines that end and quarantines the cases the tracer detected with their contacts, the people
+    put in quarantine are placed at random in QUARANTINE_ZONE, which shares the corner of the map.
+    :param people: List of Person objects.
+    :param tracer: Contact tracer fed with the contacts and infections of people, indexed in the order of people.nodes
+    :param tick: The tick about to be simulated.
+    """
+    quarantined, _ = tracer.update(tick)
+    if len(quarantined):
+        persons = list(people.nodes.values())
+        xs, ys = QUARANTINE_ZONE.world.random_positions(np.random, len(quarantined))
+        for i, x, y in zip(quarantined.tolist(), xs.tolist(), ys.tolist()):
+            persons[i].x, persons[i].y = x, y
 
 
-def infection_tracing(people: graph_model.Graph(), infected_threshold: float) -> None:
+def move_quarantined(people: graph_model.Graph(), tracer: tracing.ContactTracer, tick: int) -> None:
     """
-    contact tracing to identify and isolate individuals who have been in contact with infected individuals.
-    :param people: List of Person objects.
-    :param infected_threshold: Threshold for identifying infected individuals (0 to 1).
+    Move the people in quarantine for one tick with QUARANTINE_ZONE, all at once on arrays of their positions and
+    speeds, so they stay inside the zone.
+    :param tracer: Contact tracer indexed in the order of people.nodes
     """
-    for person in people:
-        if person.infected and random.random() < infected_threshold:
-            # Transport infected person to the bottom corner of the map
-            person.x = np.random.randint(0, 100)
-            person.y = np.random.randint(0, 100)
-            person.move(100, 100)  # Set y-coordinate to the bottom edge of the screen
+    persons = [person for person, quarantined in zip(people.nodes.values(), tracer.quarantined) if quarantined]
+    if not persons:
+        return
+    zone = SimpleNamespace(**{name: np.array([getattr(person, name) for person in persons], dtype=np.float64)
+                              for name in ('x', 'y', 'speed_x', 'speed_y')})
+    QUARANTINE_ZONE.move(zone, tick)
+    for person, x, y, speed_x, speed_y in zip(persons, zone.x.tolist(), zone.y.tolist(), zone.speed_x.tolist(),
+                                              zone.speed_y.tolist()):
+        person.x, person.y, person.speed_x, person.speed_y = x, y, speed_x, speed_y
 
 
 def staggered_work_hours(people: graph_model.Graph(), staggered_factor: float) -> None:
@@ -118,17 +123,7 @@ def staggered_work_hours(people: graph_model.Graph(), staggered_factor: float) -
     :param people: List of Person objects.
     :param staggered_factor: Factor to adjust work hours (0 to 1).
     """
-    people_list = list(people.nodes.values())
-
-    # Adjust work hours for individuals to stagger their arrival and departure times
-    total_people = len(people_list)
-    num_staggered_people = int(total_people * staggered_factor)
-    staggered_people = random.sample(people_list, num_staggered_people)
-
-    for person in staggered_people:
-        # Reduce the movement speed only for the staggered individuals
-        person.speed_x *= 0.5  # Example: Reduce movement speed by half
-        person.speed_y *= 0.5  # Example: Reduce movement speed by half
+    policies.apply_to_graph(people, ['staggered working hours'], [staggered_factor])
 
 
 def remote_work(people: graph_model.Graph(), remote_work_factor: float) -> None:
@@ -137,19 +132,12 @@ def remote_work(people: graph_model.Graph(), remote_work_factor: float) -> None:
     :param people: List of Person objects.
     :param remote_work_factor: Factor to increase remote work (0 to 1).
     """
-    # Transition individuals to remote work where feasible
-    people_list = list(people.nodes.values())
-
-    # Adjust remote work  for individuals to prevent them from moving much
-    num_staggered_people = int(len(people_list) * remote_work_factor)
-    staggered_people = random.sample(people_list, num_staggered_people)
-
-    for person in staggered_people:
-        person.speed_x *= abs(remote_work_factor - 1)  # Reduce movement speed
-        person.speed_y *= abs(remote_work_factor - 1)
+    policies.apply_to_graph(people, ['remote work'], [remote_work_factor])
 
 
 if __name__ == "__main__":
+    import python_ta
+
     python_ta.check_all(config={
         'max-line-length': 170,
         'disable': ['E1136', 'W0221'],
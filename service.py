@@ -0,0 +1,477 @@
+"""
+Module for running simulations in a local service, so a tool can submit runs without waiting for them.
+
+The service is an asyncio HTTP server, on a TCP port or a Unix socket, taking the JSON arguments of engine.simulate.
+Jobs wait in a queue and run on a fixed number of worker processes, started once with the simulation modules already
+imported and warmed up, so many users share the workers and no job pays for starting Python or importing numpy.
+While a job runs its worker sends the new susceptible, infected and recovered counts every progress_every ticks, and
+the service streams them as server-sent events to every client following the job. A queued job is cancelled by
+marking it so it is skipped when its turn comes, and no longer counts against max_pending, a running one by a flag in
+shared memory that the worker checks every time it sends progress.
+
+Results go through the cache module like cache.cached_simulate, so a scenario already run is answered at once.
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers 2] [--progress-every 100]
+
+Endpoints:
+    POST /jobs: submit the arguments of engine.simulate as a JSON object, returns the status of the new job
+    GET /jobs: status of every job
+    GET /jobs/<id>: status of a job, with the summary statistics once it is done
+    GET /jobs/<id>/events: server-sent 'progress' events with the counts of the new ticks, then one 'done',
+                           'cancelled' or 'error' event
+    DELETE /jobs/<id>: cancel a queued or running job
+
+Classes:
+    Cancelled: Raised in a worker to stop a cancelled job.
+    Job: A submitted simulation and the events it produced.
+    SimulationService: The job queue, the worker processes and the HTTP handler.
+
+Functions:
+    run_job: Run one job in a worker process.
+    serve: Run a SimulationService until it is cancelled.
+    main: Command line entry point.
+
+Constants:
+    DEFAULT_PORT: Default TCP port.
+    PROGRESS_EVERY: Default ticks between progress events.
+    MAX_PENDING: Jobs that can wait in the queue before new ones are refused.
+    MAX_FINISHED: Finished jobs kept for their status and events.
+    SERIES: Names of the streamed counts.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import multiprocessing
+import threading
+from typing import Any, AsyncIterator, Optional
+
+import numpy as np
+
+import cache
+import engine
+
+DEFAULT_PORT = 8765
+PROGRESS_EVERY = 100
+MAX_PENDING = 100
+MAX_FINISHED = 1000
+SERIES = ('susceptible', 'infected', 'recovered')
+
+_CANCEL_SLOTS = 4096
+_FINAL = ('done', 'cancelled', 'error')
+_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            409: 'Conflict', 503: 'Service Unavailable'}
+# Arguments of engine.simulate a job can not set, they are not JSON or belong to the worker
+_RESERVED = ('heterogeneity', 'movement', 'callback', 'progress', 'progress_every')
+
+# Set in every worker process by _initialize
+_progress_queue: Any = None
+_cancelled: Any = None
+
+
+class Cancelled(Exception):
+    """Raised in a worker to stop a job that was cancelled while running."""
+
+
+def _initialize(progress_queue: Any, cancelled: Any) -> None:
+    """Keep the channels to the service and run a tiny simulation so the first job finds everything warmed up."""
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+    engine.simulate(20, 5, ticks=2)
+
+
+def run_job(job_id: int, config: dict, progress_every: int, use_cache: bool) -> tuple[dict[str, np.ndarray], dict]:
+    """
+    Run engine.simulate with the arguments of a job in a worker process, sending the counts of the new ticks every
+    progress_every ticks and raising Cancelled once the job is cancelled.
+    :return: the counts of every tick and their summary statistics
+    """
+    sent = 0
+
+    def progress(tick: int, counts: np.ndarray) -> None:
+        nonlocal sent
+        if _cancelled[job_id % _CANCEL_SLOTS] == job_id:
+            raise Cancelled
+        _progress_queue.put((job_id, sent, counts[sent:].copy()))
+        sent = tick + 1
+
+    def run() -> dict[str, np.ndarray]:
+        return engine.simulate(**config, progress=progress, progress_every=progress_every)
+
+    if not use_cache:
+        counts = run()
+        return counts, cache.summary_statistics(counts)
+    return cache.ResultCache().get_or_run({'function': 'engine.simulate', **config}, run)
+
+
+class Job:
+    """
+    A submitted simulation and the events it produced so far, kept so a client following it late gets all of them.
+
+    Instance attributes:
+    - id: int, number of the job
+    - config: dict, the arguments of engine.simulate
+    - status: str, 'queued', 'running', 'done', 'cancelled' or 'error'
+    - ticks: int, number of ticks whose counts were published
+    - summary: dict, summary statistics once the job is done
+    - error: str, why the job failed
+    - events: list of (name, data) of the published events
+
+    Representation Invariants:
+    - self.status in ('queued', 'running', 'done', 'cancelled', 'error')
+    """
+    id: int
+    config: dict
+    status: str
+    ticks: int
+    summary: Optional[dict]
+    error: Optional[str]
+    events: list[tuple[str, dict]]
+    _updated: asyncio.Event
+
+    def __init__(self, job_id: int, config: dict) -> None:
+        self.id = job_id
+        self.config = config
+        self.status = 'queued'
+        self.ticks = 0
+        self.summary = None
+        self.error = None
+        self.events = []
+        self._updated = asyncio.Event()
+
+    def publish(self, name: str, data: dict) -> None:
+        """Add an event and wake up every client waiting for one."""
+        self.events.append((name, data))
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def publish_counts(self, start: int, counts: np.ndarray) -> None:
+        """Publish the counts of the ticks from start on that were not published yet."""
+        counts = counts[max(self.ticks - start, 0):]
+        if len(counts):
+            self.publish('progress', {'start': self.ticks,
+                                      **{name: counts[:, i].tolist() for i, name in enumerate(SERIES)}})
+            self.ticks += len(counts)
+
+    async def follow(self) -> AsyncIterator[tuple[str, dict]]:
+        """Yield every event of the job, the past ones first, until the final one."""
+        index = 0
+        while True:
+            while index < len(self.events):
+                name, data = self.events[index]
+                index += 1
+                yield name, data
+                if name in _FINAL:
+                    return
+            await self._updated.wait()
+
+    def state(self) -> dict:
+        """The status of the job as JSON values."""
+        state = {'id': self.id, 'status': self.status, 'ticks': self.ticks, 'config': self.config}
+        if self.summary is not None:
+            state['summary'] = self.summary
+        if self.error is not None:
+            state['error'] = self.error
+        return state
+
+
+class SimulationService:
+    """
+    The job queue, the worker processes and the HTTP handler of the service.
+    At most workers jobs run at once, one per worker process, the others wait in the queue in submission order.
+
+    Instance attributes:
+    - workers: int, number of worker processes
+    - progress_every: int, ticks between progress events
+    - max_pending: int, queued jobs before new ones are refused
+    - use_cache: bool, if results are looked up in and stored to the cache module
+    - jobs: dict from id to every Job kept
+
+    Representation Invariants:
+    - self.workers > 0
+    - self.progress_every > 0
+    """
+    workers: int
+    progress_every: int
+    max_pending: int
+    use_cache: bool
+    jobs: dict[int, Job]
+    _next_id: int
+    _queue: Optional[asyncio.Queue]
+    _pending: int
+    _pool: Any
+    _progress_queue: Any
+    _cancelled: Any
+    _tasks: list[asyncio.Task]
+    _listener: Optional[threading.Thread]
+
+    def __init__(self, workers: int = 2, progress_every: int = PROGRESS_EVERY, max_pending: int = MAX_PENDING,
+                 use_cache: bool = True) -> None:
+        self.workers = workers
+        self.progress_every = progress_every
+        self.max_pending = max_pending
+        self.use_cache = use_cache
+        self.jobs = {}
+        self._next_id = 1
+        self._queue = None
+        # Jobs still queued, the queue also holds the cancelled ones until a task takes them out
+        self._pending = 0
+        self._pool = None
+        self._progress_queue = None
+        self._cancelled = None
+        self._tasks = []
+        self._listener = None
+
+    async def start(self) -> None:
+        """Start the worker processes, which warm up in the background, and start taking jobs from the queue."""
+        loop = asyncio.get_running_loop()
+        self._progress_queue = multiprocessing.Queue()
+        self._cancelled = multiprocessing.Array('q', [0] * _CANCEL_SLOTS, lock=False)
+        self._pool = multiprocessing.Pool(self.workers, _initialize, (self._progress_queue, self._cancelled))
+        # Forward the progress of the workers to the event loop
+        self._listener = threading.Thread(target=self._listen, args=(loop,), daemon=True)
+        self._listener.start()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run_jobs()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """Stop taking jobs, stop the worker processes and the progress listener."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._listener.join()
+
+    def _listen(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Hand every progress message of the workers to the event loop, until a None message."""
+        while True:
+            message = self._progress_queue.get()
+            if message is None:
+                return
+            loop.call_soon_threadsafe(self._on_progress, *message)
+
+    def _on_progress(self, job_id: int, start: int, counts: np.ndarray) -> None:
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == 'running':  # progress arriving after the result is already published
+            job.publish_counts(start, counts)
+
+    def submit(self, config: dict) -> Job:
+        """
+        Queue a job with the arguments of engine.simulate.
+        :raise ValueError: if an argument is unknown or can not be given to a job, or a required one is missing
+        :raise OverflowError: if max_pending jobs are already queued
+        """
+        parameters = inspect.signature(engine.simulate).parameters
+        unknown = [name for name in config if name not in parameters or name in _RESERVED]
+        if unknown:
+            raise ValueError(f'Unknown arguments {unknown}')
+        missing = [name for name, parameter in parameters.items()
+                   if parameter.default is inspect.Parameter.empty and name not in config]
+        if missing:
+            raise ValueError(f'Missing arguments {missing}')
+        if self._pending >= self.max_pending:
+            raise OverflowError(f'{self.max_pending} jobs are already waiting')
+        job = Job(self._next_id, config)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._pending += 1
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """
+        Cancel a queued or running job. A running job stops the next time its worker sends progress.
+        :return: if the job was still queued or running
+        """
+        if job.status == 'queued':
+            self._pending -= 1
+            self._finish(job, 'cancelled', {})
+            return True
+        if job.status == 'running':
+            self._cancelled[job.id % _CANCEL_SLOTS] = job.id
+            return True
+        return False
+
+    def _finish(self, job: Job, status: str, data: dict) -> None:
+        """Publish the final event of a job and forget the oldest finished jobs beyond MAX_FINISHED."""
+        job.status = status
+        job.publish(status, data)
+        finished = [job_id for job_id, kept in self.jobs.items() if kept.status in _FINAL]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED, 0)]:
+            del self.jobs[job_id]
+
+    async def _run_jobs(self) -> None:
+        """Take jobs from the queue one at a time and run each on the worker pool."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.status != 'queued':  # cancelled while waiting
+                continue
+            self._pending -= 1
+            job.status = 'running'
+            result = loop.create_future()
+            self._pool.apply_async(
+                run_job, (job.id, job.config, self.progress_every, self.use_cache),
+                callback=lambda value, future=result: loop.call_soon_threadsafe(_resolve, future, value, None),
+                error_callback=lambda error, future=result: loop.call_soon_threadsafe(_resolve, future, None, error))
+            try:
+                counts, summary = await result
+            except Cancelled:
+                self._finish(job, 'cancelled', {'ticks': job.ticks})
+            except Exception as error:  # the arguments were wrong, tell the client why
+                job.error = f'{type(error).__name__}: {error}'
+                self._finish(job, 'error', {'error': job.error})
+            else:
+                job.publish_counts(0, np.stack([counts[name] for name in SERIES], axis=1))
+                job.summary = cache.canonical(summary)
+                self._finish(job, 'done', {'summary': job.summary})
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one HTTP request, the connection is closed afterwards."""
+        try:
+            try:
+                request = await _read_request(reader)
+            except ValueError as error:
+                await _respond(writer, 400, {'error': str(error)})
+                return
+            if request is None:
+                return
+            method, path, body = request
+            await self._route(method, path.strip('/').split('/'), body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, parts: list[str], body: bytes, writer: asyncio.StreamWriter) -> None:
+        if parts[0] != 'jobs' or len(parts) > 3 or (len(parts) == 3 and parts[2] != 'events'):
+            await _respond(writer, 404, {'error': 'Not found'})
+            return
+        if len(parts) == 1:
+            if method == 'GET':
+                await _respond(writer, 200, [job.state() for job in self.jobs.values()])
+            elif method == 'POST':
+                try:
+                    config = json.loads(body or b'{}')
+                    if not isinstance(config, dict):
+                        raise ValueError('The arguments must be a JSON object')
+                    job = self.submit(config)
+                except ValueError as error:
+                    await _respond(writer, 400, {'error': str(error)})
+                except OverflowError as error:
+                    await _respond(writer, 503, {'error': str(error)})
+                else:
+                    await _respond(writer, 201, job.state())
+            else:
+                await _respond(writer, 405, {'error': f'{method} not allowed'})
+            return
+
+        job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            await _respond(writer, 404, {'error': f'No job {parts[1]}'})
+        elif len(parts) == 3 and method == 'GET':
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                         b'Connection: close\r\n\r\n')
+            async for name, data in job.follow():
+                writer.write(f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode())
+                await writer.drain()
+        elif len(parts) == 2 and method == 'GET':
+            await _respond(writer, 200, job.state())
+        elif len(parts) == 2 and method == 'DELETE':
+            if self.cancel(job):
+                await _respond(writer, 200, job.state())
+            else:
+                await _respond(writer, 409, {'error': f'Job {job.id} is already {job.status}'})
+        else:
+            await _respond(writer, 405, {'error': f'{method} not allowed'})
+
+
+def _resolve(future: asyncio.Future, value: Any, error: Optional[BaseException]) -> None:
+    """Set the result of a future from a worker callback, unless it was cancelled meanwhile."""
+    if not future.done():
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[tuple[str, str, bytes]]:
+    """
+    Read the method, path and body of an HTTP request, None if the connection closed before one.
+    :raise ValueError: if the request line or the Content-Length is malformed
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    words = line.decode('latin-1').split()
+    if len(words) < 2:
+        raise ValueError(f'Malformed request line {line!r}')
+    method, path = words[:2]
+    length = 0
+    while True:
+        header = (await reader.readline()).decode('latin-1').strip()
+        if not header:
+            break
+        name, _, value = header.partition(':')
+        if name.strip().lower() == 'content-length':
+            if not value.strip().isdigit():
+                raise ValueError(f'Malformed Content-Length {value.strip()!r}')
+            length = int(value)
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path.split('?')[0], body
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+    """Send a JSON response."""
+    body = json.dumps(payload).encode()
+    writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+
+
+async def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT, unix: Optional[str] = None,
+                service: Optional[SimulationService] = None) -> None:
+    """
+    Run a SimulationService until the task is cancelled.
+    :param unix: Path of a Unix socket to listen on instead of host and port
+    :param service: The service to run, one with the default settings if None
+    """
+    service = service if service is not None else SimulationService()
+    await service.start()
+    try:
+        if unix is not None:
+            server = await asyncio.start_unix_server(service.handle, unix)
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Command line entry point, see the module docstring."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of host and port')
+    parser.add_argument('--workers', type=int, default=2, help='number of worker processes')
+    parser.add_argument('--progress-every', type=int, default=PROGRESS_EVERY, help='ticks between progress events')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the result cache')
+    args = parser.parse_args(argv)
+    service = SimulationService(args.workers, args.progress_every, use_cache=not args.no_cache)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Module for running one large simulation on several processes.
+
+The world is cut into vertical strips, one per worker process. Every column of the population lives in shared
+memory, and a worker only moves, infects and advances the people currently inside its strip. Each tick the workers
+exchange nothing but the indices of the people that crossed into a neighbouring strip and of the people within the
+infection radius of a border (the halo), so a worker never has to look at the whole population.
+
+Infections across a border are resolved by the worker that owns the susceptible person, using the halo of its
+neighbour, and the random draw of a pair only depends on the seed, the tick and the two people
+(engine.pair_uniforms), so a sharded run gives exactly the same counts as engine.simulate with the same arguments.
+
+Classes:
+    SharedArrays: Named numpy arrays packed in one block of shared memory.
+
+Functions:
+    simulate_sharded: Run a simulation with the world split between worker processes.
+
+Constants:
+    UNSUPPORTED: Arguments of engine.simulate that simulate_sharded does not take.
+"""
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+
+import engine
+import kernels
+import mobility
+import traits
+
+UNSUPPORTED = ('distance_threshold', 'preventions', 'schedule', 'tracing_params', 'movement', 'callback', 'progress',
+               'progress_every')
+
+
+class SharedArrays:
+    """
+    Named numpy arrays packed in one block of shared memory.
+    Pass name and spec to another process to attach to the same arrays there.
+
+    Instance attributes:
+    - spec: dict, array name -> (shape, dtype)
+    - arrays: dict, array name -> numpy array backed by the shared memory
+    - name: str, name of the shared memory block
+    """
+    spec: dict[str, tuple[tuple[int, ...], Any]]
+    arrays: dict[str, np.ndarray]
+    name: str
+
+    def __init__(self, spec: dict[str, tuple[tuple[int, ...], Any]], name: Optional[str] = None) -> None:
+        self.spec = spec
+        offsets = {}
+        size = 0
+        for array_name, (shape, dtype) in spec.items():
+            offsets[array_name] = size
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64  # keep every array 64 byte aligned
+
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            # Workers share the resource tracker of the process that created the block, which unlinks it
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self.arrays = {array_name: np.ndarray(shape, dtype, buffer=self._memory.buf, offset=offsets[array_name])
+                       for array_name, (shape, dtype) in spec.items()}
+
+    def close(self) -> None:
+        """Detach from the shared memory, the arrays can not be used afterwards."""
+        self.arrays = {}
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Free the shared memory, called once by the process that created it."""
+        self._memory.unlink()
+
+
+def _strip_of(x: np.ndarray, strip_width: float, num_strips: int) -> np.ndarray:
+    """Return the strip each x position is in, positions past an edge belong to the outermost strip."""
+    return np.clip(np.floor(x / strip_width), 0, num_strips - 1).astype(np.int64)
+
+
+def _publish(buffer: np.ndarray, counts: np.ndarray, slot: tuple[int, int], indices: np.ndarray) -> None:
+    """Write indices into one slot of a shared buffer."""
+    buffer[slot][:len(indices)] = indices
+    counts[slot] = len(indices)
+
+
+def _received(buffer: np.ndarray, counts: np.ndarray, slot: tuple[int, int]) -> np.ndarray:
+    """Read the indices in one slot of a shared buffer."""
+    return buffer[slot][:counts[slot]]
+
+
+def _run_strip(strip: int, num_strips: int, arrays: dict[str, np.ndarray], params: dict, barrier: Any) -> None:
+    """
+    Simulate the people of one strip for every tick. Every worker runs this in lock step with the others, the barrier
+    separating the phases in which a shared array is written from the ones in which it is read.
+    """
+    population = engine.Population(**{name: arrays[name] for name in engine.Population.FIELDS})
+    width, height, radius = params['width'], params['height'], params['infection_radius']
+    strip_width = width / num_strips
+    left, right = strip * strip_width, (strip + 1) * strip_width
+    outbox, outbox_count = arrays['outbox'], arrays['outbox_count']
+    halo, halo_count = arrays['halo'], arrays['halo_count']
+    events = arrays['events']
+    kernel = kernels.get_kernels(params['backend'])
+
+    own = np.flatnonzero(_strip_of(population.x, strip_width, num_strips) == strip)
+    num_infected = int(np.count_nonzero(population.infected))
+    barrier.wait()  # nobody moves before everyone has found their people
+    for tick in range(params['ticks']):
+        # Move and hand the people that left the strip to the neighbours
+        engine.move(population, width, height, own)
+        destination = _strip_of(population.x[own], strip_width, num_strips)
+        _publish(outbox, outbox_count, (strip, 0), own[destination < strip])
+        _publish(outbox, outbox_count, (strip, 1), own[destination > strip])
+        own = own[destination == strip]
+        barrier.wait()
+
+        # Every strip finished the last tick, so all of them see the same count and stop together
+        if params['fast_forward'] and tick > 0:
+            num_infected += int(events[:, tick - 1, 0].sum() - events[:, tick - 1, 1].sum())
+            if not num_infected:
+                break
+
+        # Take over the people that arrived and publish the people near the borders
+        arrived = [own]
+        if strip > 0:
+            arrived.append(_received(outbox, outbox_count, (strip - 1, 1)))
+        if strip < num_strips - 1:
+            arrived.append(_received(outbox, outbox_count, (strip + 1, 0)))
+        own = np.concatenate(arrived)
+        x = population.x[own]
+        _publish(halo, halo_count, (strip, 0), own[x < left + radius])
+        _publish(halo, halo_count, (strip, 1), own[x >= right - radius])
+        barrier.wait()
+
+        # Find contacts among the own people and the halos of the neighbours, only infect own people
+        local = [own]
+        if strip > 0:
+            local.append(_received(halo, halo_count, (strip - 1, 1)))
+        if strip < num_strips - 1:
+            local.append(_received(halo, halo_count, (strip + 1, 0)))
+        local = np.concatenate(local)
+        a, b = kernel.contact_pairs(population.x[local], population.y[local], radius)
+        draws = engine.pair_uniforms(params['seed'], tick, local[a], local[b])
+        targets = kernel.spread(population.infected[local], population.recovered[local],
+                                population.infection_probability[local], population.infectiousness[local],
+                                population.susceptibility[local], a, b, draws)
+        newly_infected = local[targets[targets < len(own)]]
+        barrier.wait()
+
+        events[strip, tick] = engine.advance(population, newly_infected, own)
+
+
+def _worker(strip: int, num_strips: int, name: str, spec: dict, params: dict, barrier: Any) -> None:
+    """Entry point of a worker process."""
+    shared = SharedArrays(spec, name)
+    try:
+        _run_strip(strip, num_strips, shared.arrays, params, barrier)
+    except BaseException:
+        barrier.abort()  # release the other workers instead of leaving them waiting forever
+        raise
+    finally:
+        shared.close()
+
+
+def simulate_sharded(num_persons: int, infection_radius: float, recovery_time: int = 100, ticks: int = 3000,
+                     seed: int = 0, width: int = mobility.WIDTH, height: int = mobility.HEIGHT,
+                     infection_probability: Optional[float] = None, backend: str = 'numpy',
+                     num_workers: Optional[int] = None,
+                     heterogeneity: Optional[traits.Heterogeneity] = None,
+                     fast_forward: bool = True, **unsupported: Any) -> dict[str, np.ndarray]:
+    """
+    Run a simulation with the world split into vertical strips, one per worker process.
+    Takes the arguments of engine.simulate and returns the same counts, except for the ones in UNSUPPORTED: social
+    distancing, preventions, scheduled interventions, contact tracing, mobility models, callbacks and progress.
+    :param num_workers: Number of worker processes, the number of CPUs if None. It is lowered so that a strip is at
+                        least as wide as the infection radius and the fastest person's step.
+    :param fast_forward: Stop once nobody is infected, the remaining ticks get the last counts
+    :return: dict with the susceptible, infected and recovered count after every tick
+    :raise ValueError: if an argument in UNSUPPORTED is given
+    :raise TypeError: if an argument engine.simulate does not take either is given
+    """
+    if unsupported:
+        names = sorted(set(unsupported) & set(UNSUPPORTED))
+        if names:
+            raise ValueError(f'simulate_sharded does not support {", ".join(names)}, use engine.simulate instead')
+        raise TypeError(f'simulate_sharded got unexpected arguments {", ".join(sorted(unsupported))}')
+    population = engine.create_population(num_persons, np.random.default_rng(seed), width, height,
+                                          infection_probability, recovery_time=recovery_time,
+                                          heterogeneity=heterogeneity)
+    fastest = float(np.abs(population.speed_x).max(initial=0))
+    num_strips = max(1, min(num_workers or os.cpu_count() or 1, int(width // max(infection_radius, fastest, 1))))
+
+    # The exchange buffers can hold the whole population, shared memory pages are only allocated once written to
+    spec = {name: ((num_persons,), dtype) for name, dtype in engine.Population.FIELDS.items()}
+    spec.update({
+        'outbox': ((num_strips, 2, num_persons), np.int64),
+        'outbox_count': ((num_strips, 2), np.int64),
+        'halo': ((num_strips, 2, num_persons), np.int64),
+        'halo_count': ((num_strips, 2), np.int64),
+        'events': ((num_strips, ticks, 2), np.int64),
+    })
+    params = {'width': width, 'height': height, 'infection_radius': infection_radius,
+              'ticks': ticks, 'seed': seed, 'backend': backend, 'fast_forward': fast_forward}
+
+    shared = SharedArrays(spec)
+    try:
+        for name, column in population.columns().items():
+            shared.arrays[name][:] = column
+        shared.arrays['events'][:] = 0
+
+        if num_strips == 1:
+            _run_strip(0, 1, shared.arrays, params, threading.Barrier(1))
+        else:
+            context = multiprocessing.get_context()
+            barrier = context.Barrier(num_strips)
+            workers = [context.Process(target=_worker, args=(strip, num_strips, shared.name, spec, params, barrier))
+                       for strip in range(num_strips)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            if any(worker.exitcode != 0 for worker in workers):
+                raise RuntimeError('A simulation worker failed')
+
+        events = shared.arrays['events'].sum(axis=0)
+    finally:
+        shared.close()
+        shared.unlink()
+
+    num_infected = int(np.count_nonzero(population.infected)) + np.cumsum(events[:, 0] - events[:, 1])
+    num_recovered = np.cumsum(events[:, 1])
+    return {'susceptible': num_persons - num_infected - num_recovered, 'infected': num_infected,
+            'recovered': num_recovered}
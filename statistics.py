@@ -3,6 +3,7 @@ Module for analyzing and visualizing SIR model simulations.
 
 This module contains functions for plotting infection curves, calculating infection rates,
 analyzing SIR model simulations, and visualizing simulation results using Plotly.
+Plotly is only imported by the functions that plot, the statistics themselves only need numpy.
 
 Functions:
     plot_infection_curve: Plot the infection curve showing the number of infected individuals over time.
@@ -11,10 +12,12 @@ Functions:
     plot_sir_curve: Plot the SIR curve showing susceptible, infected, and recovered individuals over time.
     plot_infection_curve_with_fft: Plot the infection curve and its FFT spectrum.
     analyze_sir_simulation_with_fft: Analyze various statistics from a SIR model simulation including FFT analysis.
+    sir_statistics: Compute the final and rate statistics of a SIR model simulation without plotting.
+    fft_statistics: Compute the peak and dominant frequencies of the infection curve without plotting.
+    compartment_statistics: Compute the statistics of every compartment of a simulation at once.
+    plot_compartments: Plot the count of every compartment over time.
 """
 import numpy as np
-import plotly.graph_objects as go
-import python_ta
 
 
 def plot_infection_curve(infected_counts: list) -> None:
@@ -23,6 +26,8 @@ def plot_infection_curve(infected_counts: list) -> None:
     Args:
     - infected_counts: List of integers representing the number of infected individuals at each iteration.
     """
+    import plotly.graph_objects as go
+
     # Calculate decimal days passed
     days_passed = [i / 300 for i in range(len(infected_counts))]  # Assuming 300 iterations per day
 
@@ -61,26 +66,20 @@ def analyze_sir_simulation(infected_counts: list, recovered_counts: list, popula
       recovered_counts: List of integers representing number of recovered individuals at each iteration (optional)
       population: Total population size
     """
-    # Final Statistics
-    peak_infected = max(infected_counts)
-    total_recovered = sum(recovered_counts) if recovered_counts else 0
-    percent_recovered = (total_recovered / population) * 100
-    time_to_peak = infected_counts.index(peak_infected)
+    import plotly.graph_objects as go
 
-    # Rate Statistics
-    max_infection_rate = np.max(np.diff(infected_counts))
-    recovery_rate = np.mean(np.diff(recovered_counts)) if recovered_counts else 0
+    stats = sir_statistics(infected_counts, recovered_counts, population)
 
     # Print results
     print("Final Statistics:")
-    print(f"Peak Number of Infected: {peak_infected}")
-    print(f"Total Number Recovered: {total_recovered}")
-    print(f"Percentage Recovered: {percent_recovered:.2f}%")
-    print(f"Time to Peak Infection: {time_to_peak} iterations")
+    print(f"Peak Number of Infected: {stats['peak_infected']}")
+    print(f"Total Number Recovered: {stats['total_recovered']}")
+    print(f"Percentage Recovered: {stats['percent_recovered']:.2f}%")
+    print(f"Time to Peak Infection: {stats['time_to_peak']} iterations")
 
     print("\nRate Statistics:")
-    print(f"Maximum Infection Rate: {max_infection_rate}")
-    print(f"Recovery Rate: {recovery_rate}")
+    print(f"Maximum Infection Rate: {stats['max_infection_rate']}")
+    print(f"Recovery Rate: {stats['recovery_rate']}")
 
     # Create Plotly figure for infected and recovered counts
     fig = go.Figure()
@@ -108,6 +107,8 @@ def plot_sir_curve(infected_counts: list, recovered_counts: list, susceptible_co
       recovered_counts: List of integers representing number of recovered individuals at each iteration
       susceptible_counts: List of integers representing number of susceptible individuals at each iteration (optional)
     """
+    import plotly.graph_objects as go
+
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=list(range(len(infected_counts))),
                              y=infected_counts,
@@ -137,6 +138,8 @@ def plot_infection_curve_with_fft(infected_counts: list, sampling_rate=300) -> N
     - infected_counts: List of integers representing the number of infected individuals at each iteration.
     - sampling_rate: The sampling rate of the time series data (iterations per day). Default is 300.
     """
+    import plotly.graph_objects as go
+
     # Calculate time values (decimal days)
     time_values = np.arange(len(infected_counts)) / sampling_rate
 
@@ -174,56 +177,128 @@ def analyze_sir_simulation_with_fft(infected_counts: list, recovered_counts: lis
     - population: Total population size.
     - sampling_rate: The sampling rate of the time series data (iterations per day). Default is 300.
     """
-    # Perform FFT on infected counts
-    fft_spectrum = np.fft.fft(infected_counts)
-    fft_freq = np.fft.fftfreq(len(infected_counts), d=1 / sampling_rate)  # Frequency values
-
-    # Calculate peak frequency and amplitude
-    peak_freq_index = np.argmax(np.abs(fft_spectrum))
-    peak_freq = fft_freq[peak_freq_index]
-    peak_amplitude = np.abs(fft_spectrum[peak_freq_index])
+    fft_stats = fft_statistics(infected_counts, sampling_rate)
 
     # Plot infection curve with FFT spectrum
     plot_infection_curve_with_fft(infected_counts, sampling_rate)
 
     # Print peak frequency and amplitude
-    print(f"Peak Frequency: {peak_freq} Hz")
-    print(f"Peak Amplitude: {peak_amplitude}")
-
-    # Calculate infection rate
-    infection_rate = calculate_infection_rate(infected_counts)
+    print(f"Peak Frequency: {fft_stats['peak_frequency']} Hz")
+    print(f"Peak Amplitude: {fft_stats['peak_amplitude']}")
 
-    # Calculate recovery rate
-    recovery_rate = np.mean(np.diff(recovered_counts))
-
-    # Final Statistics
-    peak_infected = max(infected_counts)
-    total_recovered = sum(recovered_counts)
-    percent_recovered = (total_recovered / population) * 100
-    time_to_peak = infected_counts.index(peak_infected)
+    stats = sir_statistics(infected_counts, recovered_counts, population)
 
     # Print results
     print("Final Statistics:")
-    print(f"Peak Number of Infected: {peak_infected}")
-    print(f"Total Number Recovered: {total_recovered}")
-    print(f"Percentage Recovered: {percent_recovered:.2f}%")
-    print(f"Time to Peak Infection: {time_to_peak} iterations")
-    print(f"Average Infection Rate: {infection_rate}")
-    print(f"Average Recovery Rate: {recovery_rate}")
+    print(f"Peak Number of Infected: {stats['peak_infected']}")
+    print(f"Total Number Recovered: {stats['total_recovered']}")
+    print(f"Percentage Recovered: {stats['percent_recovered']:.2f}%")
+    print(f"Time to Peak Infection: {stats['time_to_peak']} iterations")
+    print(f"Average Infection Rate: {stats['infection_rate']}")
+    print(f"Average Recovery Rate: {stats['recovery_rate']}")
 
     # Additional analyses based on FFT results
-    # Example: Identify dominant frequencies or periodic patterns
-    dominant_freq_indices = np.argsort(np.abs(fft_spectrum))[::-1][:5]  # Get indices of top 5 dominant frequencies
-    dominant_freqs = fft_freq[dominant_freq_indices]
-    dominant_amplitudes = np.abs(fft_spectrum[dominant_freq_indices])
     print("Dominant Frequencies:")
-    for freq, amp in zip(dominant_freqs, dominant_amplitudes):
+    for freq, amp in zip(fft_stats['dominant_frequencies'], fft_stats['dominant_amplitudes']):
         print(f"Frequency: {freq} Hz, Amplitude: {amp}")
 
     # Continue with other analyses as needed
 
 
+def sir_statistics(infected_counts: list, recovered_counts: list, population: int) -> dict:
+    """
+    Compute the final and rate statistics of a SIR model simulation without plotting or printing.
+    Args:
+    - infected_counts: List of integers representing the number of infected individuals at each iteration.
+    - recovered_counts: List of integers representing the number of recovered individuals at each iteration.
+    - population: Total population size.
+    Returns:
+    - Dict with peak_infected, total_recovered, percent_recovered, time_to_peak, max_infection_rate,
+      infection_rate and recovery_rate.
+    """
+    infected = np.asarray(infected_counts)
+    recovered = np.asarray(recovered_counts)
+    time_to_peak = int(np.argmax(infected))
+    total_recovered = recovered.sum() if len(recovered) else 0
+
+    return {
+        'peak_infected': infected[time_to_peak],
+        'total_recovered': total_recovered,
+        'percent_recovered': (total_recovered / population) * 100,
+        'time_to_peak': time_to_peak,
+        'max_infection_rate': np.max(np.diff(infected)) if len(infected) > 1 else 0,
+        'infection_rate': calculate_infection_rate(infected) if len(infected) > 1 else 0,
+        'recovery_rate': np.mean(np.diff(recovered)) if len(recovered) > 1 else 0
+    }
+
+
+def fft_statistics(infected_counts: list, sampling_rate=300, num_dominant=5) -> dict:
+    """
+    Compute the peak and dominant frequencies of the infection curve without plotting or printing.
+    Args:
+    - infected_counts: List of integers representing the number of infected individuals at each iteration.
+    - sampling_rate: The sampling rate of the time series data (iterations per day). Default is 300.
+    - num_dominant: How many of the strongest frequencies to report. Default is 5.
+    Returns:
+    - Dict with peak_frequency, peak_amplitude, dominant_frequencies and dominant_amplitudes.
+    """
+    # Perform FFT on infected counts
+    amplitudes = np.abs(np.fft.fft(infected_counts))
+    fft_freq = np.fft.fftfreq(len(infected_counts), d=1 / sampling_rate)  # Frequency values
+
+    # Calculate peak frequency and amplitude
+    peak_freq_index = np.argmax(amplitudes)
+    dominant_freq_indices = np.argsort(amplitudes)[::-1][:num_dominant]
+    return {
+        'peak_frequency': fft_freq[peak_freq_index],
+        'peak_amplitude': amplitudes[peak_freq_index],
+        'dominant_frequencies': fft_freq[dominant_freq_indices],
+        'dominant_amplitudes': amplitudes[dominant_freq_indices]
+    }
+
+
+def compartment_statistics(counts: dict, population: int) -> dict:
+    """
+    Compute the statistics of every compartment at once, on the counts stacked into one array.
+    Args:
+    - counts: Dict of compartment name -> count at each iteration, like the result of engine.simulate or
+      compartments.simulate_agents.
+    - population: Total population size.
+    Returns:
+    - Dict of compartment name -> dict with peak, time_to_peak, final, percent_final and mean_rate.
+    """
+    names = list(counts)
+    series = np.stack([np.asarray(counts[name]) for name in names], axis=1)
+    time_to_peak = np.argmax(series, axis=0)
+    peak = series[time_to_peak, np.arange(len(names))]
+    final = series[-1]
+    mean_rate = np.mean(np.diff(series, axis=0), axis=0) if len(series) > 1 else np.zeros(len(names))
+    return {name: {'peak': peak[i], 'time_to_peak': int(time_to_peak[i]), 'final': final[i],
+                   'percent_final': final[i] / population * 100, 'mean_rate': mean_rate[i]}
+            for i, name in enumerate(names)}
+
+
+def plot_compartments(counts: dict) -> None:
+    """
+    Plot the count of every compartment over time.
+    Args:
+    - counts: Dict of compartment name -> count at each iteration.
+    """
+    import plotly.graph_objects as go
+
+    colors = {'susceptible': 'blue', 'exposed': 'orange', 'infected': 'red', 'recovered': 'green', 'dead': 'black'}
+    fig = go.Figure()
+    for name, series in counts.items():
+        days_passed = [i / 300 for i in range(len(series))]  # Assuming 300 iterations per day
+        fig.add_trace(go.Scatter(x=days_passed, y=series, mode='lines', name=name.capitalize(),
+                                 line=dict(color=colors.get(name))))
+    fig.update_layout(title='Compartments', xaxis_title='Time (Days)', yaxis_title='Number of Individuals')
+    fig.show()
+
+
 if __name__ == "__main__":
+    import python_ta
+
     python_ta.check_all(config={
         'max-line-length': 170,
         'disable': ['E1136', 'W0221'],
@@ -0,0 +1,25 @@
+"""
+Tests that cached_simulate stores a run once and gives back the same series and summary afterwards.
+
+Run with: python -m pytest test_cache.py
+"""
+import numpy as np
+import pytest
+
+import cache
+
+
+@pytest.mark.parametrize('ticks', [0, 1, 50])
+def test_cached_simulate(ticks: int, tmp_path) -> None:
+    results = cache.ResultCache(str(tmp_path))
+    scenario = {'num_persons': 100, 'infection_radius': 10, 'ticks': ticks, 'seed': 2}
+    counts, summary = cache.cached_simulate(results, **scenario)
+    assert (results.hits, results.misses) == (0, 1)
+    assert all(len(values) == ticks for values in counts.values())
+    assert bool(summary) == (ticks > 0)
+
+    cached_counts, cached_summary = cache.cached_simulate(results, **scenario)
+    assert (results.hits, results.misses) == (1, 1)
+    assert cached_summary == summary
+    for name, values in counts.items():
+        np.testing.assert_array_equal(cached_counts[name], values)
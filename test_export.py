@@ -0,0 +1,63 @@
+"""
+Tests that every export format gives back the series it was given, and that the index lists every run.
+
+Formats whose package is not installed are skipped. Run with: python -m pytest test_export.py
+"""
+import numpy as np
+import pytest
+
+import export
+
+
+@pytest.fixture
+def series() -> dict[str, np.ndarray]:
+    """The counts of a short SIR run."""
+    infected = np.array([1, 3, 8, 15, 12, 6, 2, 0], dtype=np.int64)
+    recovered = np.array([0, 0, 1, 4, 14, 24, 30, 33], dtype=np.int64)
+    return {'susceptible': 33 - infected - recovered + 1, 'infected': infected, 'recovered': recovered}
+
+
+@pytest.mark.parametrize('file_format', export.FORMATS)
+def test_round_trip(file_format: str, tmp_path, series: dict[str, np.ndarray]) -> None:
+    if file_format not in export.available_formats():
+        pytest.skip(f'{export._REQUIRES[file_format]} is not installed')
+    store = export.ResultStore(str(tmp_path), file_format)
+    run_id = store.write({'num_persons': 34, 'seed': 1}, series)
+    loaded = store.load(run_id)
+    assert list(loaded) == list(series)
+    for name, values in series.items():
+        assert loaded[name].dtype == values.dtype
+        np.testing.assert_array_equal(loaded[name], values)
+
+
+@pytest.mark.parametrize('file_format', export.FORMATS)
+def test_round_trip_empty(file_format: str, tmp_path) -> None:
+    if file_format not in export.available_formats():
+        pytest.skip(f'{export._REQUIRES[file_format]} is not installed')
+    store = export.ResultStore(str(tmp_path), file_format)
+    run_id = store.write({}, {'susceptible': np.zeros(0, dtype=np.int64), 'infected': np.zeros(0, dtype=np.int64)})
+    assert {name: len(values) for name, values in store.load(run_id).items()} == {'susceptible': 0, 'infected': 0}
+
+
+def test_arrow_record_batches(tmp_path, series: dict[str, np.ndarray]) -> None:
+    pa = pytest.importorskip('pyarrow')
+    store = export.ResultStore(str(tmp_path), 'arrow')
+    path = store._path('batches', 'arrow')
+    table = pa.table(series)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=3)
+    loaded = store.load('batches', 'arrow')
+    for name, values in series.items():
+        np.testing.assert_array_equal(loaded[name], values)
+
+
+def test_index(tmp_path, series: dict[str, np.ndarray]) -> None:
+    store = export.ResultStore(str(tmp_path), 'npy')
+    assert store.index().empty
+    run_ids = [store.write({'num_persons': 34, 'seed': seed, 'preventions': [('masks', 0.5)]}, series)
+               for seed in range(3)]
+    index = store.index()
+    assert index['run_id'].tolist() == run_ids
+    assert index['seed'].tolist() == [0, 1, 2]
+    assert (index['peak_infected'] == 15).all() and (index['time_to_peak'] == 3).all()
+    assert (index['final_size'] == 33).all()
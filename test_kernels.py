@@ -0,0 +1,71 @@
+"""
+Tests that every installed kernel backend gives the same results as the numpy one.
+
+Run with: python -m pytest test_kernels.py
+"""
+import numpy as np
+import pytest
+
+import engine
+import kernels
+
+BACKENDS = [name for name in kernels.available_backends() if name != 'numpy']
+
+
+def sorted_pairs(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """The pairs as rows, sorted, as backends may find them in any order."""
+    pairs = np.stack((a, b), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+@pytest.fixture
+def world() -> dict[str, np.ndarray]:
+    """A small crowded world with a quarter of the people infected and some recovered."""
+    rng = np.random.default_rng(7)
+    num_persons = 300
+    state = rng.integers(0, 4, num_persons)
+    return {'x': rng.uniform(0, 200, num_persons), 'y': rng.uniform(0, 150, num_persons),
+            'infected': state == 0, 'recovered': state == 1,
+            'infection_probability': rng.uniform(0, 1, num_persons),
+            'infectiousness': rng.uniform(0.5, 1.5, num_persons).astype(np.float32),
+            'susceptibility': rng.uniform(0.5, 1.5, num_persons).astype(np.float32)}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_contact_pairs(backend: str, world: dict[str, np.ndarray]) -> None:
+    expected = kernels.get_kernels('numpy').contact_pairs(world['x'], world['y'], 10)
+    actual = kernels.get_kernels(backend).contact_pairs(world['x'], world['y'], 10)
+    assert len(expected[0]) > 0
+    assert (actual[0] < actual[1]).all()
+    np.testing.assert_array_equal(sorted_pairs(*actual), sorted_pairs(*expected))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_spread(backend: str, world: dict[str, np.ndarray]) -> None:
+    a, b = kernels.get_kernels('numpy').contact_pairs(world['x'], world['y'], 10)
+    draws = engine.pair_uniforms(1, 0, a, b)
+    columns = (world['infected'], world['recovered'], world['infection_probability'], world['infectiousness'],
+               world['susceptibility'])
+    expected = kernels.get_kernels('numpy').spread(*columns, a, b, draws)
+    assert len(expected) > 0
+    np.testing.assert_array_equal(kernels.get_kernels(backend).spread(*columns, a, b, draws), expected)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_repel(backend: str, world: dict[str, np.ndarray]) -> None:
+    a, b = kernels.get_kernels('numpy').contact_pairs(world['x'], world['y'], 25)
+    expected = kernels.get_kernels('numpy').repel(world['x'], world['y'], a, b, 25, 200, 150)
+    actual = kernels.get_kernels(backend).repel(world['x'], world['y'], a, b, 25, 200, 150)
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_simulate(backend: str) -> None:
+    scenario = {'num_persons': 200, 'infection_radius': 15, 'ticks': 100, 'seed': 5, 'width': 300, 'height': 200,
+                'infection_probability': 0.3, 'distance_threshold': 20}
+    expected = engine.simulate(**scenario, backend='numpy')
+    actual = engine.simulate(**scenario, backend=backend)
+    assert expected['recovered'][-1] + expected['infected'][-1] > 1
+    for name in expected:
+        np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
@@ -0,0 +1,70 @@
+"""
+Tests that the service answers malformed requests with 400 and that cancelled jobs free their place in the queue.
+
+No worker processes are started. Run with: python -m pytest test_service.py
+"""
+import asyncio
+import json
+
+import pytest
+
+import service
+
+
+class Writer:
+    """Collects what the service writes to a connection."""
+
+    def __init__(self) -> None:
+        self.data = b''
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def request(raw: bytes) -> tuple[int, dict]:
+    """Send a raw request to a service and return the status and JSON body of the response."""
+    async def send() -> Writer:
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        writer = Writer()
+        await service.SimulationService().handle(reader, writer)
+        return writer
+
+    writer = asyncio.run(send())
+    assert writer.closed
+    head, _, body = writer.data.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+@pytest.mark.parametrize('raw', [b'GET\r\n\r\n', b'\r\n\r\n',
+                                 b'POST /jobs HTTP/1.1\r\nContent-Length: ten\r\n\r\n{}',
+                                 b'POST /jobs HTTP/1.1\r\nContent-Length: -2\r\n\r\n{}'])
+def test_malformed_request(raw: bytes) -> None:
+    status, body = request(raw)
+    assert status == 400 and 'Malformed' in body['error']
+
+
+def test_unknown_path() -> None:
+    assert request(b'GET /nothing HTTP/1.1\r\n\r\n')[0] == 404
+
+
+def test_cancelled_jobs_free_the_queue() -> None:
+    async def fill() -> None:
+        simulation = service.SimulationService(max_pending=2)
+        simulation._queue = asyncio.Queue()  # the queue start() makes, without the worker processes
+        for _ in range(5):
+            simulation.cancel(simulation.submit({'num_persons': 10, 'infection_radius': 5}))
+        simulation.submit({'num_persons': 10, 'infection_radius': 5})
+        simulation.submit({'num_persons': 10, 'infection_radius': 5})
+        with pytest.raises(OverflowError):
+            simulation.submit({'num_persons': 10, 'infection_radius': 5})
+
+    asyncio.run(fill())
@@ -0,0 +1,61 @@
+"""
+Tests that a sharded run gives exactly the counts of engine.simulate with the same arguments, and rejects the ones
+it does not support.
+
+Run with: python -m pytest test_sharded.py
+"""
+import inspect
+
+import numpy as np
+import pytest
+
+import engine
+import sharded
+import traits
+
+SCENARIO = {'num_persons': 400, 'infection_radius': 15, 'recovery_time': 60, 'ticks': 150, 'seed': 3,
+            'width': 400, 'height': 300, 'infection_probability': 0.3}
+
+
+def assert_same_counts(expected: dict[str, np.ndarray], actual: dict[str, np.ndarray]) -> None:
+    """Assert that two runs have the same count of every compartment after every tick."""
+    assert set(expected) == set(actual)
+    for name in expected:
+        np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+
+@pytest.mark.parametrize('num_workers', [1, 2, 3])
+def test_sharded_matches_engine(num_workers: int) -> None:
+    expected = engine.simulate(**SCENARIO)
+    assert expected['recovered'][-1] > 0  # the epidemic spread, so there is something to compare
+    assert_same_counts(expected, sharded.simulate_sharded(**SCENARIO, num_workers=num_workers))
+
+
+def test_sharded_matches_engine_with_traits() -> None:
+    heterogeneity = traits.Heterogeneity(infectiousness=traits.Distribution('gamma', 1.0, 2.0),
+                                         recovery=traits.Distribution('uniform', 1.0, 0.3))
+    expected = engine.simulate(**SCENARIO, heterogeneity=heterogeneity)
+    assert_same_counts(expected, sharded.simulate_sharded(**SCENARIO, num_workers=2, heterogeneity=heterogeneity))
+
+
+def test_sharded_matches_engine_without_fast_forward() -> None:
+    scenario = {**SCENARIO, 'ticks': 400}
+    expected = engine.simulate(**scenario, fast_forward=False)
+    assert_same_counts(expected, sharded.simulate_sharded(**scenario, num_workers=2, fast_forward=False))
+
+
+@pytest.mark.parametrize('argument', sharded.UNSUPPORTED)
+def test_unsupported_argument_is_rejected(argument: str) -> None:
+    with pytest.raises(ValueError, match=argument):
+        sharded.simulate_sharded(**SCENARIO, **{argument: None})
+
+
+def test_unknown_argument_is_rejected() -> None:
+    with pytest.raises(TypeError, match='not_an_argument'):
+        sharded.simulate_sharded(**SCENARIO, not_an_argument=1)
+
+
+def test_unsupported_covers_engine_arguments() -> None:
+    engine_arguments = set(inspect.signature(engine.simulate).parameters)
+    sharded_arguments = set(inspect.signature(sharded.simulate_sharded).parameters)
+    assert engine_arguments - sharded_arguments == set(sharded.UNSUPPORTED)
@@ -0,0 +1,86 @@
+"""
+Tests of the contact ring buffers and of who the tracer quarantines and releases.
+
+Run with: python -m pytest test_tracing.py
+"""
+import numpy as np
+
+import tracing
+
+
+def people(*indices: int) -> np.ndarray:
+    """The indices as an array of people."""
+    return np.array(indices, dtype=np.int64)
+
+
+def detect(tracer: tracing.ContactTracer, tick: int, *cases: int) -> None:
+    """Make sure the cases are detected at the start of tick."""
+    tracer.detection_probability = 1.0
+    tracer.infected(tick - 1 - tracer.detection_delay, people(*cases))
+
+
+def test_ring_buffer_wraps_around() -> None:
+    history = tracing.ContactHistory(10, capacity=3)
+    for tick, other in enumerate(range(1, 6)):
+        history.record(tick, people(0), people(other))
+    # Only the last three contacts of person 0 are kept, the others still know they met person 0
+    np.testing.assert_array_equal(history.recent(people(0), 0), people(3, 4, 5))
+    assert history.head[0] == 5 % 3
+    np.testing.assert_array_equal(history.recent(people(1), 0), people(0))
+
+
+def test_ring_buffer_keeps_last_contacts_of_one_tick() -> None:
+    history = tracing.ContactHistory(10, capacity=3)
+    history.record(0, people(0, 0, 0, 0, 0), people(1, 2, 3, 4, 5))
+    np.testing.assert_array_equal(history.recent(people(0), 0), people(3, 4, 5))
+
+
+def test_repeated_contact_is_refreshed() -> None:
+    history = tracing.ContactHistory(10, capacity=2)
+    history.record(0, people(0), people(1))
+    history.record(1, people(0), people(2))
+    history.record(2, people(0), people(1))
+    # Meeting 1 again refreshes its time instead of pushing 2 out of the buffer
+    np.testing.assert_array_equal(history.recent(people(0), 0), people(1, 2))
+    np.testing.assert_array_equal(history.recent(people(0), 2), people(1))
+
+
+def test_lookback_cutoff() -> None:
+    tracer = tracing.ContactTracer(10, lookback=5)
+    tracer.record(0, people(0), people(1))
+    tracer.record(6, people(0), people(2))
+    tracer.record(7, people(0), people(3))
+    detect(tracer, 12, 0)
+    quarantined, _ = tracer.update(12)
+    # Contacts from tick 12 - 5 = 7 on are traced, the one at tick 6 is too old
+    np.testing.assert_array_equal(np.sort(quarantined), people(0, 3))
+
+
+def test_two_hops() -> None:
+    tracer = tracing.ContactTracer(10, hops=2)
+    tracer.record(0, people(0, 1, 2), people(1, 2, 3))
+    detect(tracer, 1, 0)
+    quarantined, _ = tracer.update(1)
+    np.testing.assert_array_equal(np.sort(quarantined), people(0, 1, 2))
+    assert not tracer.quarantined[3]
+
+
+def test_quarantined_case_is_traced_and_restarted() -> None:
+    tracer = tracing.ContactTracer(10, quarantine_time=10)
+    tracer.record(0, people(0, 1), people(1, 2))
+    detect(tracer, 1, 0)
+    tracer.update(1)
+    assert tracer.quarantined[1] and not tracer.quarantined[2]
+
+    # Person 1 is detected while in quarantine as the contact of 0
+    detect(tracer, 5, 1)
+    quarantined, _ = tracer.update(5)
+    np.testing.assert_array_equal(np.sort(quarantined), people(1, 2))
+
+    # 0 is released when their quarantine ends, 1 only when the restarted one does
+    _, released = tracer.update(11)
+    np.testing.assert_array_equal(released, people(0))
+    assert tracer.quarantined[1] and tracer.quarantined[2]
+    _, released = tracer.update(15)
+    np.testing.assert_array_equal(np.sort(released), people(1, 2))
+    assert not tracer.quarantined.any()
@@ -0,0 +1,24 @@
+"""
+Tests that distributions reject spreads they can not draw with and keep their mean.
+
+Run with: python -m pytest test_traits.py
+"""
+import numpy as np
+import pytest
+
+import traits
+
+
+@pytest.mark.parametrize('kind, spread', [('uniform', -0.1), ('normal', -1.0), ('lognormal', -0.5), ('gamma', -2.0),
+                                          ('gamma', 0.0)])
+def test_invalid_spread(kind: str, spread: float) -> None:
+    with pytest.raises(ValueError, match='spread'):
+        traits.Distribution(kind, 1.0, spread)
+
+
+@pytest.mark.parametrize('kind, spread', [('constant', 0.0), ('uniform', 0.0), ('uniform', 0.5), ('normal', 0.2),
+                                          ('lognormal', 0.5), ('gamma', 2.0)])
+def test_mean(kind: str, spread: float) -> None:
+    values = traits.Distribution(kind, 1.5, spread).draw(np.random.default_rng(0), 100000)
+    assert values.dtype == np.float32 and (values >= 0).all()
+    assert values.mean() == pytest.approx(1.5, rel=0.02)
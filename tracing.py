@@ -0,0 +1,193 @@
+"""
+Module for tracing and quarantining the contacts of detected infections.
+
+Every person has a ring buffer of their most recent close contacts, stored for the whole population in two fixed size
+arrays, so memory stays bounded however long the simulation runs. The buffers are fed with the pairs found by the
+contact detector every tick, a contact already in the buffer only has its time refreshed.
+
+A newly infected person is detected with some probability after a delay. A detected case is quarantined together
+with their contacts within a lookback window, and the contacts of those contacts up to a number of hops. The contacts
+of a case are traced even if it was already quarantined as someone else's contact, and its quarantine starts over.
+Quarantined people make no contacts until they are released. The pending detections and releases are kept in buckets
+by tick, so the work done in a tick is proportional to the contacts and detections of that tick, not to the population
+size.
+
+Classes:
+    ContactHistory: Ring buffers of the most recent contacts of every person.
+    ContactTracer: Detect infections, trace their contacts and quarantine them.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class ContactHistory:
+    """
+    Ring buffers of the most recent contacts of every person.
+    Row i of contacts and times holds the contacts of person i and the last tick they were in contact, -1 marks an
+    empty slot, head[i] is the slot the next new contact of person i is written to.
+
+    Instance attributes:
+    - capacity: int, number of contacts kept per person
+    - contacts: np.ndarray, (num_persons, capacity) indices of the contacts
+    - times: np.ndarray, (num_persons, capacity) tick each contact was last seen
+    - head: np.ndarray, next slot of every person
+
+    Representation Invariants:
+    - self.capacity > 0
+    - self.contacts.shape == self.times.shape == (len(self.head), self.capacity)
+    """
+    capacity: int
+    contacts: np.ndarray
+    times: np.ndarray
+    head: np.ndarray
+
+    def __init__(self, num_persons: int, capacity: int = 8) -> None:
+        self.capacity = capacity
+        self.contacts = np.full((num_persons, capacity), -1, dtype=np.int32)
+        self.times = np.full((num_persons, capacity), -1, dtype=np.int32)
+        self.head = np.zeros(num_persons, dtype=np.int32)
+
+    def record(self, tick: int, a: np.ndarray, b: np.ndarray) -> None:
+        """
+        Record that the pairs a[k], b[k] were in contact at tick, for both people of every pair.
+        If a person has more new contacts in one tick than the capacity, the last ones are kept.
+        """
+        owners = np.concatenate((a, b))
+        others = np.concatenate((b, a)).astype(np.int32)
+        if not len(owners):
+            return
+
+        # Refresh the time of contacts already in the buffer
+        match = self.contacts[owners] == others[:, None]
+        known = match.any(axis=1)
+        self.times[owners[known], match[known].argmax(axis=1)] = tick
+        owners, others = owners[~known], others[~known]
+        if not len(owners):
+            return
+
+        # Write the new ones after each other from the head of their owner's buffer
+        order = np.argsort(owners, kind='stable')
+        owners, others = owners[order], others[order]
+        starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+        sizes = np.diff(np.append(starts, len(owners)))
+        rank = np.arange(len(owners)) - np.repeat(starts, sizes)
+        keep = rank >= np.repeat(sizes, sizes) - self.capacity
+        slots = (self.head[owners] + rank) % self.capacity
+        self.contacts[owners[keep], slots[keep]] = others[keep]
+        self.times[owners[keep], slots[keep]] = tick
+        first = owners[starts]
+        self.head[first] = (self.head[first] + sizes) % self.capacity
+
+    def recent(self, people: np.ndarray, since: int) -> np.ndarray:
+        """Return the contacts of people seen at or after tick since, without duplicates."""
+        contacts = self.contacts[people]
+        return np.unique(contacts[(self.times[people] >= since) & (contacts >= 0)])
+
+
+class ContactTracer:
+    """
+    Detect new infections, trace their contacts and quarantine them.
+
+    Instance attributes:
+    - history: ContactHistory fed with the contacts of every tick
+    - detection_probability: float, chance that a newly infected person is detected
+    - detection_delay: int, extra ticks between an infection and its detection
+    - hops: int, how many steps of contacts of contacts are traced from a detected case
+    - lookback: int, how many ticks back contacts are traced
+    - quarantine_time: int, ticks a quarantine lasts
+    - quarantined: np.ndarray, True for every person in quarantine
+    - enabled: bool, new infections are only detected while enabled, quarantines always end
+
+    Representation Invariants:
+    - 0 <= self.detection_probability <= 1
+    - self.hops >= 0
+    - self.lookback >= 0
+    """
+    history: ContactHistory
+    detection_probability: float
+    detection_delay: int
+    hops: int
+    lookback: int
+    quarantine_time: int
+    quarantined: np.ndarray
+    enabled: bool
+    _rng: np.random.Generator
+    _detections: dict[int, list[np.ndarray]]
+    _releases: dict[int, list[np.ndarray]]
+    _release_tick: np.ndarray
+
+    def __init__(self, num_persons: int, detection_probability: float = 0.5, detection_delay: int = 0,
+                 hops: int = 1, lookback: int = 100, quarantine_time: int = 100, capacity: int = 8,
+                 rng: Optional[np.random.Generator] = None) -> None:
+        self.history = ContactHistory(num_persons, capacity)
+        self.detection_probability = detection_probability
+        self.detection_delay = detection_delay
+        self.hops = hops
+        self.lookback = lookback
+        self.quarantine_time = quarantine_time
+        self.quarantined = np.zeros(num_persons, dtype=bool)
+        self.enabled = True
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._detections = {}
+        self._releases = {}
+        # Tick the current quarantine of every person ends, a bucket entry for another tick is from an earlier one
+        self._release_tick = np.full(num_persons, -1, dtype=np.int64)
+
+    def record(self, tick: int, a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Drop the pairs with a quarantined person and record the others in the history.
+        :param a, b: Pairs found by the contact detector
+        :return: the pairs not in quarantine, to spread the infection over
+        """
+        free = ~(self.quarantined[a] | self.quarantined[b])
+        a, b = a[free], b[free]
+        self.history.record(tick, a, b)
+        return a, b
+
+    def infected(self, tick: int, newly_infected: np.ndarray) -> None:
+        """
+        Decide which of the people infected at tick will be detected, they are at the start of the tick after it plus
+        detection_delay.
+        """
+        if not self.enabled or not len(newly_infected):
+            return
+        detected = newly_infected[self._rng.random(len(newly_infected)) < self.detection_probability]
+        if len(detected):
+            self._detections.setdefault(tick + 1 + self.detection_delay, []).append(detected)
+
+    def update(self, tick: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Release the quarantines ending at tick, then quarantine the cases detected at tick and their traced contacts.
+        Every case is traced and its quarantine starts over, of their contacts only the ones not in quarantine yet are
+        quarantined and traced further. Called at the start of every tick, before the contacts are recorded.
+        :return: the people put in quarantine, the cases first, and the people released
+        """
+        released = self._pop(self._releases, tick)
+        released = released[self._release_tick[released] == tick]
+        self.quarantined[released] = False
+        cases = np.unique(self._pop(self._detections, tick))
+        if not len(cases):
+            return cases, released
+
+        since = tick - self.lookback
+        frontier = cases
+        self.quarantined[frontier] = True
+        found = [frontier]
+        for _ in range(self.hops):
+            contacts = self.history.recent(frontier, since)
+            frontier = contacts[~self.quarantined[contacts]]
+            self.quarantined[frontier] = True
+            found.append(frontier)
+
+        quarantined = np.concatenate(found)
+        end = tick + max(self.quarantine_time, 1)
+        self._release_tick[quarantined] = end
+        self._releases.setdefault(end, []).append(quarantined)
+        return quarantined, released
+
+    @staticmethod
+    def _pop(buckets: dict[int, list[np.ndarray]], tick: int) -> np.ndarray:
+        """Remove and return the people in the bucket of tick."""
+        people = buckets.pop(tick, [])
+        return np.concatenate(people) if people else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,181 @@
+"""
+Module for giving every person of the array engine their own parameters.
+
+Instead of one infection probability, recovery time and speed range for everyone, every person gets an age group,
+a susceptibility, an infectiousness, a recovery time and a mobility. They are sampled for the whole population at once
+and stored as uint8 and float32 columns of the engine.Population, next to the infection_probability that preventions
+change, so a heterogeneous population costs 17 bytes per person and no Python objects. The kernels use them as plain
+array lookups: a contact between an infected person i and a susceptible person j infects j with probability
+infection_probability[i] * infectiousness[i] * susceptibility[j].
+
+Every trait is the factor of the age group of the person times a draw from a Distribution. The age groups follow
+AGE_DISTRIBUTION, or the continent of a country of the data file (see Heterogeneity.from_country), as the data file
+has no age structure of its own.
+
+Classes:
+    Distribution: A distribution traits are drawn from.
+    Heterogeneity: How the traits of a population are sampled.
+
+Functions:
+    country_infection_probability: The infection probability of a person in a country of the data file.
+
+Constants:
+    AGE_GROUPS: Names of the age groups.
+    AGE_DISTRIBUTION: Share of the world population in every age group.
+    CONTINENT_AGE_DISTRIBUTIONS: Share of the population in every age group of each continent of the data file.
+    AGE_SUSCEPTIBILITY, AGE_RECOVERY, AGE_MOBILITY: Factor of every age group on the susceptibility, recovery time
+                                                    and mobility.
+"""
+from typing import Optional
+
+import numpy as np
+
+AGE_GROUPS = ('0-19', '20-39', '40-59', '60-79', '80+')
+AGE_DISTRIBUTION = (0.33, 0.31, 0.23, 0.11, 0.02)  # Approximate world population shares
+CONTINENT_AGE_DISTRIBUTIONS = {
+    'Africa': (0.51, 0.30, 0.14, 0.045, 0.005),
+    'Asia': (0.31, 0.31, 0.25, 0.11, 0.02),
+    'Europe': (0.20, 0.25, 0.28, 0.21, 0.06),
+    'North America': (0.25, 0.27, 0.26, 0.18, 0.04),
+    'South America': (0.31, 0.32, 0.23, 0.12, 0.02),
+    'Australia/Oceania': (0.28, 0.29, 0.24, 0.15, 0.04),
+}
+# Assumed factors: the young are less susceptible, the old recover slower and move less
+AGE_SUSCEPTIBILITY = (0.6, 1.0, 1.0, 1.1, 1.2)
+AGE_RECOVERY = (0.8, 1.0, 1.1, 1.3, 1.5)
+AGE_MOBILITY = (1.0, 1.0, 0.9, 0.7, 0.5)
+
+
+class Distribution:
+    """
+    A distribution of positive factors, drawn in bulk as float32.
+
+    Instance attributes:
+    - kind: str, 'constant', 'uniform', 'normal', 'lognormal' or 'gamma'
+    - mean: float, mean of the distribution, the value of a constant one
+    - spread: float, half the width of the uniform distribution, standard deviation of the normal one, sigma of the
+              lognormal one or shape of the gamma one
+
+    Representation Invariants:
+    - self.kind in ('constant', 'uniform', 'normal', 'lognormal', 'gamma')
+    - self.mean >= 0
+    - self.spread >= 0, and self.spread > 0 if self.kind == 'gamma'
+    """
+    kind: str
+    mean: float
+    spread: float
+
+    def __init__(self, kind: str = 'constant', mean: float = 1.0, spread: float = 0.0) -> None:
+        if kind not in ('constant', 'uniform', 'normal', 'lognormal', 'gamma'):
+            raise ValueError(f'Unknown distribution {kind!r}')
+        if spread < 0:
+            raise ValueError(f'The spread of a distribution can not be negative, got {spread}')
+        if kind == 'gamma' and spread == 0:
+            raise ValueError('A gamma distribution needs a positive spread, its shape')
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+
+    def draw(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Draw size values at once, negative draws are clipped to 0. A constant uses no random numbers."""
+        if self.kind == 'constant':
+            values = np.full(size, self.mean)
+        elif self.kind == 'uniform':
+            values = rng.uniform(self.mean - self.spread, self.mean + self.spread, size)
+        elif self.kind == 'normal':
+            values = rng.normal(self.mean, self.spread, size)
+        elif self.kind == 'lognormal':
+            # mu chosen so the mean stays self.mean
+            values = rng.lognormal(np.log(self.mean) - self.spread ** 2 / 2, self.spread, size) if self.mean > 0 \
+                else np.zeros(size)
+        else:
+            values = rng.gamma(self.spread, self.mean / self.spread, size)
+        return np.maximum(values, 0).astype(np.float32)
+
+    def __repr__(self) -> str:
+        return f'Distribution({self.kind!r}, {self.mean}, {self.spread})'
+
+
+class Heterogeneity:
+    """
+    How the traits of a population are sampled. Each distribution is a factor with mean 1 by default, multiplied with
+    the factor of the age group and the base value given to sample.
+
+    Instance attributes:
+    - age_distribution: tuple, share of the population in every age group of AGE_GROUPS
+    - susceptibility: Distribution of the susceptibility factor
+    - infectiousness: Distribution of the factor on the infection probability
+    - recovery: Distribution of the factor on the recovery time
+    - mobility: Distribution of the factor on the speed
+    - by_age: bool, if the AGE_ factors are applied
+
+    Representation Invariants:
+    - len(self.age_distribution) == len(AGE_GROUPS)
+    """
+    age_distribution: tuple[float, ...]
+    susceptibility: Distribution
+    infectiousness: Distribution
+    recovery: Distribution
+    mobility: Distribution
+    by_age: bool
+
+    def __init__(self, age_distribution: tuple[float, ...] = AGE_DISTRIBUTION,
+                 susceptibility: Optional[Distribution] = None, infectiousness: Optional[Distribution] = None,
+                 recovery: Optional[Distribution] = None, mobility: Optional[Distribution] = None,
+                 by_age: bool = True) -> None:
+        if len(age_distribution) != len(AGE_GROUPS):
+            raise ValueError(f'An age distribution needs a share for each of the age groups {AGE_GROUPS}')
+        self.age_distribution = tuple(age_distribution)
+        self.susceptibility = susceptibility or Distribution()
+        self.infectiousness = infectiousness or Distribution()
+        self.recovery = recovery or Distribution()
+        self.mobility = mobility or Distribution()
+        self.by_age = by_age
+
+    @classmethod
+    def from_country(cls, country: str, **distributions: Distribution) -> 'Heterogeneity':
+        """
+        Use the age distribution of the continent of a country of the data file.
+        :param distributions: The other arguments of Heterogeneity
+        """
+        import getting_data
+
+        rows = getting_data.df[getting_data.df['Country/Region'] == country]
+        if rows.empty:
+            raise ValueError(f'Unknown country {country!r}')
+        continent = rows['Continent'].iloc[0]
+        return cls(CONTINENT_AGE_DISTRIBUTIONS.get(continent, AGE_DISTRIBUTION), **distributions)
+
+    def sample(self, num_persons: int, rng: np.random.Generator, recovery_time: float) -> dict[str, np.ndarray]:
+        """
+        Sample the traits of num_persons people at once.
+        :param recovery_time: Base ticks a person stays infected
+        :return: dict with the age_group, susceptibility, infectiousness, recovery_time and mobility columns
+        """
+        shares = np.asarray(self.age_distribution, dtype=np.float64)
+        age_group = rng.choice(len(AGE_GROUPS), size=num_persons, p=shares / shares.sum()).astype(np.uint8)
+
+        def by_age(factors: tuple[float, ...]) -> np.ndarray:
+            return np.asarray(factors, dtype=np.float32)[age_group] if self.by_age \
+                else np.ones(num_persons, dtype=np.float32)
+
+        return {
+            'age_group': age_group,
+            'susceptibility': by_age(AGE_SUSCEPTIBILITY) * self.susceptibility.draw(rng, num_persons),
+            'infectiousness': self.infectiousness.draw(rng, num_persons),
+            'recovery_time': np.float32(recovery_time) * by_age(AGE_RECOVERY) * self.recovery.draw(rng, num_persons),
+            'mobility': by_age(AGE_MOBILITY) * self.mobility.draw(rng, num_persons),
+        }
+
+
+def country_infection_probability(country: str) -> float:
+    """
+    The infection probability of a person in a country of the data file, its share of cases times 10 like the
+    global one of logic.Person.
+    """
+    import getting_data
+
+    rows = getting_data.df[getting_data.df['Country/Region'] == country]
+    if rows.empty:
+        raise ValueError(f'Unknown country {country!r}')
+    return float(rows['Infection Rate'].iloc[0]) * 10